@@ -0,0 +1,122 @@
+import json
+import os
+import random
+import struct
+from datetime import datetime, timedelta
+
+# share of every kind of file in a corpus
+KINDS = (
+    ('jpeg', 50),  # JPEG with the dates in its Exif segment
+    ('mp4', 10),  # MP4 with the dates in the mvhd, tkhd and mdhd boxes
+    ('named', 15),  # JPEG without Exif, the date is only in the file name
+    ('duplicate', 10),  # same content as an earlier file under another name
+    ('unknown', 15),  # text and PDF files
+)
+FIRST_DATE = datetime(2000, 1, 1)
+DATE_RANGE = 20 * 365 * 24 * 3600
+QUICKTIME_EPOCH = datetime(1904, 1, 1)
+# contents kept for the duplicates
+RECENT_FILES = 256
+
+
+def box(type: bytes, payload: bytes = b'') -> bytes:
+    return struct.pack('>L4s', len(payload) + 8, type) + payload
+
+
+def tiff(date: str) -> bytes:
+    """
+    Little endian TIFF with DateTimeOriginal and CreateDate in the Exif IFD
+    """
+    value = date.encode('ascii') + b'\x00'
+    exif_offset = 8 + 2 + 12 + 4
+    data_offset = exif_offset + 2 + 2 * 12 + 4
+    ifd0 = struct.pack('<H', 1) + struct.pack('<HHLL', 0x8769, 4, 1, exif_offset) + struct.pack('<L', 0)
+    exif = struct.pack('<H', 2) \
+        + struct.pack('<HHLL', 0x9003, 2, len(value), data_offset) \
+        + struct.pack('<HHLL', 0x9004, 2, len(value), data_offset + len(value)) \
+        + struct.pack('<L', 0)
+    return b'II*\x00' + struct.pack('<L', 8) + ifd0 + exif + value + value
+
+
+def jpeg(date: (str, None), payload: bytes) -> bytes:
+    data = b'\xff\xd8' + b'\xff\xe0' + struct.pack('>H', 16) + b'JFIF\x00\x01\x01\x00\x00\x01\x00\x01\x00\x00'
+    if date is not None:
+        segment = b'Exif\x00\x00' + tiff(date)
+        data += b'\xff\xe1' + struct.pack('>H', len(segment) + 2) + segment
+    return data + b'\xff\xda' + struct.pack('>H', 2) + payload.replace(b'\xff', b'\x00') + b'\xff\xd9'
+
+
+def mp4(date: datetime, payload: bytes) -> bytes:
+    seconds = int((date - QUICKTIME_EPOCH).total_seconds())
+
+    def header(type):
+        return box(type, struct.pack('>B3xLL', 0, seconds, seconds) + b'\x00' * 12)
+
+    track = box(b'trak', header(b'tkhd') + box(b'mdia', header(b'mdhd')))
+    return box(b'ftyp', b'isom\x00\x00\x02\x00isom') + box(b'mdat', payload) + box(b'moov', header(b'mvhd') + track)
+
+
+def generate(path: str, files: int, seed: int = 0, files_per_dir: int = 500, payload_size: int = 4096) -> dict:
+    """
+    Write a reproducible photo library of `files` files below `path`: the same arguments
+    always give the same names and contents. Returns the manifest with the count and size of every kind
+    """
+    rng = random.Random(seed)
+    kinds = [kind for kind, share in KINDS for _ in range(share)]
+    manifest = {'files': files, 'seed': seed, 'payload_size': payload_size, 'bytes': 0,
+                'kinds': dict((kind, 0) for kind, share in KINDS)}
+    recent = []
+    directory = None
+    for index in range(files):
+        if index % files_per_dir == 0:
+            directory = os.path.join(path, 'dir%05d' % (index // files_per_dir))
+            os.makedirs(directory, exist_ok=True)
+        kind = rng.choice(kinds)
+        if kind == 'duplicate' and not recent:
+            kind = 'jpeg'
+        date = FIRST_DATE + timedelta(seconds=rng.randrange(DATE_RANGE))
+        payload = rng.getrandbits(8 * payload_size).to_bytes(payload_size, 'little') \
+            [:rng.randint(payload_size // 4, payload_size)]
+        if kind == 'jpeg':
+            name = 'DSC%07d.jpg' % index
+            content = jpeg(date.strftime('%Y:%m:%d %H:%M:%S'), payload)
+        elif kind == 'mp4':
+            name = 'MOV%07d.mp4' % index
+            content = mp4(date, payload)
+        elif kind == 'named':
+            name = 'IMG_%s_%07d.jpg' % (date.strftime('%Y%m%d_%H%M%S'), index)
+            content = jpeg(None, payload)
+        elif kind == 'duplicate':
+            extension, content = rng.choice(recent)
+            name = 'copy%07d%s' % (index, extension)
+        elif rng.random() < 0.5:
+            name = 'notes%07d.txt' % index
+            content = payload.hex().encode('ascii')
+        else:
+            name = 'document%07d.pdf' % index
+            content = b'%PDF-1.4\n' + payload
+        with open(os.path.join(directory, name), 'wb') as file:
+            file.write(content)
+        if kind in ('jpeg', 'mp4'):
+            recent.append((os.path.splitext(name)[1], content))
+            if len(recent) > RECENT_FILES:
+                recent.pop(rng.randrange(len(recent)))
+        manifest['kinds'][kind] += 1
+        manifest['bytes'] += len(content)
+    return manifest
+
+
+def ensure(workdir: str, files: int, seed: int = 0, payload_size: int = 4096) -> (str, dict):
+    """
+    Generate the corpus once per scale and seed and reuse it in later runs,
+    the manifest is stored next to the corpus so it is not part of the input
+    """
+    path = os.path.join(workdir, 'corpus-%d-%d-%d' % (files, seed, payload_size))
+    manifest_path = path + '.json'
+    if os.path.isfile(manifest_path):
+        with open(manifest_path) as file:
+            return path, json.load(file)
+    manifest = generate(path, files, seed, payload_size=payload_size)
+    with open(manifest_path, 'w') as file:
+        json.dump(manifest, file, indent=2)
+    return path, manifest
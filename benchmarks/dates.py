@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark of the exif date parser against the strptime based one it replaced.
+
+    python -m benchmarks.dates --number 100000
+
+Prints the time per parsed date in nanoseconds for each kind of date string.
+"""
+import argparse
+import re
+import timeit
+from datetime import datetime
+
+from src.date import Date
+
+DATES = (
+    ('plain', '2017:01:01 01:01:01'),
+    ('subseconds', '2017:01:01 01:01:01.123'),
+    ('offset', '2017:01:01 01:01:01+02:00'),
+    ('subseconds offset', '2017:01:01 01:01:01.123+02:00'),
+    ('dashes', '2017-01-01 01:01:01'),
+)
+
+
+def legacy_from_datestring(datestr):
+    """
+    The parser before the fixed layout fast path, kept to compare against
+    """
+    isexif = True
+    datestr = datestr.split('.')
+    date = datestr[0]
+    if len(datestr) > 1:
+        subseconds = datestr[1]
+    else:
+        subseconds = ''
+    search = r'(.*)([+-]\d{2}:\d{2})'
+    if re.search(search, date) is not None:
+        date = re.sub(search, r'\1', date)
+    try:
+        parsed_date_time = datetime.strptime(date, "%Y:%m:%d %H:%M:%S")
+    except ValueError:
+        try:
+            parsed_date_time = datetime.strptime(date, "%Y-%m-%d %H:%M:%S")
+        except ValueError:
+            parsed_date_time = None
+            isexif = False
+    return {
+        'date': parsed_date_time,
+        'subseconds': subseconds,
+        'isexif': isexif,
+    }
+
+
+def measure(function, number: int) -> float:
+    """
+    Nanoseconds per call of the best of three runs
+    """
+    return min(timeit.repeat(function, number=number, repeat=3)) / number * 1e9
+
+
+def run(number: int = 100000) -> list:
+    date = Date()
+    results = []
+    for name, datestr in DATES:
+        results.append({
+            'date': name,
+            'legacy_ns': measure(lambda: legacy_from_datestring(datestr), number),
+            'fast_ns': measure(lambda: date.from_datestring(datestr), number),
+        })
+    # a chunk of one camera: many files share few distinct dates
+    exifs = [{'CreateDate': '2017:01:01 01:01:%02d' % (index % 60)} for index in range(1000)]
+    chunks = max(1, number // len(exifs))
+    results.append({
+        'date': 'chunk of 1000',
+        'legacy_ns': measure(lambda: [legacy_from_datestring(exif['CreateDate']) for exif in exifs], chunks)
+        / len(exifs),
+        'fast_ns': measure(lambda: Date.from_exif_many(exifs), chunks) / len(exifs),
+    })
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--number', type=int, default=100000, help='dates parsed per measurement')
+    options = parser.parse_args()
+    print('%-20s %12s %12s %8s' % ('date', 'legacy ns', 'fast ns', 'speedup'))
+    for result in run(options.number):
+        print('%-20s %12.0f %12.0f %7.1fx' % (result['date'], result['legacy_ns'], result['fast_ns'],
+                                             result['legacy_ns'] / result['fast_ns']))
+
+
+if __name__ == '__main__':
+    main()
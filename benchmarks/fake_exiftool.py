@@ -0,0 +1,51 @@
+import mimetypes
+import os
+import threading
+
+from src.exif_reader import file_dates
+
+
+class FakeExifTool(object):
+    """
+    Metadata backend with the interface of ExifToolPool which never starts exiftool.
+    Reads answer with the mime type guessed from the extension and the dates of the file system,
+    so files without native metadata are dated by their name or timestamp;
+    writes are acknowledged without touching the file.
+    Meant for planning-only runs on corpora too large to pass through exiftool
+    """
+
+    def __init__(self, size=1):
+        self.size = size
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def execute(self, *args) -> (str, str):
+        return self.execute_many([args])[0]
+
+    def execute_many(self, commands: list) -> list:
+        with self._lock:
+            self.calls += len(commands)
+        return [('    1 image files updated\n', '') if '-overwrite_original' in args else ('', '')
+                for args in commands]
+
+    def execute_json(self, *args) -> list:
+        with self._lock:
+            self.calls += 1
+        items = []
+        for file in args:
+            if file.startswith('-'):
+                continue
+            try:
+                stat = os.stat(file)
+            except OSError:
+                continue
+            item = {'SourceFile': file}
+            item.update(file_dates(stat))
+            mime_type = mimetypes.guess_type(file)[0]
+            if mime_type is not None:
+                item['MIMEType'] = mime_type
+            items.append(item)
+        return items
+
+    def close(self):
+        pass
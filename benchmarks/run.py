@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+"""
+Run phockup end to end on a synthetic photo library and record its throughput as JSON.
+
+    python -m benchmarks.run --files 10000 --modes copy,move,link,dry-run --output results.json
+    python -m benchmarks.run --files 10000 --compare results.json
+
+Every mode runs in its own process on a fresh hard linked copy of the corpus,
+so the peak RSS and the input of one mode are not influenced by the others.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import shutil
+import sys
+import time
+
+from benchmarks import corpus
+from benchmarks.fake_exiftool import FakeExifTool
+from src.phockup import Phockup
+
+MODES = ('copy', 'move', 'link', 'dry-run')
+MODE_ARGS = {
+    'copy': {},
+    'move': {'move': True},
+    'link': {'link': True},
+    'dry-run': {'dry_run': True},
+}
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+
+def peak_rss() -> (int, None):
+    if resource is None:
+        return None
+    usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return usage if sys.platform == 'darwin' else usage * 1024
+
+
+def run_mode(corpus_path: str, manifest: dict, workdir: str, mode: str, options: dict) -> dict:
+    run_path = os.path.join(workdir, mode)
+    shutil.rmtree(run_path, ignore_errors=True)
+    input_path = os.path.join(run_path, 'input')
+    output_path = os.path.join(run_path, 'output')
+    shutil.copytree(corpus_path, input_path, copy_function=os.link)
+
+    args = dict(MODE_ARGS[mode])
+    args.update(images_output_path=os.path.join(output_path, 'images'),
+                videos_output_path=os.path.join(output_path, 'videos'),
+                unknown_output_path=os.path.join(output_path, 'unknown'),
+                workers=options['workers'],
+                prefetch_size=options['prefetch'],
+                copy_engine=options['copy_engine'],
+                dedup_input=options['dedup_input'])
+    if options['backend'] == 'fake':
+        args['exiftool'] = FakeExifTool(size=options['workers'])
+
+    # one log line per file would measure the terminal
+    stdout = sys.stdout
+    sys.stdout = open(os.devnull, 'w')
+    start = time.perf_counter()
+    try:
+        phockup = Phockup(input_path, **args)
+    except SystemExit:
+        phockup = None
+    finally:
+        seconds = time.perf_counter() - start
+        sys.stdout.close()
+        sys.stdout = stdout
+    if not options['keep']:
+        shutil.rmtree(run_path, ignore_errors=True)
+    if phockup is None:
+        return {'mode': mode, 'error': 'phockup failed'}
+
+    return {
+        'mode': mode,
+        'seconds': round(seconds, 3),
+        'files': phockup.counter_all_files,
+        'bytes': manifest['bytes'],
+        'files_per_second': round(phockup.counter_all_files / seconds, 1) if seconds else None,
+        'bytes_per_second': round(manifest['bytes'] / seconds) if seconds else None,
+        'peak_rss_bytes': peak_rss(),
+        'stages': dict((stage, dict((key, values[key]) for key in ('count', 'seconds', 'share', 'bytes', 'p50', 'p99')))
+                       for stage, values in phockup.metrics.report()['stages'].items()),
+        'counters': phockup.counters(),
+    }
+
+
+def compare(results: dict, previous: dict):
+    before = dict((run['mode'], run) for run in previous.get('runs', ()))
+    for run in results['runs']:
+        old = before.get(run['mode'])
+        if old is None or not old.get('files_per_second') or not run.get('files_per_second'):
+            continue
+        print('%-8s %10.1f files/s (was %.1f, %+.1f%%)' % (
+            run['mode'], run['files_per_second'], old['files_per_second'],
+            100.0 * (run['files_per_second'] / old['files_per_second'] - 1)))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark phockup on a synthetic photo library')
+    parser.add_argument('--files', type=int, default=10000, help='number of files in the corpus')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the corpus generator')
+    parser.add_argument('--payload-size', type=int, default=4096, help='largest payload of a file in bytes')
+    parser.add_argument('--modes', default=','.join(MODES), help='comma separated modes: %s' % ', '.join(MODES))
+    parser.add_argument('--backend', choices=('fake', 'exiftool'), default='fake',
+                        help='metadata backend for the files the built-in reader can not date')
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--prefetch', type=int, default=100)
+    parser.add_argument('--copy-engine', default='auto')
+    parser.add_argument('--dedup-input', action='store_true')
+    parser.add_argument('--workdir', default=os.path.join('benchmarks', 'work'),
+                        help='directory of the corpora and the runs')
+    parser.add_argument('--keep', action='store_true', help='keep the input and output of the runs')
+    parser.add_argument('--output', help='write the results to this JSON file')
+    parser.add_argument('--compare', help='compare the files/s with an earlier JSON result')
+    options = parser.parse_args(argv)
+
+    modes = [mode for mode in options.modes.split(',') if mode]
+    for mode in modes:
+        if mode not in MODES:
+            parser.error('unknown mode: %s' % mode)
+
+    os.makedirs(options.workdir, exist_ok=True)
+    start = time.perf_counter()
+    corpus_path, manifest = corpus.ensure(options.workdir, options.files, options.seed, options.payload_size)
+    run_options = {
+        'backend': options.backend,
+        'workers': options.workers,
+        'prefetch': options.prefetch,
+        'copy_engine': options.copy_engine,
+        'dedup_input': options.dedup_input,
+        'keep': options.keep,
+    }
+    results = {
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'options': run_options,
+        'corpus': manifest,
+        'corpus_seconds': round(time.perf_counter() - start, 3),
+        'runs': [],
+    }
+
+    context = multiprocessing.get_context('spawn')
+    for mode in modes:
+        with context.Pool(1) as pool:
+            run = pool.apply(run_mode, (corpus_path, manifest, options.workdir, mode, run_options))
+        results['runs'].append(run)
+        print('%-8s %s' % (mode, json.dumps(run)))
+
+    if options.output:
+        with open(options.output, 'w') as file:
+            json.dump(results, file, indent=2)
+    if options.compare:
+        with open(options.compare) as file:
+            compare(results, json.load(file))
+    return results
+
+
+if __name__ == '__main__':
+    main()
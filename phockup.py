@@ -4,11 +4,13 @@ import os
 import re
 import sys
 
+from src.copy_engine import ENGINES as COPY_ENGINES
 from src.date import Date
 from src.dependency import check_dependencies
 from src.help import help
 from src.phockup import Phockup
 from src.printer import Printer
+from src.throttle import IONICE_CLASSES, parse_rate
 
 version = '1.7.2-relict'
 printer = Printer()
@@ -30,6 +32,33 @@ def main(argv):
     timestamp = False
     date_field = None
     dry_run = False
+    exiftool_sessions = None
+    workers = 1
+    cache = True
+    rebuild_cache = False
+    cache_path = None
+    content_index = False
+    rebuild_content_index = False
+    native = True
+    prefetch_size = 100
+    copy_engine = 'auto'
+    dedup_input = False
+    report_path = None
+    prometheus_path = None
+    verbose = False
+    progress = True
+    journal_path = None
+    resume = False
+    plan_path = None
+    apply_path = None
+    bytes_per_second = 0
+    files_per_second = 0
+    throttle_file = None
+    nice = None
+    ionice = None
+    watch = False
+    watch_settle = 2.0
+    watch_poll = None
 
     try:
         opts, args = getopt.getopt(argv[1:], "d:r:f:mltoyh",
@@ -46,7 +75,34 @@ def main(argv):
                                     "images-output=",
                                     "videos-output=",
                                     "unknown-output=",
-                                    "output-name="])
+                                    "output-name=",
+                                    "exiftool-sessions=",
+                                    "prefetch=",
+                                    "workers=",
+                                    "no-cache",
+                                    "rebuild-cache",
+                                    "cache-file=",
+                                    "content-index",
+                                    "rebuild-content-index",
+                                    "exiftool-only",
+                                    "copy-engine=",
+                                    "dedup-input",
+                                    "report=",
+                                    "prometheus=",
+                                    "verbose",
+                                    "no-progress",
+                                    "journal=",
+                                    "resume=",
+                                    "plan-out=",
+                                    "apply=",
+                                    "limit-bytes=",
+                                    "limit-files=",
+                                    "throttle-file=",
+                                    "nice=",
+                                    "ionice=",
+                                    "watch",
+                                    "watch-settle=",
+                                    "watch-poll="])
     except getopt.GetoptError as error:
         printer.line(error.msg)
         help(version)
@@ -109,6 +165,146 @@ def main(argv):
                 printer.error("Date field cannot be empty")
             date_field = arg
 
+        if opt in ("--exiftool-sessions",):
+            try:
+                exiftool_sessions = int(arg)
+            except ValueError:
+                printer.error("Number of exiftool sessions must be an integer")
+            if exiftool_sessions < 1:
+                printer.error("Number of exiftool sessions must be at least 1")
+
+        if opt in ("--prefetch",):
+            try:
+                prefetch_size = int(arg)
+            except ValueError:
+                printer.error("Prefetch size must be an integer")
+
+        if opt in ("--workers",):
+            try:
+                workers = int(arg)
+            except ValueError:
+                printer.error("Number of workers must be an integer")
+            if workers < 1:
+                printer.error("Number of workers must be at least 1")
+
+        if opt in ("--no-cache",):
+            cache = False
+
+        if opt in ("--rebuild-cache",):
+            rebuild_cache = True
+
+        if opt in ("--cache-file",):
+            if not arg:
+                printer.error("Cache file name cannot be empty")
+            cache_path = os.path.expanduser(arg)
+
+        if opt in ("--content-index",):
+            content_index = True
+
+        if opt in ("--rebuild-content-index",):
+            content_index = True
+            rebuild_content_index = True
+
+        if opt in ("--exiftool-only",):
+            native = False
+
+        if opt in ("--copy-engine",):
+            if arg not in COPY_ENGINES:
+                printer.error("Copy engine must be one of: %s" % ', '.join(COPY_ENGINES))
+            copy_engine = arg
+
+        if opt in ("--dedup-input",):
+            dedup_input = True
+
+        if opt in ("--report",):
+            if not arg:
+                printer.error("Report file name cannot be empty")
+            report_path = os.path.expanduser(arg)
+
+        if opt in ("--prometheus",):
+            if not arg:
+                printer.error("Prometheus file name cannot be empty")
+            prometheus_path = os.path.expanduser(arg)
+
+        if opt in ("--verbose",):
+            verbose = True
+
+        if opt in ("--no-progress",):
+            progress = False
+
+        if opt in ("--journal",):
+            if not arg:
+                printer.error("Journal file name cannot be empty")
+            journal_path = os.path.expanduser(arg)
+
+        if opt in ("--resume",):
+            if not arg:
+                printer.error("Journal file name cannot be empty")
+            if not os.path.isfile(os.path.expanduser(arg)):
+                printer.error("Journal file %s does not exist" % arg)
+            journal_path = os.path.expanduser(arg)
+            resume = True
+
+        if opt in ("--plan-out",):
+            if not arg:
+                printer.error("Plan file name cannot be empty")
+            plan_path = os.path.expanduser(arg)
+
+        if opt in ("--apply",):
+            if not arg:
+                printer.error("Plan file name cannot be empty")
+            if not os.path.isfile(os.path.expanduser(arg)):
+                printer.error("Plan file %s does not exist" % arg)
+            apply_path = os.path.expanduser(arg)
+
+        if opt in ("--limit-bytes",):
+            try:
+                bytes_per_second = parse_rate(arg)
+            except ValueError:
+                printer.error("Byte limit must be a number of bytes per second like 500K or 20M")
+
+        if opt in ("--limit-files",):
+            try:
+                files_per_second = parse_rate(arg)
+            except ValueError:
+                printer.error("File limit must be a number of files per second")
+
+        if opt in ("--throttle-file",):
+            if not arg:
+                printer.error("Throttle file name cannot be empty")
+            throttle_file = os.path.expanduser(arg)
+
+        if opt in ("--nice",):
+            try:
+                nice = int(arg)
+            except ValueError:
+                printer.error("Nice value must be a number")
+
+        if opt in ("--ionice",):
+            name, _, level = arg.partition(':')
+            if name not in IONICE_CLASSES or (level and not level.isdigit()):
+                printer.error("I/O priority must be idle, best-effort or realtime with an optional level, "
+                              "e.g. best-effort:7")
+            ionice = arg
+
+        if opt in ("--watch",):
+            watch = True
+
+        if opt in ("--watch-settle",):
+            try:
+                watch_settle = float(arg)
+            except ValueError:
+                printer.error("Watch settle time must be a number of seconds")
+
+        if opt in ("--watch-poll",):
+            try:
+                watch_poll = float(arg)
+            except ValueError:
+                printer.error("Watch poll interval must be a number of seconds")
+            if watch_poll <= 0:
+                printer.error("Watch poll interval must be greater than 0")
+            watch = True
+
 
     if link and move:
         printer.error("Can't use move and link strategy together!")
@@ -131,7 +327,34 @@ def main(argv):
         timestamp=timestamp,
         date_field=date_field,
         dry_run=dry_run,
-        log_file_name=log_file_name
+        log_file_name=log_file_name,
+        exiftool_sessions=exiftool_sessions,
+        prefetch_size=prefetch_size,
+        workers=workers,
+        cache=cache,
+        rebuild_cache=rebuild_cache,
+        cache_path=cache_path,
+        content_index=content_index,
+        rebuild_content_index=rebuild_content_index,
+        native=native,
+        copy_engine=copy_engine,
+        dedup_input=dedup_input,
+        report_path=report_path,
+        prometheus_path=prometheus_path,
+        verbose=verbose,
+        progress=progress,
+        journal_path=journal_path,
+        resume=resume,
+        plan_path=plan_path,
+        apply_path=apply_path,
+        bytes_per_second=bytes_per_second,
+        files_per_second=files_per_second,
+        throttle_file=throttle_file,
+        nice=nice,
+        ionice=ionice,
+        watch=watch,
+        watch_settle=watch_settle,
+        watch_poll=watch_poll
     )
 
 
@@ -0,0 +1,202 @@
+import os
+import struct
+from datetime import datetime, timedelta
+
+from src.exif_reader import UnsupportedFile, file_reader, read_tiff
+
+# exiftool mime types by the major brand of the ftyp box
+BRAND_MIME_TYPES = {
+    b'isom': 'video/mp4',
+    b'iso2': 'video/mp4',
+    b'iso4': 'video/mp4',
+    b'iso5': 'video/mp4',
+    b'iso6': 'video/mp4',
+    b'mp41': 'video/mp4',
+    b'mp42': 'video/mp4',
+    b'avc1': 'video/mp4',
+    b'dash': 'video/mp4',
+    b'MSNV': 'video/mp4',
+    b'M4V ': 'video/x-m4v',
+    b'qt  ': 'video/quicktime',
+    b'3gp4': 'video/3gpp',
+    b'3gp5': 'video/3gpp',
+    b'3gp6': 'video/3gpp',
+    b'3ge6': 'video/3gpp',
+    b'3gg6': 'video/3gpp',
+    b'3g2a': 'video/3gpp2',
+    b'3g2b': 'video/3gpp2',
+    b'3g2c': 'video/3gpp2',
+    b'heic': 'image/heic',
+    b'heix': 'image/heic',
+    b'heim': 'image/heic',
+    b'heis': 'image/heic',
+    b'mif1': 'image/heif',
+    b'msf1': 'image/heif',
+}
+
+QUICKTIME_EPOCH = datetime(1904, 1, 1)
+UNIX_EPOCH_OFFSET = int((datetime(1970, 1, 1) - QUICKTIME_EPOCH).total_seconds())
+ZERO_DATE = '0000:00:00 00:00:00'
+
+# boxes which may carry dates with a higher priority in exiftool (XMP, maker specific data)
+UNSUPPORTED_BOXES = (b'uuid', b'XMP_', b'CNTH', b'CNCV')
+
+
+def read_bmff(file) -> (str, dict):
+    """
+    Walk the boxes of an ISO base media file (MP4, MOV, 3GP, HEIC) by seeking from header to header,
+    so the media data is never read. Returns the mime type and the date tags exiftool would report
+    """
+    size = os.fstat(file.fileno()).st_size
+    read = file_reader(file)
+    boxes = dict(list_boxes(read, 0, size))
+    if b'ftyp' not in boxes:
+        raise UnsupportedFile('no ftyp box')
+    mime_type = BRAND_MIME_TYPES.get(read(boxes[b'ftyp'][0], 4))
+    if mime_type is None:
+        raise UnsupportedFile('unknown brand')
+    if any(box in boxes for box in UNSUPPORTED_BOXES):
+        raise UnsupportedFile('unsupported metadata box')
+
+    if mime_type.startswith('image/'):
+        if b'meta' not in boxes:
+            raise UnsupportedFile('no meta box')
+        return mime_type, read_heif_exif(read, *boxes[b'meta'])
+
+    if b'moov' not in boxes:
+        raise UnsupportedFile('no moov box')
+    return mime_type, read_movie(read, *boxes[b'moov'])
+
+
+def list_boxes(read, offset: int, end: int):
+    """
+    Yield (type, (payload offset, payload end)) of the boxes between offset and end
+    """
+    while offset + 8 <= end:
+        size, type = struct.unpack('>L4s', read(offset, 8))
+        header = 8
+        if size == 1:
+            size = struct.unpack('>Q', read(offset + 8, 8))[0]
+            header = 16
+        elif size == 0:
+            size = end - offset
+        if size < header or offset + size > end:
+            raise UnsupportedFile('broken box')
+        yield type, (offset + header, offset + size)
+        offset += size
+
+
+def read_movie(read, start: int, end: int) -> dict:
+    boxes = dict(list_boxes(read, start, end))
+    if b'mvhd' not in boxes:
+        raise UnsupportedFile('no mvhd box')
+    if b'udta' in boxes and any(type in UNSUPPORTED_BOXES for type, box in list_boxes(read, *boxes[b'udta'])):
+        raise UnsupportedFile('unsupported metadata box')
+    tags = {}
+    tags['CreateDate'], tags['ModifyDate'] = read_header_dates(read, boxes[b'mvhd'][0])
+    if b'trak' in boxes:
+        track = dict(list_boxes(read, *boxes[b'trak']))
+        if b'tkhd' in track:
+            tags['TrackCreateDate'], tags['TrackModifyDate'] = read_header_dates(read, track[b'tkhd'][0])
+        if b'mdia' in track:
+            media = dict(list_boxes(read, *track[b'mdia']))
+            if b'mdhd' in media:
+                tags['MediaCreateDate'], tags['MediaModifyDate'] = read_header_dates(read, media[b'mdhd'][0])
+    return tags
+
+
+def read_header_dates(read, offset: int) -> (str, str):
+    """
+    Creation and modification time of a mvhd, tkhd or mdhd box
+    """
+    version = read(offset, 1)[0]
+    if version == 1:
+        created, modified = struct.unpack('>QQ', read(offset + 4, 16))
+    else:
+        created, modified = struct.unpack('>LL', read(offset + 4, 8))
+    return format_date(created), format_date(modified)
+
+
+def format_date(seconds: int) -> str:
+    if seconds == 0:
+        return ZERO_DATE
+    if seconds < UNIX_EPOCH_OFFSET:
+        # some cameras store unix time, exiftool has its own rules for that
+        raise UnsupportedFile('date before 1970')
+    return (QUICKTIME_EPOCH + timedelta(seconds=seconds)).strftime('%Y:%m:%d %H:%M:%S')
+
+
+def read_heif_exif(read, start: int, end: int) -> dict:
+    """
+    Find the Exif item of a HEIF image through the iinf and iloc boxes and parse its TIFF structure
+    """
+    boxes = dict(list_boxes(read, start + 4, end))
+    if b'iinf' not in boxes or b'iloc' not in boxes:
+        raise UnsupportedFile('no item boxes')
+    exif_items = [item_id for item_id, item_type in read_item_types(read, *boxes[b'iinf'])
+                  if item_type == b'Exif']
+    if not exif_items:
+        raise UnsupportedFile('no exif item')
+    location = read_item_locations(read, *boxes[b'iloc']).get(exif_items[0])
+    if location is None:
+        raise UnsupportedFile('no exif location')
+    tiff_header_offset = struct.unpack('>L', read(location, 4))[0]
+    return read_tiff(read, location + 4 + tiff_header_offset)
+
+
+def read_item_types(read, start: int, end: int):
+    version = read(start, 1)[0]
+    offset = start + (6 if version == 0 else 8)
+    for type, (box_start, box_end) in list_boxes(read, offset, end):
+        if type != b'infe':
+            continue
+        version = read(box_start, 1)[0]
+        if version == 2:
+            item_id, item_type = struct.unpack('>H2x4s', read(box_start + 4, 8))
+        elif version == 3:
+            item_id, item_type = struct.unpack('>L2x4s', read(box_start + 4, 10))
+        else:
+            raise UnsupportedFile('unsupported infe version')
+        if item_type in (b'mime', b'uri '):
+            # XMP and other embedded documents, let exiftool decide
+            raise UnsupportedFile('unsupported item')
+        yield item_id, item_type
+
+
+def read_item_locations(read, start: int, end: int) -> dict:
+    """
+    Returns item id => file offset of items stored in a single extent of the file
+    """
+    version = read(start, 1)[0]
+    sizes = read(start + 4, 2)
+    offset_size, length_size, base_offset_size = sizes[0] >> 4, sizes[0] & 0x0F, sizes[1] >> 4
+    index_size = sizes[1] & 0x0F if version in (1, 2) else 0
+    offset = start + 6
+    if version < 2:
+        count = struct.unpack('>H', read(offset, 2))[0]
+        offset += 2
+    else:
+        count = struct.unpack('>L', read(offset, 4))[0]
+        offset += 4
+
+    def number(size):
+        nonlocal offset
+        value = int.from_bytes(read(offset, size), 'big') if size else 0
+        offset += size
+        return value
+
+    locations = {}
+    for _ in range(count):
+        item_id = number(2 if version < 2 else 4)
+        construction_method = number(2) & 0x0F if version in (1, 2) else 0
+        number(2)  # data reference index
+        base_offset = number(base_offset_size)
+        extents = number(2)
+        extent_offsets = []
+        for _ in range(extents):
+            number(index_size)
+            extent_offsets.append(number(offset_size))
+            number(length_size)
+        if construction_method == 0 and len(extent_offsets) == 1:
+            locations[item_id] = base_offset + extent_offsets[0]
+    return locations
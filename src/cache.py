@@ -0,0 +1,146 @@
+import atexit
+import json
+import os
+import threading
+import time
+
+try:
+    import sqlite3
+except ImportError:  # Python built without sqlite support
+    sqlite3 = None
+
+# increase when the stored metadata changes (e.g. other exiftool tags are requested)
+CACHE_VERSION = 1
+
+
+def default_cache_path() -> str:
+    cache_home = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(cache_home, 'phockup', 'metadata-v%d.sqlite' % CACHE_VERSION)
+
+
+class MetadataCache(object):
+    """
+    Persistent cache of exif data in front of exiftool.
+    Entries are keyed by (device, inode, size, mtime_ns) of the file, so a changed file is read again,
+    and the least recently used entries are evicted when the cache grows over `max_entries`.
+    The number of entries is kept as a running upper bound and only counted again when it passes the limit,
+    eviction then makes room for a tenth of the limit so the table is not counted on every commit
+    """
+
+    def __init__(self, path: (str, None) = None, max_entries=1000000, rebuild=False, commit_every=500):
+        if sqlite3 is None:
+            raise RuntimeError('Python is built without sqlite3 support')
+        self.path = path or default_cache_path()
+        self.max_entries = max_entries
+        self.commit_every = commit_every
+        self.hits = 0
+        self.misses = 0
+        # writes are collected in memory and committed in short batches, so other runs sharing
+        # the cache are never blocked by a long open transaction
+        self._pending_puts = {}
+        self._pending_hits = {}
+        self._lock = threading.Lock()
+        directory = os.path.dirname(self.path)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory, exist_ok=True)
+        self._db = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('PRAGMA synchronous=NORMAL')
+        self._db.execute(
+            'CREATE TABLE IF NOT EXISTS metadata ('
+            'device INTEGER, inode INTEGER, size INTEGER, mtime_ns INTEGER, '
+            'path TEXT, data TEXT, last_used REAL, '
+            'PRIMARY KEY (device, inode, size, mtime_ns))')
+        self._db.execute('CREATE INDEX IF NOT EXISTS metadata_last_used ON metadata (last_used)')
+        if rebuild:
+            self._db.execute('DELETE FROM metadata')
+        self._count = self._db.execute('SELECT COUNT(*) FROM metadata').fetchone()[0]
+        atexit.register(self.flush)
+
+    @staticmethod
+    def key(file_path: str) -> (tuple, None):
+        try:
+            stat = os.stat(file_path)
+        except OSError:
+            return None
+        return stat.st_dev, stat.st_ino, stat.st_size, stat.st_mtime_ns
+
+    def get(self, file_path: str, key: (tuple, None) = None) -> (bool, (dict, None)):
+        """
+        Returns (found, exif data); the cached data may be None for files exiftool could not read
+        """
+        key = key or MetadataCache.key(file_path)
+        if key is None:
+            return False, None
+        with self._lock:
+            if key in self._pending_puts:
+                path, data, last_used = self._pending_puts[key]
+                self._pending_puts[key] = (path, data, time.time())
+                row = (data,)
+            else:
+                try:
+                    row = self._db.execute(
+                        'SELECT data FROM metadata WHERE device=? AND inode=? AND size=? AND mtime_ns=?',
+                        key).fetchone()
+                except sqlite3.Error:
+                    row = None
+                if row is not None:
+                    self._pending_hits[key] = time.time()
+                    self.__written()
+            if row is None:
+                self.misses += 1
+                return False, None
+            self.hits += 1
+        data = json.loads(row[0])
+        if isinstance(data, dict):
+            # the file may have been renamed since it was cached
+            data['SourceFile'] = file_path
+        return True, data
+
+    def put(self, file_path: str, data: (dict, None), key: (tuple, None) = None):
+        key = key or MetadataCache.key(file_path)
+        if key is None:
+            return
+        with self._lock:
+            # the path is only informative, a name which is not valid UTF-8 is stored with replacement characters
+            path = os.fsencode(file_path).decode('utf-8', errors='replace')
+            self._pending_puts[key] = (path, json.dumps(data), time.time())
+            self.__written()
+
+    def flush(self):
+        with self._lock:
+            self.__commit()
+
+    def __written(self):
+        if len(self._pending_puts) + len(self._pending_hits) >= self.commit_every:
+            self.__commit()
+
+    def __commit(self):
+        if not self._pending_puts and not self._pending_hits:
+            return
+        try:
+            self._db.execute('BEGIN IMMEDIATE')
+            self._db.executemany(
+                'INSERT OR REPLACE INTO metadata (device, inode, size, mtime_ns, path, data, last_used) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                [key + value for key, value in self._pending_puts.items()])
+            self._db.executemany(
+                'UPDATE metadata SET last_used=? WHERE device=? AND inode=? AND size=? AND mtime_ns=?',
+                [(last_used,) + key for key, last_used in self._pending_hits.items()])
+            # replaced entries and entries of other runs make the running count an estimate
+            self._count += len(self._pending_puts)
+            if self._count > self.max_entries:
+                self._count = self._db.execute('SELECT COUNT(*) FROM metadata').fetchone()[0]
+                if self._count > self.max_entries:
+                    keep = self.max_entries - self.max_entries // 10
+                    self._db.execute(
+                        'DELETE FROM metadata WHERE rowid IN (SELECT rowid FROM metadata ORDER BY last_used LIMIT ?)',
+                        (self._count - keep,))
+                    self._count = keep
+            self._db.execute('COMMIT')
+        except sqlite3.Error:
+            # the cache is only an optimization, a busy or broken cache must not stop the run
+            if self._db.in_transaction:
+                self._db.execute('ROLLBACK')
+        self._pending_puts = {}
+        self._pending_hits = {}
@@ -0,0 +1,302 @@
+import hashlib
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import sqlite3
+except ImportError:  # Python built without sqlite support
+    sqlite3 = None
+
+from src.cache import default_cache_path
+from src.throttle import io_throttle
+
+PARTIAL_SIZE = 64 * 1024
+BUFFER_SIZE = 1024 * 1024
+
+
+def partial_digest(file_path: str, size: int) -> str:
+    """
+    Hash of the head and the tail of the file, cheap to compute even for huge videos
+    """
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as file:
+        block = file.read(PARTIAL_SIZE)
+        io_throttle.read(len(block))
+        digest.update(block)
+        if size > PARTIAL_SIZE:
+            file.seek(max(PARTIAL_SIZE, size - PARTIAL_SIZE))
+            block = file.read(PARTIAL_SIZE)
+            io_throttle.read(len(block))
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def full_digest(file_path: str) -> str:
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as file:
+        for block in iter(lambda: file.read(io_throttle.chunk_size(BUFFER_SIZE)), b''):
+            io_throttle.read(len(block))
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class FileDigest(object):
+    """
+    Size, partial and full hash of a file, each computed at most once and only when needed
+    """
+    __slots__ = ('path', 'size', 'mtime_ns', '_partial', '_full')
+
+    def __init__(self, path: str, partial: (str, None) = None, full: (str, None) = None):
+        stat = os.stat(path)
+        self.path = path
+        self.size = stat.st_size
+        self.mtime_ns = stat.st_mtime_ns
+        self._partial = partial
+        self._full = full
+
+    @property
+    def partial(self) -> str:
+        if self._partial is None:
+            self._partial = partial_digest(self.path, self.size)
+        return self._partial
+
+    @property
+    def full(self) -> str:
+        if self._full is None:
+            self._full = full_digest(self.path)
+        return self._full
+
+    def same(self, other: 'FileDigest') -> bool:
+        return self.size == other.size and self.partial == other.partial and self.full == other.full
+
+
+class DuplicateFinder(object):
+    """
+    Finds files with the same content within one run.
+    Files are grouped by size, files of the same size by the hash of their head and tail and only those
+    by the full hash. The hashes needed for a batch are computed in a pool of threads (hashlib releases
+    the GIL), the decisions are then taken in the order of the batch, so the first file wins.
+    Earlier files are only read while holding their own lock, a caller moving such a file
+    holds the same lock until the path of its digest points to the new location.
+    """
+
+    def __init__(self, workers=4):
+        self._firsts = {}
+        self._pool = ThreadPoolExecutor(max_workers=max(1, workers))
+        self._locks = {}
+
+    def lock(self, digest: FileDigest) -> (threading.Lock, None):
+        """
+        The lock of an earlier file, None for a file later files are not compared with
+        """
+        return self._locks.get(id(digest))
+
+    def resolve(self, digests: list) -> list:
+        """
+        Returns for every digest the digest of an earlier file with the same content or None.
+        Empty files are never reported as duplicates
+        """
+        candidates = [digest for digest in digests if digest.size > 0]
+        sizes = {}
+        for digest in candidates:
+            sizes[digest.size] = sizes.get(digest.size, 0) + 1
+        same_size = [digest for digest in candidates if sizes[digest.size] > 1 or digest.size in self._firsts]
+        earlier = set(id(first) for size in sizes if size in self._firsts for first in self._firsts[size])
+        same_size += [first for size in sizes if size in self._firsts for first in self._firsts[size]]
+        self.__hash(same_size, 'partial', earlier)
+
+        partials = {}
+        for digest in same_size:
+            key = (digest.size, digest._partial)
+            partials[key] = partials.get(key, 0) + 1
+        self.__hash([digest for digest in same_size
+                     if digest._partial is not None and partials[(digest.size, digest._partial)] > 1], 'full', earlier)
+
+        originals = {}
+        for digest in candidates:
+            original = None
+            for first in self._firsts.get(digest.size, ()):
+                try:
+                    with self._locks[id(first)]:
+                        same = first.same(digest)
+                except OSError:
+                    continue
+                if same:
+                    original = first
+                    break
+            if original is None:
+                self._locks[id(digest)] = threading.Lock()
+                self._firsts.setdefault(digest.size, []).append(digest)
+            else:
+                originals[id(digest)] = original
+        return [originals.get(id(digest)) for digest in digests]
+
+    def close(self):
+        self._pool.shutdown()
+
+    def __hash(self, digests: list, name: str, earlier: set):
+        def compute(digest):
+            try:
+                if id(digest) in earlier:
+                    with self._locks[id(digest)]:
+                        getattr(digest, name)
+                else:
+                    getattr(digest, name)
+            except OSError:
+                pass
+
+        list(self._pool.map(compute, digests))
+
+
+class ContentIndex(object):
+    """
+    Persistent index of the files in the output roots: size => partial hash => full hash.
+    Hashes are computed lazily, only when a file of the same size has to be compared,
+    and stored so every library file is read at most once.
+    Indexed files are verified by size and modification time before they are trusted.
+    """
+
+    def __init__(self, roots: list, path: (str, None) = None, rebuild=False):
+        if sqlite3 is None:
+            raise RuntimeError('Python is built without sqlite3 support')
+        self.path = path or os.path.join(os.path.dirname(default_cache_path()), 'content-index.sqlite')
+        self.roots = sorted(set(os.path.abspath(root) for root in roots if root is not None))
+        self._lock = threading.RLock()
+        self._placing = {}
+        directory = os.path.dirname(self.path)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory, exist_ok=True)
+        self._db = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('PRAGMA synchronous=NORMAL')
+        self._db.execute(
+            'CREATE TABLE IF NOT EXISTS files ('
+            'path TEXT PRIMARY KEY, root TEXT, size INTEGER, mtime_ns INTEGER, partial TEXT, full TEXT)')
+        self._db.execute('CREATE INDEX IF NOT EXISTS files_root_size ON files (root, size)')
+        self._db.execute('CREATE TABLE IF NOT EXISTS roots (root TEXT PRIMARY KEY)')
+        for root in self.roots:
+            if rebuild or not self.__scanned(root):
+                self.scan(root)
+
+    def root_of(self, path: str) -> (str, None):
+        path = os.path.abspath(path)
+        for root in reversed(self.roots):
+            if path == root or path.startswith(root + os.path.sep):
+                return root
+        return None
+
+    def reserve(self, digest: FileDigest, root: (str, None)) -> (threading.Event, None):
+        """
+        Reserve the content of a file before it is looked up and placed under the root, so two identical
+        files processed at the same time can't both be placed. Returns None once the content is reserved,
+        otherwise the event of the placement in progress to wait for before trying again
+        """
+        key = (root, digest.size, digest.partial)
+        with self._lock:
+            placing = self._placing.get(key)
+            if placing is None:
+                self._placing[key] = threading.Event()
+            return placing
+
+    def release(self, digest: FileDigest, root: (str, None)):
+        """
+        End the reservation once the file is placed and indexed or given up
+        """
+        with self._lock:
+            self._placing.pop((root, digest.size, digest.partial)).set()
+
+    def scan(self, root: str):
+        """
+        (Re)index every file under the root without hashing it
+        """
+        with self._lock:
+            self._db.execute('BEGIN')
+            self._db.execute('DELETE FROM files WHERE root=?', (root,))
+            for directory, dirs, files in os.walk(root):
+                rows = []
+                for name in files:
+                    path = os.path.join(directory, name)
+                    if self.root_of(path) != root:
+                        # the file belongs to another output root nested in this one
+                        continue
+                    try:
+                        stat = os.stat(path)
+                    except OSError:
+                        continue
+                    rows.append((path, root, stat.st_size, stat.st_mtime_ns))
+                self._db.executemany('INSERT OR REPLACE INTO files (path, root, size, mtime_ns) VALUES (?, ?, ?, ?)',
+                                     rows)
+            self._db.execute('INSERT OR REPLACE INTO roots (root) VALUES (?)', (root,))
+            self._db.execute('COMMIT')
+
+    def find(self, digest: FileDigest, root: str) -> (str, None):
+        """
+        Returns the path of an indexed file with the same content or None
+        """
+        with self._lock:
+            rows = self._db.execute('SELECT path, mtime_ns, partial, full FROM files WHERE root=? AND size=?',
+                                    (root, digest.size)).fetchall()
+        for path, mtime_ns, partial, full in rows:
+            if path == os.path.abspath(digest.path):
+                continue
+            try:
+                stat = os.stat(path)
+            except OSError:
+                self.remove(path)
+                continue
+            if stat.st_size != digest.size or stat.st_mtime_ns != mtime_ns:
+                self.remove(path)
+                continue
+            candidate = FileDigest(path, partial, full)
+            if candidate.partial != digest.partial:
+                self.__store(candidate, root)
+                continue
+            same = candidate.full == digest.full
+            self.__store(candidate, root)
+            if same:
+                return path
+        return None
+
+    def digest(self, path: str) -> FileDigest:
+        """
+        Digest of a library file using the stored hashes if the file is unchanged
+        """
+        with self._lock:
+            row = self._db.execute('SELECT size, mtime_ns, partial, full FROM files WHERE path=?',
+                                   (os.path.abspath(path),)).fetchone()
+        digest = FileDigest(path)
+        if row is not None and row[0] == digest.size and row[1] == digest.mtime_ns:
+            digest = FileDigest(path, row[2], row[3])
+        return digest
+
+    def add(self, path: str, digest: (FileDigest, None) = None):
+        """
+        Index a placed file, hashes already known from its source are kept
+        """
+        root = self.root_of(path)
+        if root is None:
+            return
+        placed = FileDigest(path)
+        if digest is not None and digest.size == placed.size:
+            placed = FileDigest(path, digest._partial, digest._full)
+        self.__store(placed, root)
+
+    def store(self, digest: FileDigest):
+        root = self.root_of(digest.path)
+        if root is not None:
+            self.__store(digest, root)
+
+    def remove(self, path: str):
+        with self._lock:
+            self._db.execute('DELETE FROM files WHERE path=?', (os.path.abspath(path),))
+
+    def __store(self, digest: FileDigest, root: str):
+        with self._lock:
+            self._db.execute(
+                'INSERT OR REPLACE INTO files (path, root, size, mtime_ns, partial, full) VALUES (?, ?, ?, ?, ?, ?)',
+                (os.path.abspath(digest.path), root, digest.size, digest.mtime_ns, digest._partial, digest._full))
+
+    def __scanned(self, root: str) -> bool:
+        with self._lock:
+            return self._db.execute('SELECT 1 FROM roots WHERE root=?', (root,)).fetchone() is not None
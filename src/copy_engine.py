@@ -0,0 +1,252 @@
+import errno
+import hashlib
+import os
+import shutil
+import threading
+
+from src.content_index import full_digest
+from src.throttle import io_throttle
+
+try:
+    import fcntl
+except ImportError:  # not available on Windows
+    fcntl = None
+
+ENGINES = ('auto', 'reflink', 'kernel', 'python')
+# ioctl of Linux (btrfs, XFS, ...) which clones the extents of a file: _IOW(0x94, 9, int)
+FICLONE = 0x40049409
+BUFFER_SIZE = 8 * 1024 * 1024
+CHUNK_SIZE = 1024 * 1024 * 1024
+# a copy is written under a temporary name next to its target and renamed once it is complete
+PARTIAL_SUFFIX = '.partial'
+
+# errors meaning the method can't be used for this pair of files, the next one is tried
+UNSUPPORTED = {errno.EXDEV, errno.EINVAL, errno.ENOSYS, errno.EOPNOTSUPP, errno.ENOTTY, errno.EBADF,
+               errno.EPERM, getattr(errno, 'ENOTSUP', errno.EOPNOTSUPP)}
+
+
+def partial_path(target: str) -> str:
+    """
+    The temporary name a copy to `target` is written to, hidden in the directory of the target
+    """
+    directory, name = os.path.split(target)
+    return os.path.join(directory, '.' + name + PARTIAL_SUFFIX)
+
+
+class CopyEngine(object):
+    """
+    Copy files with the fastest method the platform and the file systems support and preserve
+    the same metadata as shutil.copy2:
+    * reflink: clone the file with the FICLONE ioctl, no data is copied at all (btrfs, XFS, ...)
+    * copy_file_range / sendfile: the data is copied by the kernel without passing through user space
+    * python: read and write in large blocks
+    `auto` tries them in this order, `kernel` skips the reflink and `reflink` fails for files
+    which can't be cloned. The methods used are counted in `used`, the ways files were moved in `moved`.
+    Copied data is accounted to the I/O throttle chunk by chunk, a reflink copies no data.
+    Targets are created exclusively, an existing target raises FileExistsError and is never replaced.
+    A copy is written and fsync'd under its partial_path() and only then renamed to the target,
+    a target never holds a partial file
+    """
+
+    def __init__(self, engine: str = 'auto'):
+        if engine not in ENGINES:
+            raise ValueError('Unknown copy engine: %s' % engine)
+        self.engine = engine
+        if engine == 'auto':
+            self.methods = ('reflink', 'copy_file_range', 'sendfile', 'python')
+        elif engine == 'reflink':
+            self.methods = ('reflink',)
+        elif engine == 'kernel':
+            self.methods = ('copy_file_range', 'sendfile', 'python')
+        else:
+            self.methods = ('python',)
+        self.used = {}
+        self.moved = {}
+        self._devices = {}
+        self._lock = threading.Lock()
+
+    def copy(self, source: str, target: str) -> str:
+        """
+        Copy the file with its metadata and return the name of the method which copied the data
+        """
+        if os.path.lexists(target):
+            raise FileExistsError(errno.EEXIST, os.strerror(errno.EEXIST), target)
+        partial = partial_path(target)
+        with open(source, 'rb') as source_file:
+            target_file = open(partial, 'xb')
+            try:
+                with target_file:
+                    size = os.fstat(source_file.fileno()).st_size
+                    method = self.__copy_data(source_file.fileno(), target_file.fileno(), size)
+                    os.fsync(target_file.fileno())
+                shutil.copystat(source, partial)
+                CopyEngine.__rename(partial, target)
+            except BaseException:
+                # no partial or empty file is left behind when no method could copy the file
+                if os.path.lexists(partial):
+                    os.remove(partial)
+                raise
+        with self._lock:
+            self.used[method] = self.used.get(method, 0) + 1
+        return method
+
+    def move(self, source: str, target: str) -> str:
+        """
+        Move the file and return how: `rename` when source and target are on the same file system,
+        otherwise `verified copy`: the file is copied while its checksum is computed, the checksum
+        of the copy is checked against it and only then the source is removed
+        """
+        method = 'rename'
+        if os.path.lexists(target):
+            raise FileExistsError(errno.EEXIST, os.strerror(errno.EEXIST), target)
+        if self.same_device(source, target):
+            try:
+                os.rename(source, target)
+            except OSError as error:
+                if error.errno != errno.EXDEV:
+                    raise
+                method = 'verified copy'
+        else:
+            method = 'verified copy'
+        if method != 'rename':
+            CopyEngine.__verified_copy(source, target)
+            os.remove(source)
+        with self._lock:
+            self.moved[method] = self.moved.get(method, 0) + 1
+        return method
+
+    def same_device(self, source: str, target: str) -> bool:
+        """
+        Whether the file and the directory of the target are on the same device,
+        the device of every target directory is looked up once
+        """
+        directory = os.path.dirname(os.path.abspath(target))
+        with self._lock:
+            device = self._devices.get(directory)
+        if device is None:
+            device = os.stat(directory).st_dev
+            with self._lock:
+                self._devices[directory] = device
+        return os.stat(source).st_dev == device
+
+    @staticmethod
+    def __rename(partial: str, target: str):
+        """
+        Give a complete copy the name of its target, an existing target is never replaced
+        """
+        try:
+            os.link(partial, target)
+        except FileExistsError:
+            raise
+        except OSError as error:
+            if error.errno not in UNSUPPORTED:
+                raise
+            # no hard links on this file system (FAT, exFAT), the name is checked right before the rename
+            if os.path.lexists(target):
+                raise FileExistsError(errno.EEXIST, os.strerror(errno.EEXIST), target)
+            os.rename(partial, target)
+            return
+        os.remove(partial)
+
+    @staticmethod
+    def __verified_copy(source: str, target: str):
+        checksum = hashlib.sha256()
+        partial = partial_path(target)
+        with open(source, 'rb') as source_file:
+            CopyEngine.__copy_with_checksum(source_file, partial, checksum)
+        try:
+            shutil.copystat(source, partial)
+            if full_digest(partial) != checksum.hexdigest():
+                raise OSError(errno.EIO, 'Checksum of the copy does not match the source', target)
+            CopyEngine.__rename(partial, target)
+        except BaseException:
+            if os.path.lexists(partial):
+                os.remove(partial)
+            raise
+
+    @staticmethod
+    def __copy_with_checksum(source_file, target: str, checksum):
+        target_file = open(target, 'xb')
+        try:
+            with target_file:
+                buffer_size = io_throttle.chunk_size(BUFFER_SIZE)
+                while True:
+                    block = source_file.read(buffer_size)
+                    if not block:
+                        break
+                    io_throttle.read(len(block))
+                    checksum.update(block)
+                    target_file.write(block)
+                target_file.flush()
+                os.fsync(target_file.fileno())
+        except BaseException:
+            os.remove(target)
+            raise
+
+    def __copy_data(self, source: int, target: int, size: int) -> str:
+        for method in self.methods:
+            try:
+                if method == 'reflink':
+                    CopyEngine.__reflink(source, target)
+                elif method == 'copy_file_range':
+                    CopyEngine.__copy_file_range(source, target, size)
+                elif method == 'sendfile':
+                    CopyEngine.__sendfile(source, target, size)
+                else:
+                    CopyEngine.__python(source, target)
+                return method
+            except OSError as error:
+                if error.errno not in UNSUPPORTED or method == self.methods[-1]:
+                    raise
+                # start again from scratch with the next method
+                os.ftruncate(target, 0)
+                os.lseek(target, 0, os.SEEK_SET)
+                os.lseek(source, 0, os.SEEK_SET)
+        raise OSError(errno.EOPNOTSUPP, 'No copy method available')
+
+    @staticmethod
+    def __reflink(source: int, target: int):
+        if fcntl is None:
+            raise OSError(errno.EOPNOTSUPP, 'FICLONE is not supported')
+        fcntl.ioctl(target, FICLONE, source)
+
+    @staticmethod
+    def __copy_file_range(source: int, target: int, size: int):
+        if not hasattr(os, 'copy_file_range'):
+            raise OSError(errno.ENOSYS, 'copy_file_range is not supported')
+        chunk_size = io_throttle.chunk_size(CHUNK_SIZE)
+        offset = 0
+        while offset < size:
+            count = min(chunk_size, size - offset)
+            io_throttle.read(count)
+            copied = os.copy_file_range(source, target, count, offset, offset)
+            if copied == 0:
+                break
+            offset += copied
+
+    @staticmethod
+    def __sendfile(source: int, target: int, size: int):
+        if not hasattr(os, 'sendfile'):
+            raise OSError(errno.ENOSYS, 'sendfile is not supported')
+        chunk_size = io_throttle.chunk_size(CHUNK_SIZE)
+        offset = 0
+        while offset < size:
+            count = min(chunk_size, size - offset)
+            io_throttle.read(count)
+            sent = os.sendfile(target, source, offset, count)
+            if sent == 0:
+                break
+            offset += sent
+
+    @staticmethod
+    def __python(source: int, target: int):
+        buffer_size = io_throttle.chunk_size(BUFFER_SIZE)
+        while True:
+            block = os.read(source, buffer_size)
+            if not block:
+                break
+            io_throttle.read(len(block))
+            view = memoryview(block)
+            while view:
+                written = os.write(target, view)
+                view = view[written:]
@@ -1,6 +1,27 @@
 import os
 import re
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
+
+# YYYY:MM:DD HH:MM:SS[.sss][Z|±HH:MM] as written by exiftool and the native reader, '-' is accepted in the date too
+EXIF_DATE = re.compile(r'(\d{4})([:-])(\d{2})\2(\d{2}) (\d{2}):(\d{2}):(\d{2})(?:\.(\d*))?(?:(Z)|([+-])(\d{2}):(\d{2}))?')
+TIMEZONE = re.compile(r'(.*)([+-])(\d{2}):(\d{2})')
+DEFAULT_FILENAME_REGEX = re.compile(
+    r'.*[_-](?P<year>\d{4})(?P<month>\d{2})(?P<day>\d{2})[_-]?(?P<hour>\d{2})(?P<minute>\d{2})(?P<second>\d{2})')
+DEFAULT_DATE_FIELDS = ('SubSecCreateDate', 'SubSecDateTimeOriginal', 'CreateDate', 'DateTimeOriginal', 'TimeStamp')
+NO_DATE = '0000:00:00 00:00:00'
+# timezone of every offset in minutes seen so far
+TIMEZONES = {0: timezone.utc}
+
+
+def offset_timezone(sign: str, hours: str, minutes: str) -> timezone:
+    offset = int(hours) * 60 + int(minutes)
+    if sign == '-':
+        offset = -offset
+    tz = TIMEZONES.get(offset)
+    if tz is None:
+        tz = TIMEZONES.setdefault(offset, timezone(timedelta(minutes=offset)))
+    return tz
+
 
 class Date():
     def __init__(self, file=None):
@@ -27,16 +48,34 @@ class Date():
                         date_object["minute"] if date_object.get("minute") else 0,
                         date_object["second"] if date_object.get("second") else 0)
 
-    def from_exif(self, exif, timestamp=None, user_regex=None, date_field=None):
-        if date_field:
-            keys = date_field.split()
+    def from_exif(self, exif, timestamp=None, user_regex=None, date_field=None, parsed_date=None):
+        """
+        The date of the exif data, `parsed_date` is the result of from_exif_many if it was parsed already
+        """
+        if parsed_date is None:
+            parsed_date = self.parse_exif(exif, date_field)
+
+        if parsed_date.get("date") is not None:
+            return parsed_date
         else:
-            keys = ['SubSecCreateDate', 'SubSecDateTimeOriginal', 'CreateDate', 'DateTimeOriginal', 'TimeStamp']
+            if self.file:
+                return self.from_filename(user_regex, timestamp) if user_regex else None
+            else:
+                return parsed_date
 
+    def parse_exif(self, exif, date_field=None):
+        datestr = Date.exif_datestring(exif, date_field)
+        if datestr is None:
+            return {'date': None, 'subseconds': '', 'isexif': False}
+        return self.from_datestring(datestr)
+
+    @staticmethod
+    def exif_datestring(exif, date_field=None) -> (str, None):
+        keys = date_field.split() if date_field else DEFAULT_DATE_FIELDS
         datestr = None
 
         for key in keys:
-            if key in exif and exif[key] != '0000:00:00 00:00:00':
+            if key in exif and exif[key] != NO_DATE:
                 datestr = exif[key]
                 break
 
@@ -44,29 +83,76 @@ class Date():
         # check to see if valid date first
         # sometimes this returns an int
         if datestr and isinstance(datestr, str) and not datestr.startswith('0000'):
-            parsed_date = self.from_datestring(datestr)
-        else:
-            parsed_date = {'date': None, 'subseconds': '', 'isexif': False}
+            return datestr
+        return None
 
-        if parsed_date.get("date") is not None:
-            return parsed_date
-        else:
-            if self.file:
-                return self.from_filename(user_regex, timestamp) if user_regex else None
-            else:
-                return parsed_date
+    @staticmethod
+    def from_exif_many(exifs: list, date_field=None) -> list:
+        """
+        Parse the exif dates of a prefetched chunk at once, for from_exif(parsed_date=...).
+        The same date string is parsed only once, None is returned for missing exif data
+        """
+        date = Date()
+        parsed = {}
+        results = []
+        for exif in exifs:
+            if exif is None:
+                results.append(None)
+                continue
+            datestr = Date.exif_datestring(exif, date_field)
+            result = parsed.get(datestr)
+            if result is None:
+                result = date.parse_exif(exif, date_field)
+                parsed[datestr] = result
+            results.append(result)
+        return results
 
     def from_datestring(self, datestr):
+        """
+        Parse an exif date, a time zone offset is kept in the date.
+        The fixed layout YYYY:MM:DD HH:MM:SS[.sss][±HH:MM] is parsed without strptime, the subseconds are
+        everything after the '.' like with strptime (offset included), since they are part of the file names
+        """
+        match = EXIF_DATE.fullmatch(datestr)
+        # without subseconds strptime fails on a 'Z', such a date is left to it
+        if match is not None and not (match.group(9) and match.group(8) is None):
+            year, _, month, day, hour, minute, second, subseconds, utc, sign, offset_hours, offset_minutes = \
+                match.groups()
+            try:
+                if utc:
+                    tz = timezone.utc
+                elif sign:
+                    tz = offset_timezone(sign, offset_hours, offset_minutes)
+                else:
+                    tz = None
+                return {
+                    'date': datetime(int(year), int(month), int(day), int(hour), int(minute), int(second), 0, tz),
+                    'subseconds': '' if subseconds is None else datestr[match.start(8):],
+                    'isexif': True,
+                }
+            except ValueError:
+                pass
+        return self.parse_datestring(datestr)
+
+    def parse_datestring(self, datestr):
+        """
+        Slow path for the layouts the fixed layout parser doesn't know, e.g. fields without leading zeros
+        """
         isexif = True
+        tz = None
         datestr = datestr.split('.')
         date = datestr[0]
         if len(datestr) > 1:
             subseconds = datestr[1]
         else:
             subseconds = ''
-        search = r'(.*)([+-]\d{2}:\d{2})'
-        if re.search(search, date) is not None:
-            date = re.sub(search, r'\1', date)
+        match = TIMEZONE.search(date)
+        if match is not None:
+            try:
+                tz = offset_timezone(match.group(2), match.group(3), match.group(4))
+            except ValueError:
+                tz = None
+            date = date[:match.start(2)] + date[match.end():]
         try:
             parsed_date_time = self.strptime(date, "%Y:%m:%d %H:%M:%S")
         except ValueError:
@@ -75,6 +161,8 @@ class Date():
             except ValueError:
                 parsed_date_time = None
                 isexif = False
+        if parsed_date_time is not None and tz is not None:
+            parsed_date_time = parsed_date_time.replace(tzinfo=tz)
         return {
             'date': parsed_date_time,
             'subseconds': subseconds,
@@ -85,9 +173,7 @@ class Date():
         # If missing datetime from EXIF data check if filename is in datetime format.
         # For this use a user provided regex if possible.
         # Otherwise assume a filename such as IMG_20160915_123456.jpg as default.
-        default_regex = re.compile(
-            r'.*[_-](?P<year>\d{4})(?P<month>\d{2})(?P<day>\d{2})[_-]?(?P<hour>\d{2})(?P<minute>\d{2})(?P<second>\d{2})')
-        regex = user_regex or default_regex
+        regex = user_regex or DEFAULT_FILENAME_REGEX
         matches = regex.search(os.path.basename(self.file))
 
         if matches:
@@ -1,13 +1,33 @@
 import json
+import os
+import re
 import shlex
+import threading
+from concurrent.futures import Future
 from subprocess import check_output, CalledProcessError
 
+from src.cache import MetadataCache
+from src.exif_reader import read_exif
+from src.exiftool import ArgumentError, ExifTool, ExifToolError, ExifToolPool
+from src.throttle import io_throttle
+
 
 class Exif(object):
-    def __init__(self, file):
+    def __init__(self, file, exiftool: (ExifToolPool, None) = None, cache: (MetadataCache, None) = None,
+                 native: bool = False):
         self.file = file
+        self.exiftool = exiftool
+        self.cache = cache
+        self.native = native
 
     def write_created_date(self, date):
+        if self.exiftool is not None:
+            try:
+                out, err = self.exiftool.execute(*Exif.created_date_args(self.file, date))
+            except (ExifToolError, UnicodeError, ArgumentError):
+                return False
+            return Exif.written(out)
+
         try:
             data = check_output(
                 'exiftool -d "%%Y-%%m-%%d%%H:%%M:%%S" -CreateDate="%s" -overwrite_original "%s"' % (
@@ -19,7 +39,49 @@ class Exif(object):
 
         return True
 
+    @staticmethod
+    def created_date_args(file, date) -> list:
+        return ['-d', '%Y-%m-%d%H:%M:%S',
+                '-CreateDate=%s' % date.strftime('%Y-%m-%d%H:%M:%S'),
+                '-overwrite_original',
+                file]
+
+    @staticmethod
+    def written(out: str) -> bool:
+        return re.search(r'^\s*[1-9]\d* image files? (updated|unchanged)', out, re.MULTILINE) is not None
+
     def data(self):
+        if self.native:
+            exif = read_exif(self.file)
+            if exif is not None:
+                return exif
+
+        key = None
+        if self.cache is not None:
+            key = MetadataCache.key(self.file)
+            found, exif = self.cache.get(self.file, key)
+            if found:
+                return exif
+        try:
+            exif = self.__read()
+        except ExifToolError:
+            # exiftool itself failed, the result says nothing about the file and is not cached
+            return None
+        except (UnicodeError, ArgumentError):
+            # the name can't be passed to exiftool
+            return None
+        if self.cache is not None:
+            self.cache.put(self.file, exif, key)
+        return exif
+
+    def __read(self):
+        if self.exiftool is not None:
+            try:
+                exif = self.exiftool.execute_json('-time:all', '-mimetype', self.file)[0]
+            except IndexError:
+                return None
+            return exif
+
         try:
             data = check_output('exiftool -time:all -mimetype -j "%s"' % self.file, shell=True).decode('UTF-8')
             exif = json.loads(data)[0]
@@ -27,3 +89,101 @@ class Exif(object):
             return None
 
         return exif
+
+    @staticmethod
+    def prefetch(files: list, exiftool: ExifToolPool, cache: (MetadataCache, None) = None) -> dict:
+        """
+        Read the metadata of many files with one exiftool call, files found in the cache are not passed to exiftool.
+        Returns a dict of normalized file path => exif data; files exiftool could not read are missing
+        """
+        result = {}
+        keys = {}
+        if cache is not None:
+            missing = []
+            for file in files:
+                keys[file] = MetadataCache.key(file)
+                found, exif = cache.get(file, keys[file])
+                if not found:
+                    missing.append(file)
+                elif exif is not None:
+                    result[os.path.normpath(file)] = exif
+            files = missing
+        # a name which can't be passed to exiftool is left out, it fails alone when its file is read
+        files = [file for file in files if ExifTool.encodable(file)]
+        if not files:
+            return result
+        try:
+            items = exiftool.execute_json('-time:all', '-mimetype', *files)
+        except ExifToolError:
+            return result
+        for item in items:
+            if 'SourceFile' in item:
+                result[os.path.normpath(item['SourceFile'])] = item
+        if cache is not None:
+            for file in files:
+                if os.path.normpath(file) in result:
+                    cache.put(file, result[os.path.normpath(file)], keys[file])
+        return result
+
+
+class CreateDateWriter(object):
+    """
+    Queue of CreateDate write-backs sent to exiftool in batches, one command per file.
+    Pending writes are flushed together when `batch_size` of them are queued or as soon as
+    the result of one of them is needed, so a file only ever waits for the batch holding its own write.
+    exiftool rewrites the whole file, every write is accounted to the I/O throttle as a file and its size
+    """
+
+    def __init__(self, exiftool: ExifToolPool, batch_size=100):
+        self.exiftool = exiftool
+        self.batch_size = max(1, batch_size)
+        self._pending = []
+        self._lock = threading.Lock()
+
+    def put(self, file, date) -> Future:
+        """
+        Queue a write, the future is resolved with True if exiftool updated the file
+        """
+        future = Future()
+        with self._lock:
+            self._pending.append((file, date, future))
+            full = len(self._pending) >= self.batch_size
+        if full:
+            self.flush()
+        return future
+
+    def result(self, future: Future) -> bool:
+        if not future.done():
+            self.flush()
+        return future.result()
+
+    def flush(self):
+        with self._lock:
+            batch, self._pending = self._pending, []
+        if not batch:
+            return
+        encodable = []
+        for file, date, future in batch:
+            if not ExifTool.encodable(file):
+                future.set_result(False)
+            else:
+                encodable.append((file, date, future))
+        batch = encodable
+        if not batch:
+            return
+        for file, date, future in batch:
+            io_throttle.file()
+            try:
+                io_throttle.read(os.path.getsize(file))
+            except OSError:
+                pass
+        try:
+            results = self.exiftool.execute_many([Exif.created_date_args(file, date) for file, date, future in batch])
+        except ExifToolError:
+            results = [None] * len(batch)
+        except Exception as error:
+            for file, date, future in batch:
+                future.set_exception(error)
+            raise
+        for (file, date, future), result in zip(batch, results):
+            future.set_result(result is not None and Exif.written(result[0]))
@@ -0,0 +1,243 @@
+import os
+import struct
+from datetime import datetime, timezone
+
+from src.file_type import HEADER_SIZE, SourceFileType, classify_header
+
+JPEG_MIME_TYPE = 'image/jpeg'
+TIFF_MIME_TYPES = {
+    '.tif': 'image/tiff',
+    '.tiff': 'image/tiff',
+    '.cr2': 'image/x-canon-cr2',
+    '.nef': 'image/x-nikon-nef',
+    '.nrw': 'image/x-nikon-nrw',
+    '.arw': 'image/x-sony-arw',
+    '.sr2': 'image/x-sony-sr2',
+    '.dng': 'image/x-adobe-dng',
+    '.pef': 'image/x-pentax-pef',
+}
+
+IFD0_TAGS = {
+    0x0132: 'ModifyDate',
+}
+EXIF_IFD_TAGS = {
+    0x9003: 'DateTimeOriginal',
+    0x9004: 'CreateDate',
+    0x9010: 'OffsetTime',
+    0x9011: 'OffsetTimeOriginal',
+    0x9012: 'OffsetTimeDigitized',
+    0x9290: 'SubSecTime',
+    0x9291: 'SubSecTimeOriginal',
+    0x9292: 'SubSecTimeDigitized',
+}
+EXIF_IFD_POINTER = 0x8769
+XMP_TAG = 0x02BC
+ASCII = 2
+LONG = 4
+IFD = 13
+
+# composite tags built by exiftool: (name, date, subseconds, offset)
+COMPOSITE_TAGS = (
+    ('SubSecCreateDate', 'CreateDate', 'SubSecTimeDigitized', 'OffsetTimeDigitized'),
+    ('SubSecDateTimeOriginal', 'DateTimeOriginal', 'SubSecTimeOriginal', 'OffsetTimeOriginal'),
+    ('SubSecModifyDate', 'ModifyDate', 'SubSecTime', 'OffsetTime'),
+)
+
+JPEG_HEADER_SIZE = 64 * 1024
+
+
+class UnsupportedFile(Exception):
+    pass
+
+
+def read_exif(file_path: str) -> (dict, None):
+    """
+    Read the exif dates of JPEG, TIFF based RAW and ISO base media (MP4, MOV, 3GP, HEIC) files
+    without exiftool.
+    Returns the same dict as `exiftool -time:all -mimetype -j` for the tags phockup uses,
+    or None when the file is not supported or may contain dates only exiftool can resolve
+    (XMP packets, missing or zeroed dates, unusual layouts)
+    """
+    try:
+        with open(file_path, 'rb') as file:
+            return read_exif_file(file, file_path, file.read(8))
+    except OSError:
+        return None
+
+
+def classify_and_read(file_path: str) -> ((SourceFileType, None), (dict, None)):
+    """
+    Classify the file like classify() and read its exif dates like read_exif() with a single open,
+    returns its type and its exif dates or None. A file which is not media is not read any further
+    """
+    try:
+        with open(file_path, 'rb') as file:
+            header = file.read(HEADER_SIZE)
+            file_type = classify_header(header, file_path)
+            if file_type == SourceFileType.UNKNOWN:
+                return file_type, None
+            return file_type, read_exif_file(file, file_path, header)
+    except OSError:
+        return None, None
+
+
+def read_exif_file(file, file_path: str, header: bytes) -> (dict, None):
+    """
+    read_exif() for an open file whose first bytes (at least 8) were read already
+    """
+    signature = header[:8]
+    try:
+        if signature[:2] == b'\xff\xd8':
+            mime_type = JPEG_MIME_TYPE
+            tags = read_jpeg(file)
+        elif signature[:4] in (b'II*\x00', b'MM\x00*'):
+            mime_type = TIFF_MIME_TYPES.get(os.path.splitext(file_path)[1].lower())
+            if mime_type is None:
+                return None
+            tags = read_tiff(file_reader(file), 0)
+        elif signature[4:8] == b'ftyp':
+            from src.bmff_reader import read_bmff  # the box parser builds on the TIFF reader
+            mime_type, tags = read_bmff(file)
+        else:
+            return None
+        stat = os.fstat(file.fileno())
+    except (OSError, UnsupportedFile, struct.error, IndexError, ValueError):
+        return None
+
+    if not any(is_valid_date(tags.get(key)) for key in ('CreateDate', 'DateTimeOriginal')):
+        return None
+
+    exif = {'SourceFile': file_path}
+    exif.update(file_dates(stat))
+    exif['MIMEType'] = mime_type
+    exif.update(tags)
+    for name, date, subseconds, offset in COMPOSITE_TAGS:
+        if date in tags and (subseconds in tags or offset in tags):
+            exif[name] = tags[date] + ('.' + tags[subseconds] if tags.get(subseconds) else '') + tags.get(offset, '')
+    return exif
+
+
+def is_valid_date(value: (str, None)) -> bool:
+    return bool(value) and not value.startswith('0000')
+
+
+def file_dates(stat: os.stat_result) -> dict:
+    dates = {
+        'FileModifyDate': format_timestamp(stat.st_mtime),
+        'FileAccessDate': format_timestamp(stat.st_atime),
+    }
+    if os.name == 'nt':
+        dates['FileCreateDate'] = format_timestamp(stat.st_ctime)
+    else:
+        dates['FileInodeChangeDate'] = format_timestamp(stat.st_ctime)
+    return dates
+
+
+def format_timestamp(timestamp: float) -> str:
+    """
+    Format like exiftool: local time with the utc offset, e.g. 2017:01:01 01:01:01+02:00
+    """
+    local = datetime.fromtimestamp(int(timestamp), timezone.utc).astimezone()
+    offset = int(local.utcoffset().total_seconds() // 60)
+    sign = '+' if offset >= 0 else '-'
+    return local.strftime('%Y:%m:%d %H:%M:%S') + '%s%02d:%02d' % (sign, abs(offset) // 60, abs(offset) % 60)
+
+
+def file_reader(file):
+    def read(offset, length):
+        file.seek(offset)
+        data = file.read(length)
+        if len(data) != length:
+            raise UnsupportedFile('unexpected end of file')
+        return data
+
+    return read
+
+
+def bytes_reader(data: bytes):
+    def read(offset, length):
+        if offset < 0 or offset + length > len(data):
+            raise UnsupportedFile('unexpected end of data')
+        return data[offset:offset + length]
+
+    return read
+
+
+def read_jpeg(file) -> dict:
+    """
+    Walk the JPEG segments up to the image data and parse the Exif APP1 segment
+    """
+    tiff = None
+    file.seek(2)
+    while True:
+        marker = file.read(4)
+        if len(marker) != 4 or marker[0] != 0xFF:
+            raise UnsupportedFile('broken JPEG segment')
+        if marker[1] in (0xDA, 0xD9):
+            # start of scan / end of image: no more metadata
+            break
+        length = struct.unpack('>H', marker[2:])[0] - 2
+        if marker[1] == 0xE1:
+            data = file.read(min(length, JPEG_HEADER_SIZE))
+            if data.startswith(b'Exif\x00\x00') and tiff is None:
+                tiff = data[6:]
+            elif data.startswith(b'http://ns.adobe.com/'):
+                # XMP dates may take precedence, let exiftool decide
+                raise UnsupportedFile('XMP')
+            file.seek(length - len(data), os.SEEK_CUR)
+        else:
+            file.seek(length, os.SEEK_CUR)
+    if tiff is None:
+        raise UnsupportedFile('no exif')
+    return read_tiff(bytes_reader(tiff), 0)
+
+
+def read_tiff(read, start: int) -> dict:
+    header = read(start, 8)
+    if header[:2] == b'II':
+        order = '<'
+    elif header[:2] == b'MM':
+        order = '>'
+    else:
+        raise UnsupportedFile('not a TIFF header')
+    if struct.unpack(order + 'H', header[2:4])[0] != 42:
+        raise UnsupportedFile('not a TIFF header')
+    tags = {}
+    entries = read_ifd(read, start, start + struct.unpack(order + 'L', header[4:])[0], order)
+    if XMP_TAG in entries:
+        raise UnsupportedFile('XMP')
+    collect(read, start, order, entries, IFD0_TAGS, tags)
+    if EXIF_IFD_POINTER in entries:
+        type, count, value = entries[EXIF_IFD_POINTER]
+        if type not in (LONG, IFD):
+            raise UnsupportedFile('broken exif pointer')
+        exif_offset = struct.unpack(order + 'L', value)[0]
+        collect(read, start, order, read_ifd(read, start, start + exif_offset, order), EXIF_IFD_TAGS, tags)
+    return tags
+
+
+def read_ifd(read, start: int, offset: int, order: str) -> dict:
+    """
+    Returns tag => (type, count, raw 4 byte value or offset)
+    """
+    count = struct.unpack(order + 'H', read(offset, 2))[0]
+    data = read(offset + 2, count * 12)
+    entries = {}
+    for index in range(count):
+        tag, type, value_count = struct.unpack(order + 'HHL', data[index * 12:index * 12 + 8])
+        entries[tag] = (type, value_count, data[index * 12 + 8:index * 12 + 12])
+    return entries
+
+
+def collect(read, start: int, order: str, entries: dict, names: dict, tags: dict):
+    for tag, name in names.items():
+        if tag not in entries:
+            continue
+        type, count, value = entries[tag]
+        if type != ASCII:
+            continue
+        if count > 4:
+            value = read(start + struct.unpack(order + 'L', value)[0], count)
+        text = value[:count].split(b'\x00')[0].decode('ascii', errors='replace').strip()
+        if text:
+            tags[name] = text
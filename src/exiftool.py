@@ -0,0 +1,239 @@
+import atexit
+import json
+import os
+import queue
+import subprocess
+import threading
+
+
+# exiftool takes the file names of the argfile as they are on POSIX, on Windows it has to be told they are UTF-8
+FILENAME_ARGS = ['-charset', 'filename=utf8'] if os.name == 'nt' else []
+
+
+class ExifToolError(Exception):
+    pass
+
+
+class ArgumentError(ValueError):
+    """
+    An argument which can't be passed to exiftool in the argfile
+    """
+
+
+class ExifTool(object):
+    """
+    A single long-lived exiftool process driven through ``-stay_open True -@ -``.
+    Commands are written to its stdin as an argfile and every command is terminated
+    by a numbered ``-execute`` so the answer can be matched with the request.
+    The process is (re)started lazily, so a crashed or killed session recovers on the next call.
+    Arguments are encoded like subprocess does, so file names which are not valid UTF-8 are passed unchanged.
+    An argument can't contain a line break: the rest of the line would be read as another argument.
+    """
+
+    def __init__(self, executable='exiftool', timeout=60):
+        self.executable = executable
+        self.timeout = timeout
+        self._process = None
+        self._stdout = None
+        self._stderr = None
+        self._counter = 0
+        self._lock = threading.Lock()
+
+    @property
+    def running(self) -> bool:
+        return self._process is not None and self._process.poll() is None
+
+    def start(self):
+        try:
+            self._process = subprocess.Popen(
+                [self.executable, '-stay_open', 'True', '-@', '-'],
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE)
+        except OSError as error:
+            self._process = None
+            raise ExifToolError("Can't start exiftool: %s" % error)
+        self._stdout = ExifTool.__pump(self._process.stdout)
+        self._stderr = ExifTool.__pump(self._process.stderr)
+
+    def stop(self):
+        with self._lock:
+            self.__stop()
+
+    def execute(self, *args) -> (str, str):
+        """
+        Run one exiftool command in the session and return its (stdout, stderr).
+        A session which crashed, hung longer than `timeout` or cannot be written to is killed
+        and ExifToolError is raised; the next call starts a fresh process.
+        """
+        return self.execute_many([args])[0]
+
+    def execute_many(self, commands: list) -> list:
+        """
+        Run a batch of commands and return the (stdout, stderr) of each of them.
+        The whole batch is written to the argfile stream at once, one numbered ``-execute`` per command,
+        so exiftool works through it without waiting for a round trip between the commands.
+        An argument which can't be encoded raises UnicodeEncodeError, one with a line break ArgumentError,
+        before anything is sent.
+        """
+        lines = []
+        for args in commands:
+            lines.append([ExifTool.encode(arg) for arg in FILENAME_ARGS + list(args)])
+        with self._lock:
+            if not self.running:
+                self.__stop()
+                self.start()
+            markers = []
+            argfile = []
+            for args in lines:
+                self._counter += 1
+                marker = '{ready%d}' % self._counter
+                markers.append(marker)
+                argfile.extend(args + [b'-echo4', marker.encode('utf-8'), b'-execute%d' % self._counter])
+            results = []
+            try:
+                self._process.stdin.write(b'\n'.join(argfile) + b'\n')
+                self._process.stdin.flush()
+                for marker in markers:
+                    out = ExifTool.__read_until(self._stdout, marker, self.timeout)
+                    err = ExifTool.__read_until(self._stderr, marker, self.timeout)
+                    results.append((out, err))
+            except (OSError, ExifToolError) as error:
+                self.__kill()
+                raise ExifToolError('exiftool session failed: %s' % error)
+            return results
+
+    @staticmethod
+    def encode(arg: str) -> bytes:
+        """
+        The argument as bytes for the argfile, with the file system encoding and surrogateescape
+        """
+        if '\n' in arg or '\r' in arg:
+            raise ArgumentError('Line break in exiftool argument: %r' % arg)
+        return os.fsencode(arg)
+
+    @staticmethod
+    def encodable(arg: str) -> bool:
+        try:
+            ExifTool.encode(arg)
+        except (UnicodeError, ArgumentError):
+            return False
+        return True
+
+    def __stop(self):
+        if not self.running:
+            self._process = None
+            return
+        try:
+            self._process.stdin.write(b'-stay_open\nFalse\n')
+            self._process.stdin.flush()
+            self._process.wait(timeout=self.timeout)
+        except (OSError, subprocess.TimeoutExpired):
+            self.__kill()
+            return
+        self.__close_pipes()
+        self._process = None
+
+    def __kill(self):
+        if self._process is None:
+            return
+        try:
+            self._process.kill()
+            self._process.wait()
+        except OSError:
+            pass
+        self.__close_pipes()
+        self._process = None
+
+    def __close_pipes(self):
+        for stream in (self._process.stdin, self._process.stdout, self._process.stderr):
+            try:
+                stream.close()
+            except OSError:
+                pass
+
+    @staticmethod
+    def __pump(stream) -> queue.Queue:
+        """
+        Read the stream line by line in a daemon thread so reads can time out
+        """
+        lines = queue.Queue()
+
+        def pump():
+            for line in iter(stream.readline, b''):
+                lines.put(line)
+            lines.put(None)
+
+        threading.Thread(target=pump, daemon=True).start()
+        return lines
+
+    @staticmethod
+    def __read_until(lines: queue.Queue, marker: str, timeout) -> str:
+        marker = marker.encode('utf-8')
+        output = []
+        while True:
+            try:
+                line = lines.get(timeout=timeout)
+            except queue.Empty:
+                raise ExifToolError('no answer within %s seconds' % timeout)
+            if line is None:
+                raise ExifToolError('exiftool terminated')
+            stripped = line.rstrip(b'\r\n')
+            if stripped.endswith(marker):
+                output.append(stripped[:-len(marker)])
+                break
+            output.append(line)
+        return b''.join(output).decode('utf-8', errors='replace')
+
+
+class ExifToolPool(object):
+    """
+    A small pool of exiftool sessions shared by every caller of a run.
+    Each request borrows an idle session, so up to `size` requests can be in flight at once.
+    """
+
+    def __init__(self, size=1, executable='exiftool', timeout=60, retries=1):
+        self.size = max(1, size)
+        self.retries = retries
+        self._sessions = [ExifTool(executable=executable, timeout=timeout) for _ in range(self.size)]
+        self._idle = queue.Queue()
+        for session in self._sessions:
+            self._idle.put(session)
+        atexit.register(self.close)
+
+    def execute(self, *args) -> (str, str):
+        return self.execute_many([args])[0]
+
+    def execute_many(self, commands: list) -> list:
+        """
+        Run a batch of commands in one session; a failed batch is retried as a whole,
+        so the commands have to be safe to repeat
+        """
+        session = self._idle.get()
+        try:
+            attempt = 0
+            while True:
+                try:
+                    return session.execute_many(commands)
+                except ExifToolError:
+                    attempt += 1
+                    if attempt > self.retries:
+                        raise
+        finally:
+            self._idle.put(session)
+
+    def execute_json(self, *args) -> list:
+        """
+        Run a command with `-j` output and return the parsed list
+        """
+        out, err = self.execute(*(list(args) + ['-j']))
+        if not out.strip():
+            return []
+        try:
+            return json.loads(out)
+        except ValueError as error:
+            raise ExifToolError('invalid exiftool json: %s' % error)
+
+    def close(self):
+        for session in self._sessions:
+            session.stop()
@@ -0,0 +1,100 @@
+import os
+from enum import Enum
+
+HEADER_SIZE = 16
+
+
+class SourceFileType(Enum):
+    VIDEO = 1
+    IMAGE = 2
+    UNKNOWN = 3
+
+
+# signatures at the start of the file
+IMAGE_SIGNATURES = (
+    b'\xff\xd8\xff',  # jpeg
+    b'\x89PNG\r\n\x1a\n',
+    b'GIF87a',
+    b'GIF89a',
+    b'II*\x00',  # tiff and tiff based raw (cr2, nef, arw, dng, ...)
+    b'MM\x00*',
+    b'IIRO',  # olympus orf
+    b'IIRS',
+    b'MMOR',
+    b'IIU\x00',  # panasonic rw2
+    b'FUJIFILMCCD-RAW',  # fuji raf
+    b'FOVb',  # sigma x3f
+    b'8BPS',  # photoshop
+    b'\x00\x00\x00\x0cjP  ',  # jpeg 2000
+)
+VIDEO_SIGNATURES = (
+    b'\x1aE\xdf\xa3',  # matroska, webm
+    b'\x00\x00\x01\xba',  # mpeg program stream
+    b'\x00\x00\x01\xb3',
+    b'FLV\x01',
+    b'0&\xb2u\x8ef\xcf\x11',  # asf (wmv)
+)
+OTHER_SIGNATURES = (
+    b'%PDF',
+    b'PK\x03\x04',  # zip and zip based documents
+    b'PK\x05\x06',
+    b'\x1f\x8b',  # gzip
+    b'BZh',
+    b'\xfd7zXZ\x00',
+    b'7z\xbc\xaf\x27\x1c',
+    b'Rar!\x1a\x07',
+    b'SQLite format 3\x00',
+    b'\x7fELF',
+    b'MZ',  # windows executables
+    b'\xca\xfe\xba\xbe',  # java class, mach-o universal binaries
+    b'ID3',  # mp3
+    b'fLaC',
+)
+# major brands of the ftyp box for still images, every other brand is a movie
+IMAGE_BRANDS = (b'heic', b'heix', b'heim', b'heis', b'mif1', b'msf1', b'avif', b'avis', b'crx ')
+# top level atoms of old QuickTime movies without a ftyp box
+QUICKTIME_ATOMS = (b'moov', b'mdat', b'wide', b'free', b'skip', b'pnot')
+# plain text files, only used when the content has none of the media signatures
+TEXT_EXTENSIONS = ('.txt', '.csv', '.json', '.log', '.md', '.ini', '.cfg', '.yml', '.yaml', '.htm', '.html',
+                   '.css', '.js', '.py', '.sh', '.bat', '.srt', '.nfo', '.url')
+
+
+def classify(file_path: str) -> (SourceFileType, None):
+    """
+    Classify a file by its first bytes and its extension before any metadata is read.
+    Returns IMAGE or VIDEO for known media signatures, UNKNOWN for files which are known not to be media
+    (documents, archives, executables, audio, text) and None when only exiftool can tell
+    """
+    try:
+        with open(file_path, 'rb') as file:
+            header = file.read(HEADER_SIZE)
+    except OSError:
+        return None
+    return classify_header(header, file_path)
+
+
+def classify_header(header: bytes, file_path: str) -> (SourceFileType, None):
+    """
+    classify() for the first HEADER_SIZE bytes of the file, read by the caller
+    """
+    if header.startswith(IMAGE_SIGNATURES):
+        return SourceFileType.IMAGE
+    if header.startswith(VIDEO_SIGNATURES):
+        return SourceFileType.VIDEO
+    if header[4:8] == b'ftyp':
+        return SourceFileType.IMAGE if header[8:12] in IMAGE_BRANDS else SourceFileType.VIDEO
+    if header[4:8] in QUICKTIME_ATOMS:
+        return SourceFileType.VIDEO
+    if header.startswith(b'RIFF'):
+        if header[8:12] == b'WEBP':
+            return SourceFileType.IMAGE
+        if header[8:12] == b'AVI ':
+            return SourceFileType.VIDEO
+        if header[8:12] == b'WAVE':
+            return SourceFileType.UNKNOWN
+        return None
+    if header.startswith(OTHER_SIGNATURES):
+        return SourceFileType.UNKNOWN
+    if os.path.splitext(file_path)[1].lower() in TEXT_EXTENSIONS:
+        return SourceFileType.UNKNOWN
+    return None
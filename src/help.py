@@ -43,6 +43,8 @@ OPTIONS
         This is useful when working with a big collection of files and the
         remaining free space is not enough to make a copy of the INPUTDIR. 
         It will delete empty directories in INPUTDIR.
+        Files are renamed on the same file system, across file systems they are copied and the
+        source is only removed once the checksum of the copy matches.
 
     -l | --link
         Instead of copying the process will make hard links to all files in INPUTDIR and place them in the OUTPUTDIR.
@@ -65,6 +67,8 @@ OPTIONS
 
     -n | --output-name
         Specify output filename(w/o extension) format (default: '%Y%m%d-%H%M%S')            
+        Besides the strftime directives {{stem}} is replaced with the original file name without its
+        extension, e.g. '%Y%m%d-{{stem}}'.
 
     -o | --original-names
         Organize the files in selected format or using the default year/month/day format but keep original filenames.
@@ -99,5 +103,130 @@ OPTIONS
 
     -y | --dry-run
         Don't move any files, just show which changes would be done.
+
+    --exiftool-sessions
+        Number of persistent exiftool processes (default: number of workers).
+        Exiftool is started once in "-stay_open" mode and reused for every file instead of
+        being started per file. More sessions allow several metadata requests to be in flight at once.
+
+    --prefetch
+        Read the metadata of up to this many files of a directory with a single exiftool call (default: 100).
+        Use 0 or 1 to read the metadata file by file. Dates taken from file names or timestamps are
+        written back to the CreateDate tag in batches of the same size.
+
+    --workers
+        Number of files processed at the same time (default: 1).
+        Metadata reading, exif writing and transfers of different files run in parallel.
+        Listing the input and reading metadata always run ahead of the transfers.
+        The result is the same as with a single worker: files which compete for the same
+        target name are still placed in the input order.
+
+    --exiftool-only
+        Read the metadata of all files with exiftool. By default the dates of JPEG, TIFF based
+        RAW files (TIFF, CR2, NEF, ARW, DNG, ...), MP4, MOV, 3GP and HEIC files are read directly
+        from the file headers, files which are known not to be media (documents, archives, text, ...)
+        by their first bytes are not read at all and exiftool is only used for other files and for
+        files the built-in reader can't handle.
+
+    --no-cache
+        Don't use the metadata cache. By default the exif data of every file is cached in
+        ~/.cache/phockup and reused as long as the device, inode, size and modification time of the file
+        are unchanged.
+
+    --rebuild-cache
+        Drop all cached metadata and read every file again.
+
+    --cache-file
+        Specify the file of the metadata cache.
+
+    --content-index
+        Detect duplicates by their content no matter what they are named.
+        The files of the output directories are kept in an index (~/.cache/phockup/content-index.sqlite)
+        with their size and hashes. Hashes are only computed for files of the same size and stored,
+        so each file of the library is read at most once.
+
+    --rebuild-content-index
+        Index the output directories again (implies --content-index).
+
+    --dedup-input
+        Detect files with the same content within the input (e.g. a phone backup and a Takeout export)
+        and transfer them only once. Files are compared by size, then by a hash of their head and tail
+        and only then by a full hash, computed in parallel. Files which get a date written back are
+        not compared.
+
+    --copy-engine
+        How files are copied: auto (default), reflink, kernel or python.
+        auto clones the file on file systems with reflink support (btrfs, XFS, ...), otherwise the data
+        is copied by the kernel (copy_file_range, sendfile) and only as a last resort in user space.
+        reflink fails for files which can't be cloned, kernel never clones and python always copies
+        in user space. The method used is logged for every copied file.
+
+    --report
+        Write a JSON report of the run to this file: the counters and, for every stage (metadata,
+        date, dedup, date_write, allocate, compare, transfer), the number of calls, the time spent,
+        its share of the time of all stages, the bytes and a latency histogram.
+
+    --prometheus
+        Write the same metrics in the Prometheus text format to this file, e.g.
+        /var/lib/node_exporter/textfile_collector/phockup.prom for the textfile collector.
+
+    --verbose
+        Show a line for every processed file. By default these lines are only written to the log file
+        (-g | --log-filename) and a progress line with the files/s, MB/s and the estimated time left
+        is shown instead.
+
+    --no-progress
+        Don't show the progress line.
+
+    --journal
+        Append every operation to this journal file: the source, the target, the strategy and whether
+        it is planned, done, a duplicate or skipped. The journal is synced to disk in batches.
+
+    --resume
+        Continue an interrupted run from its journal (implies --journal). Files the journal records as
+        completed are skipped without being read again, moves and copies which were interrupted are
+        finished when the target is complete and rolled back otherwise. Use the same input, output
+        and options as the interrupted run.
+
+    --plan-out
+        Write the decision for every file to this JSON lines file: its type, date, target path,
+        whether it is a duplicate or skipped and the date written back to CreateDate, if any.
+        Usually combined with --dry-run to review the plan before applying it.
+
+    --apply
+        Execute a plan written by --plan-out without reading any metadata. Files whose size or
+        modification time changed since the plan was made are skipped. The strategy (copy, --move,
+        --link) is taken from the options of this run.
+
+    --limit-bytes
+        Limit the data copied, hashed and rewritten by exiftool to this many bytes per second,
+        e.g. 500K or 20M. Moves within a file system and links are not limited.
+
+    --limit-files
+        Limit the files transferred and written back by exiftool to this many per second.
+
+    --throttle-file
+        Change the limits while running: this file is checked every second and on SIGHUP for
+        bytes_per_second=20M and files_per_second=100 lines, each overriding its option.
+
+    --nice
+        Add this value to the nice value of phockup and its exiftool processes.
+
+    --ionice
+        I/O scheduling class of phockup and its exiftool processes: idle, best-effort or realtime,
+        with an optional level, e.g. best-effort:7. Uses the ionice command of util-linux.
+
+    --watch
+        Keep running and process new files as they arrive in INPUTDIR, until interrupted or SIGTERM.
+        The files already in INPUTDIR are processed first. Uses inotify on Linux and polls the input
+        every 10 seconds elsewhere.
+
+    --watch-settle
+        Seconds the size and modification time of a new file have to stay the same before it is
+        processed, so files which are still being written are not picked up. Defaults to 2.
+
+    --watch-poll
+        Poll the input every this many seconds instead of using inotify (implies --watch), e.g. for
+        network shares where inotify does not see changes made by other machines.
 """.format(version=version,
            regex="(?P<day>\d{2})\.(?P<month>\d{2})\.(?P<year>\d{4})[_-]?(?P<hour>\d{2})\.(?P<minute>\d{2})\.(?P<second>\d{2})"))
\ No newline at end of file
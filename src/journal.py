@@ -0,0 +1,117 @@
+import json
+import os
+import threading
+import time
+
+from src.content_index import FileDigest
+from src.copy_engine import partial_path
+
+PLANNED = 'planned'
+DONE = 'done'
+DUPLICATE = 'duplicate'
+SKIPPED = 'skipped'
+ROLLED_BACK = 'rolled_back'
+# the source needs no more work when its last entry has one of these states
+COMPLETED = (DONE, DUPLICATE, SKIPPED)
+
+
+class Journal(object):
+    """
+    Append-only journal of the operations of a run, one JSON line per entry:
+    {"source": ..., "target": ..., "strategy": "move" | "link" | "copy", "status": ...}.
+    An operation is journaled as planned before it starts and with its outcome once it is finished.
+    Lines are written and fsync'd in batches of `batch_size` entries or at least every `interval` seconds,
+    a crash loses at most the last batch: the operations of a lost batch are simply done again
+    """
+
+    def __init__(self, path: str, batch_size: int = 100, interval: float = 1.0):
+        self.path = path
+        self.batch_size = max(1, batch_size)
+        self.interval = interval
+        self._pending = []
+        self._synced = time.monotonic()
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._file = open(path, 'a', encoding='utf-8')
+
+    @staticmethod
+    def load(path: str) -> dict:
+        """
+        The last entry of every source, a line cut off by a crash is ignored
+        """
+        entries = {}
+        with open(path, encoding='utf-8') as file:
+            for line in file:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                if isinstance(entry, dict) and 'source' in entry:
+                    entries[entry['source']] = entry
+        return entries
+
+    @staticmethod
+    def key(file_path: str) -> str:
+        return os.path.abspath(file_path)
+
+    def record(self, source: str, target: (str, None), strategy: str, status: str):
+        line = json.dumps({'source': Journal.key(source), 'target': None if target is None else Journal.key(target),
+                           'strategy': strategy, 'status': status}) + '\n'
+        with self._lock:
+            self._pending.append(line)
+            if len(self._pending) >= self.batch_size or time.monotonic() - self._synced >= self.interval:
+                self.__sync()
+
+    def flush(self):
+        with self._lock:
+            self.__sync()
+
+    def close(self):
+        with self._lock:
+            self.__sync()
+            self._file.close()
+
+    def __sync(self):
+        if self._pending:
+            self._file.write(''.join(self._pending))
+            self._pending = []
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._synced = time.monotonic()
+
+    @staticmethod
+    def recover(entry: dict) -> str:
+        """
+        Finish or roll back an operation which was planned but not journaled as finished.
+        A target with the content of the source is kept and the operation is finished, the partial
+        file of an interrupted copy is removed and the file is transferred again. A target is
+        never removed: a copy only gets its name once it is complete. Returns DONE or ROLLED_BACK
+        """
+        source, target, strategy = entry['source'], entry['target'], entry['strategy']
+        if target is None:
+            return ROLLED_BACK
+        if os.path.lexists(partial_path(target)):
+            os.remove(partial_path(target))
+        if not os.path.lexists(target):
+            return ROLLED_BACK
+        if not os.path.lexists(source):
+            # the source was moved already, the target is all that is left of the file
+            return DONE
+        if strategy == 'link':
+            if os.path.samefile(source, target):
+                return DONE
+        elif Journal.__same(source, target):
+            if strategy == 'move':
+                os.remove(source)
+            return DONE
+        # the name was taken by another file, the source gets the next free one
+        return ROLLED_BACK
+
+    @staticmethod
+    def __same(source: str, target: str) -> bool:
+        try:
+            return FileDigest(source).same(FileDigest(target))
+        except OSError:
+            return False
@@ -0,0 +1,148 @@
+import bisect
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# upper bounds in seconds of the latency buckets, the last bucket takes everything above
+BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+class Histogram(object):
+    __slots__ = ('count', 'seconds', 'bytes', 'buckets')
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.bytes = 0
+        self.buckets = [0] * (len(BUCKETS) + 1)
+
+    def observe(self, seconds: float, size: int = 0):
+        self.count += 1
+        self.seconds += seconds
+        self.bytes += size
+        self.buckets[bisect.bisect_left(BUCKETS, seconds)] += 1
+
+    def quantile(self, q: float) -> (float, None):
+        """
+        Upper bound of the bucket holding the quantile
+        """
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for index, count in enumerate(self.buckets):
+            seen += count
+            if seen >= rank:
+                return BUCKETS[index] if index < len(BUCKETS) else float('inf')
+        return float('inf')
+
+
+class Metrics(object):
+    """
+    Counts, latency histograms and bytes of the stages of a run.
+    The stages do not overlap, so their share of the summed time shows where a run spends it;
+    with several workers the summed time of a stage can exceed the wall time
+    """
+
+    def __init__(self):
+        self.started = time.time()
+        self._start = time.perf_counter()
+        self._stages = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def timed(self, stage: str, size: int = 0):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - start, size)
+
+    def observe(self, stage: str, seconds: float, size: int = 0):
+        with self._lock:
+            histogram = self._stages.get(stage)
+            if histogram is None:
+                histogram = self._stages[stage] = Histogram()
+            histogram.observe(seconds, size)
+
+    def seconds(self) -> float:
+        return time.perf_counter() - self._start
+
+    def report(self, counters: (dict, None) = None) -> dict:
+        with self._lock:
+            stages = dict((stage, (histogram.count, histogram.seconds, histogram.bytes, list(histogram.buckets),
+                                   histogram.quantile(0.5), histogram.quantile(0.99)))
+                          for stage, histogram in self._stages.items())
+        total = sum(values[1] for values in stages.values())
+        report = {
+            'started': time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(self.started)),
+            'seconds': round(self.seconds(), 6),
+            'counters': dict(counters or {}),
+            'stages': {},
+        }
+        for stage, (count, seconds, size, buckets, median, p99) in sorted(stages.items()):
+            report['stages'][stage] = {
+                'count': count,
+                'seconds': round(seconds, 6),
+                'share': round(seconds / total, 4) if total else 0.0,
+                'bytes': size,
+                'p50': median,
+                'p99': p99,
+                'buckets': dict(('+Inf' if index == len(BUCKETS) else str(BUCKETS[index]), bucket)
+                                for index, bucket in enumerate(buckets)),
+            }
+        return report
+
+    def write_json(self, path: str, counters: (dict, None) = None):
+        Metrics.__write(path, json.dumps(self.report(counters), indent=2) + '\n')
+
+    def write_prometheus(self, path: str, counters: (dict, None) = None):
+        """
+        Write the metrics in the text format of the Prometheus node exporter's textfile collector
+        """
+        report = self.report(counters)
+        lines = [
+            '# HELP phockup_run_seconds Wall time of the last run.',
+            '# TYPE phockup_run_seconds gauge',
+            'phockup_run_seconds %s' % report['seconds'],
+            '# HELP phockup_run_started_seconds Start of the last run since the epoch.',
+            '# TYPE phockup_run_started_seconds gauge',
+            'phockup_run_started_seconds %d' % self.started,
+            '# HELP phockup_files Files of the last run by counter.',
+            '# TYPE phockup_files gauge',
+        ]
+        for name, value in sorted(report['counters'].items()):
+            lines.append('phockup_files{counter="%s"} %d' % (name, value))
+        lines += [
+            '# HELP phockup_stage_seconds Latency of the stages of the last run.',
+            '# TYPE phockup_stage_seconds histogram',
+        ]
+        for stage, values in sorted(report['stages'].items()):
+            cumulative = 0
+            for bound, count in values['buckets'].items():
+                cumulative += count
+                lines.append('phockup_stage_seconds_bucket{stage="%s",le="%s"} %d' % (stage, bound, cumulative))
+            lines.append('phockup_stage_seconds_sum{stage="%s"} %s' % (stage, values['seconds']))
+            lines.append('phockup_stage_seconds_count{stage="%s"} %d' % (stage, values['count']))
+        lines += [
+            '# HELP phockup_stage_bytes Bytes handled by the stages of the last run.',
+            '# TYPE phockup_stage_bytes gauge',
+        ]
+        for stage, values in sorted(report['stages'].items()):
+            lines.append('phockup_stage_bytes{stage="%s"} %d' % (stage, values['bytes']))
+        Metrics.__write(path, '\n'.join(lines) + '\n')
+
+    @staticmethod
+    def __write(path: str, text: str):
+        """
+        Write to a temporary file and rename it, so readers never see a partial file
+        """
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        temporary = '%s.%d.tmp' % (path, os.getpid())
+        with open(temporary, 'w') as file:
+            file.write(text)
+        os.replace(temporary, path)
@@ -1,12 +1,35 @@
 #!/usr/bin/env python3
-import filecmp
+import glob
 import logging
 import os
-import shutil
+import queue
+import re
+import signal
+import stat
 import sys
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from logging.handlers import QueueHandler, QueueListener
 
-from src.exif import Exif
-from src.source_file import SourceFile, SourceFileType
+from src.cache import MetadataCache
+from src.content_index import ContentIndex, DuplicateFinder, FileDigest
+from src.copy_engine import CopyEngine
+from src.date import Date
+from src.exif import CreateDateWriter, Exif
+from src.exif_reader import classify_and_read
+from src.exiftool import ExifToolPool
+from src.file_type import classify
+from src.journal import COMPLETED, DONE, DUPLICATE, PLANNED, ROLLED_BACK, SKIPPED, Journal
+from src.metrics import Metrics
+from src.pipeline import buffered
+from src.plan import DUPLICATE as PLANNED_DUPLICATE, SKIPPED as PLANNED_SKIPPED, TRANSFER, PlannedFile, \
+    PlanWriter, read_plan
+from src.progress import Progress
+from src.sidecar import SIDECAR_EXTENSIONS, group_sidecars, sidecar_target
+from src.source_file import UNCLASSIFIED, RunConfig, SourceFile, SourceFileType
+from src.target_index import TargetIndex
+from src.throttle import io_throttle, set_priority
+from src.watch import create_watcher
 
 ignored_files = (".DS_Store", "Thumbs.db")
 ignored_folders = (".@__thumb")
@@ -14,13 +37,17 @@ ignored_folders = (".@__thumb")
 
 class Phockup():
     def __init__(self, input_path, **args):
-        filecmp.clear_cache()
-        self.log = self.setup_logger(args.get('log_file_name', None))
+        self.verbose = args.get('verbose', False)
+        self.log = self.setup_logger(args.get('log_file_name', None), self.verbose)
+        self.metrics = Metrics()
+        self.report_path = args.get('report_path', None)
+        self.prometheus_path = args.get('prometheus_path', None)
         self.counter_all_files = 0
         self.counter_video_files = 0
         self.counter_image_files = 0
         self.counter_unknown_files = 0
         self.counter_duplicates = 0
+        self.counter_input_duplicates = 0
         self.counter_processed_files = 0
         self.log.info("Start processing....")
         input_path = os.path.expanduser(input_path)
@@ -58,23 +85,202 @@ class Phockup():
         if self.dry_run:
             self.log.info("Dry run only, not moving files only showing changes")
 
+        self.workers = max(1, args.get('workers', 1))
+        self.setup_throttle(args)
+        # the progress line and the lines about every file would overwrite each other
+        self.progress = Progress() if args.get('progress', False) and not self.verbose else None
+        self.lock = threading.Lock()
+        # any object with the interface of ExifToolPool can stand in for exiftool
+        self.exiftool = args.get('exiftool', None) or ExifToolPool(
+            size=args.get('exiftool_sessions', None) or self.workers)
+        self.prefetch_size = args.get('prefetch_size', 100)
+        self.date_writer = CreateDateWriter(self.exiftool, batch_size=self.prefetch_size)
+        self.date_writes = {}
+        self.native = args.get('native', True)
+        self.cache = self.setup_cache(args)
+        self.content_index = self.setup_content_index(args)
+        self.file_config = RunConfig(
+            output_file_name_format=self.output_file_name_format,
+            dir_format=self.dir_format,
+            date_regex=self.date_regex,
+            timestamp=self.timestamp,
+            date_field=self.date_field,
+            original_filenames=self.original_filenames,
+            images_output_path=self.images_output_path,
+            videos_output_path=self.videos_output_path,
+            unknown_output_path=self.unknown_output_path,
+            exiftool=self.exiftool,
+            cache=self.cache,
+            native=self.native,
+            metrics=self.metrics
+        )
+        self.target_index = TargetIndex()
+        self.copy_engine = CopyEngine(args.get('copy_engine', 'auto'))
+        self.duplicate_finder = DuplicateFinder(max(2, self.workers)) if args.get('dedup_input', False) else None
+        self.source_digests = {}
+        self.digest_sources = {}
+        self.input_duplicates = {}
+        self.placed_targets = {}
+        # primary file => its sidecar files, resolved from the directory listings
+        self.sidecars = {}
+        # directory => {primary file => its target} of the files transferred while watching,
+        # a sidecar which arrives after its primary file follows it there
+        self.primary_targets = {}
+        self.strategy = 'move' if self.move else 'link' if self.link else 'copy'
+        self.resume = args.get('resume', False)
+        self.journal = self.setup_journal(args)
+        self.completed = set()
+        self.plan = PlanWriter(args['plan_path']) if args.get('plan_path', None) else None
+        self.apply_path = args.get('apply_path', None)
+        self.counter_plan_changed = 0
+        self.watch = args.get('watch', False)
+        self.watch_settle = args.get('watch_settle', 2.0)
+        self.watch_poll = args.get('watch_poll', None)
+        # set to end watching, e.g. by SIGTERM
+        self.watch_stop = args.get('watch_stop', None) or threading.Event()
+
         self.log_config()
         try:
             self.log.info("Checking directories...")
             self.check_directories()
+            if self.resume and self.journal is not None:
+                self.resume_journal()
             self.log.info("Processing files...")
-            self.walk_directory()
+            if self.apply_path is not None:
+                self.apply_plan()
+            elif self.watch:
+                self.watch_input()
+            else:
+                self.walk_directory()
             self.log.info(
                 "All files are processed: %d duplicates from %d files" % (
                     self.counter_duplicates, self.counter_processed_files))
             self.log.info("Processed images: %d, videos: %d, unknown %d from %d" % (
                 self.counter_image_files, self.counter_video_files, self.counter_unknown_files, self.counter_all_files))
-            self.log.handlers = []
+            if self.duplicate_finder is not None:
+                self.log.info("Duplicates within the input: %d" % self.counter_input_duplicates)
+            if self.apply_path is not None:
+                self.log.info("Files changed since the plan was made: %d" % self.counter_plan_changed)
+            if self.plan is not None:
+                self.log.info("Plan of %d files written to %s" % (self.plan.count, self.plan.path))
+            if self.cache is not None:
+                self.log.info("Metadata cache: %d hits, %d misses" % (self.cache.hits, self.cache.misses))
+            if self.copy_engine.used:
+                self.log.info("Copied files: %s" % ', '.join(
+                    '%s %d' % (method, count) for method, count in sorted(self.copy_engine.used.items())))
+            if self.copy_engine.moved:
+                self.log.info("Moved files: %s" % ', '.join(
+                    '%s %d' % (method, count) for method, count in sorted(self.copy_engine.moved.items())))
+            self.log_stages()
+            self.write_reports()
+            self.close()
+            self.stop_logger()
         except Exception as ex:
             self.log.exception(ex, exc_info=True)
-            self.log.handlers = []
+            self.close()
+            self.stop_logger()
             sys.exit(1)
 
+    def counters(self) -> dict:
+        return {
+            'all': self.counter_all_files,
+            'images': self.counter_image_files,
+            'videos': self.counter_video_files,
+            'unknown': self.counter_unknown_files,
+            'processed': self.counter_processed_files,
+            'duplicates': self.counter_duplicates,
+            'input_duplicates': self.counter_input_duplicates,
+        }
+
+    def log_stages(self):
+        stages = self.metrics.report()['stages']
+        if stages:
+            self.log.info("Time per stage: %s" % ', '.join(
+                '%s %.1fs (%d%%)' % (stage, values['seconds'], round(100 * values['share']))
+                for stage, values in sorted(stages.items(), key=lambda item: -item[1]['seconds'])))
+
+    def write_reports(self):
+        if self.report_path is not None:
+            self.metrics.write_json(self.report_path, self.counters())
+            self.log.info("Run report written to %s" % self.report_path)
+        if self.prometheus_path is not None:
+            self.metrics.write_prometheus(self.prometheus_path, self.counters())
+            self.log.info("Prometheus metrics written to %s" % self.prometheus_path)
+
+    def setup_throttle(self, args):
+        """
+        Apply the process priority before exiftool is started, it inherits it, and the I/O limits of the run
+        """
+        for warning in set_priority(args.get('nice', None), args.get('ionice', None)):
+            self.log.warning(warning)
+        io_throttle.configure(args.get('bytes_per_second', 0), args.get('files_per_second', 0),
+                              args.get('throttle_file', None))
+        if io_throttle.control_file is not None:
+            io_throttle.handle_signals()
+        if io_throttle.limited:
+            self.log.info("Limiting I/O to %s bytes/s and %s files/s" % tuple(
+                '%g' % rate if rate else 'unlimited' for rate in (io_throttle.bytes.rate, io_throttle.files.rate)))
+
+    def setup_journal(self, args) -> (Journal, None):
+        path = args.get('journal_path', None)
+        if path is None or self.dry_run:
+            return None
+        return Journal(path, batch_size=self.prefetch_size)
+
+    def resume_journal(self):
+        """
+        Finish or roll back the operations of the interrupted run which were planned but not finished,
+        the sources completed by it are skipped without being probed again
+        """
+        finished = 0
+        rolled_back = 0
+        for source, entry in Journal.load(self.journal.path).items():
+            status = entry['status']
+            if status == PLANNED:
+                status = Journal.recover(entry)
+                self.journal.record(source, entry['target'], entry['strategy'], status)
+                if status == DONE:
+                    finished += 1
+                else:
+                    rolled_back += 1
+            if status in COMPLETED:
+                self.completed.add(source)
+        self.journal.flush()
+        self.log.info("Resuming from %s: %d files completed, %d interrupted operations finished, %d rolled back" % (
+            self.journal.path, len(self.completed), finished, rolled_back))
+
+    def close(self):
+        if self.journal is not None:
+            self.journal.close()
+        if self.plan is not None:
+            self.plan.close()
+        self.date_writer.flush()
+        if self.duplicate_finder is not None:
+            self.duplicate_finder.close()
+        self.exiftool.close()
+        if self.cache is not None:
+            self.cache.flush()
+
+    def setup_cache(self, args) -> (MetadataCache, None):
+        if not args.get('cache', False):
+            return None
+        try:
+            return MetadataCache(path=args.get('cache_path', None), rebuild=args.get('rebuild_cache', False))
+        except Exception as ex:
+            self.log.warning("Metadata cache is disabled: %s" % ex)
+            return None
+
+    def setup_content_index(self, args) -> (ContentIndex, None):
+        if not args.get('content_index', False):
+            return None
+        try:
+            return ContentIndex([self.images_output_path, self.videos_output_path, self.unknown_output_path],
+                                path=args.get('content_index_path', None),
+                                rebuild=args.get('rebuild_content_index', False))
+        except Exception as ex:
+            self.log.warning("Content index is disabled: %s" % ex)
+            return None
+
     def log_config(self):
         self.log.info('Config:')
         if self.images_output_path is None:
@@ -99,29 +305,80 @@ class Phockup():
 
         self.log.info("OutputDir format: %s" % self.dir_format)
 
+        self.log.info("Workers: %d" % self.workers)
+
+        self.log.info("Exiftool sessions: %d" % self.exiftool.size)
+
+        self.log.info("Copy engine: %s" % self.copy_engine.engine)
+
+        if self.duplicate_finder is not None:
+            self.log.info("Find duplicates within the input")
+
+        if self.journal is not None:
+            self.log.info("Journal: %s" % self.journal.path)
+
+        if not self.native:
+            self.log.info("Read all metadata with exiftool")
+
+        if self.cache is None:
+            self.log.info("Metadata cache is not used")
+        else:
+            self.log.info("Metadata cache: %s" % self.cache.path)
+
+        if self.content_index is not None:
+            self.log.info("Detect duplicates by content using index: %s" % self.content_index.path)
+
+        if self.prefetch_size > 1:
+            self.log.info("Prefetch metadata for up to %d files per exiftool call" % self.prefetch_size)
+
         if self.link:
             self.log.info("Using link strategy!")
 
         if self.move:
             self.log.info("Using move strategy!")
 
-    def setup_logger(self, log_file_name=None):
+    def setup_logger(self, log_file_name=None, verbose=False):
+        """
+        The handlers write in a background thread, so logging never waits for the terminal or the disk.
+        The lines about every single file are logged at DEBUG level: they are always written to the log file
+        but only shown on the screen when verbose
+        """
         formatter = logging.Formatter(fmt='%(asctime)s %(levelname)-8s %(message)s',
                                       datefmt='%Y-%m-%d %H:%M:%S')
 
         logger = logging.getLogger()
-        logger.setLevel(logging.DEBUG)
+        logger.setLevel(logging.DEBUG if verbose or log_file_name is not None else logging.INFO)
         screen_handler = logging.StreamHandler(stream=sys.stdout)
         screen_handler.setFormatter(formatter)
+        screen_handler.setLevel(logging.DEBUG if verbose else logging.INFO)
+        handlers = [screen_handler]
 
         if log_file_name is not None:
             handler = logging.FileHandler(log_file_name, mode='a')
             handler.setFormatter(formatter)
-            logger.addHandler(handler)
+            handlers.insert(0, handler)
 
-        logger.addHandler(screen_handler)
+        self.log_listener = QueueListener(queue.Queue(), *handlers, respect_handler_level=True)
+        self.log_listener.start()
+        logger.addHandler(QueueHandler(self.log_listener.queue))
         return logger
 
+    def stop_logger(self):
+        """
+        Write the queued log records and detach the handlers
+        """
+        listener, self.log_listener = self.log_listener, None
+        if listener is not None:
+            listener.stop()
+        self.log.handlers = []
+
+    def log_file(self, file_path: str, message: str):
+        """
+        Log a line about a single file, the path is only escaped when the line is written at all
+        """
+        if self.log.isEnabledFor(logging.DEBUG):
+            self.log.debug(file_path.encode('unicode-escape').decode('utf-8') + message)
+
     def get_path_param(self, param_name, params):
         path = params.get(param_name, None)
         path = None if path is None else os.path.expanduser(path)
@@ -169,141 +426,716 @@ class Phockup():
 
     def walk_directory(self):
         """
-        Walk input directory recursively and call process_file for each file except the ignored ones
+        Process the input as a pipeline of stages connected by bounded buffers:
+        scan (os.scandir) => probe (metadata, CreateDate writes queued) => plan (placement order) => transfer.
+        Scanning and probing run ahead in their own threads while the files are transferred by a pool of workers,
+        so listing the next directory overlaps with copying the previous one and the memory used stays flat.
+        Files which may compete for the same target name are placed one after another in the walking order,
+        so the generated suffixes are the same as in a sequential run
+        """
+        chunk_size = max(1, self.prefetch_size)
+        roots = []
+
+        if self.progress is not None:
+            threading.Thread(target=self.count_input, daemon=True).start()
+
+        with ThreadPoolExecutor(max_workers=self.workers) as probe_pool:
+            chunks = buffered(self.scan_input(roots, chunk_size), 2)
+            self.place_files(buffered(self.probe_chunks(chunks, probe_pool), chunk_size * 2))
+
+        for root in roots:
+            self.remove_empty_dir(root)
+
+    def watch_input(self):
+        """
+        Keep running and process the files of the input as they arrive, until interrupted or SIGTERM.
+        The files already in the input are processed first. A file is processed once its size and modification
+        time stop changing, exiftool, the caches and the indexes of the output stay loaded between the batches
+        """
+        watcher = create_watcher(self.input_path, self.watch_settle, self.watch_poll,
+                                 ignored_files=ignored_files, ignored_folders=ignored_folders,
+                                 excluded=(self.images_output_path, self.videos_output_path,
+                                           self.unknown_output_path))
+        self.log.info("Watching %s for new files (%s)" % (self.input_path, watcher.name))
+        # a progress line has no end while watching
+        self.progress = None
+        handler = None
+        if threading.current_thread() is threading.main_thread():
+            handler = signal.signal(signal.SIGTERM, lambda signum, frame: self.watch_stop.set())
+        try:
+            while not self.watch_stop.is_set():
+                file_paths = watcher.ready(timeout=1.0)
+                if file_paths:
+                    self.process_batch(file_paths)
+                    watcher.mark_known(file_paths)
+        except KeyboardInterrupt:
+            self.log.info("Watching stopped")
+        finally:
+            watcher.close()
+            if handler is not None:
+                signal.signal(signal.SIGTERM, handler)
+
+    def process_batch(self, file_paths: list):
+        """
+        Process a batch of files sorted by their directory through the probe and transfer stages
+        """
+        batch = []
+        ready = set(file_paths)
+        for root in sorted(set(os.path.dirname(file_path) for file_path in file_paths)):
+            listing = Phockup.list_directory(root)
+            placed = self.place_late_sidecars(root, listing, ready)
+            # a sidecar arriving before its primary file waits for it, the primary file takes it along
+            batch.extend(self.register_sidecars([file_path for file_path in listing if file_path not in placed],
+                                                ready))
+        file_paths = batch
+        if self.completed:
+            file_paths = [file_path for file_path in file_paths if Journal.key(file_path) not in self.completed]
+        if not file_paths:
+            return
+        chunk_size = max(1, self.prefetch_size)
+        chunks = []
+        for file_path in file_paths:
+            root = os.path.dirname(file_path)
+            if not chunks or chunks[-1][0] != root or len(chunks[-1][1]) >= chunk_size:
+                chunks.append((root, []))
+            chunks[-1][1].append(file_path)
+        self.log.info("Processing %d new files" % len(file_paths))
+
+        with ThreadPoolExecutor(max_workers=self.workers) as probe_pool:
+            self.place_files(self.probe_chunks(iter(chunks), probe_pool))
+
+        self.date_writer.flush()
+        if self.journal is not None:
+            self.journal.flush()
+        if self.cache is not None:
+            self.cache.flush()
+        self.write_reports()
+        if self.move and not self.dry_run:
+            for root in sorted(set(root for root, chunk in chunks), reverse=True):
+                # the watched input itself is kept
+                while root != self.input_path and root.startswith(self.input_path + os.path.sep):
+                    try:
+                        os.rmdir(root)
+                    except OSError:
+                        break
+                    root = os.path.dirname(root)
+
+    def place_late_sidecars(self, root: str, file_paths: list, ready: set) -> set:
+        """
+        Transfer the ready sidecars of files transferred by an earlier batch next to their targets,
+        also when the primary file was moved away already. Returns the sidecars handled this way
+        """
+        with self.lock:
+            targets = dict(self.primary_targets.get(root, {}))
+        placed = set()
+        if not targets:
+            return placed
+        primaries, sidecars = group_sidecars(list(set(file_paths) | set(targets)))
+        for primary, primary_sidecars in sorted(sidecars.items()):
+            if primary not in targets or primary in ready:
+                continue
+            for sidecar in primary_sidecars:
+                if sidecar in ready:
+                    self.process_sidecar(primary, sidecar, targets[primary])
+                    placed.add(sidecar)
+        return placed
+
+    def place_files(self, phockup_files):
+        """
+        Plan and transfer stages: submit the files to the pool of workers in their order,
+        a file waits for the earlier file competing for the same target name and for its original
+        when it is a duplicate within the input
+        """
+        placements = {}
+        in_progress = {}
+        errors = []
+        in_flight = threading.BoundedSemaphore(self.workers * 2)
+
+        def placed(future):
+            in_flight.release()
+            if future.exception() is not None:
+                errors.append(future.exception())
+            elif self.progress is not None:
+                self.progress.advance(files=1)
+
+        with ThreadPoolExecutor(max_workers=self.workers) as transfer_pool:
+            try:
+                for phockup_file in phockup_files:
+                    key = Phockup.placement_key(phockup_file)
+                    with self.lock:
+                        original = self.input_duplicates.get(phockup_file.file_path)
+                    in_flight.acquire()
+                    placement = transfer_pool.submit(self.place_file, phockup_file, placements.get(key),
+                                                     in_progress.get(original))
+                    placement.add_done_callback(placed)
+                    placements[key] = placement
+                    in_progress[phockup_file.file_path] = placement
+
+                    if len(in_progress) > self.workers * 2:
+                        for done in [key for key, placement in placements.items() if placement.done()]:
+                            del placements[done]
+                        for done in [path for path, placement in in_progress.items() if placement.done()]:
+                            del in_progress[done]
+                    if errors:
+                        raise errors[0]
+            finally:
+                phockup_files.close()
+
+        if self.progress is not None:
+            self.progress.finish()
+        if errors:
+            raise errors[0]
+
+    def apply_plan(self):
+        """
+        Execute the decisions of a plan written by --plan-out without reading any metadata.
+        Sources whose size or modification time changed since the plan was made are skipped,
+        duplicates are handled once all planned transfers are done, so the files they duplicate exist
+        """
+        roots = set()
+        duplicates = []
+
+        def planned_files():
+            for entry, changed in read_plan(self.apply_path):
+                if changed:
+                    self.log.warning("%s => skipped, changed since the plan was made" % entry['source'])
+                    with self.lock:
+                        self.counter_plan_changed += 1
+                    continue
+                phockup_file = PlannedFile(entry)
+                self.register_file(phockup_file)
+                root = os.path.dirname(phockup_file.file_path)
+                if root not in roots:
+                    # a plan only holds the primary files, their sidecars are looked up once per directory
+                    self.register_sidecars(Phockup.list_directory(root))
+                    roots.add(root)
+                if phockup_file.status == PLANNED_DUPLICATE:
+                    duplicates.append(phockup_file)
+                else:
+                    yield phockup_file
+
+        self.place_files(buffered(planned_files(), max(1, self.prefetch_size) * 2))
+        for phockup_file in duplicates:
+            self.apply_duplicate(phockup_file)
+
+        for root in sorted(roots, reverse=True):
+            self.remove_empty_dir(root)
+
+    def apply_duplicate(self, phockup_file: PlannedFile):
+        """
+        Handle a file planned as a duplicate, a file whose planned duplicate has a different content
+        by now is transferred to its planned target instead
+        """
+        file_path = phockup_file.file_path
+        duplicate = phockup_file.duplicate_of
+        planned_source = self.target_index.planned_source(duplicate)
+        if not os.path.isfile(duplicate) and planned_source is None:
+            self.log.warning("%s => skipped, the planned duplicate '%s' does not exist" % (file_path, duplicate))
+            return
+        try:
+            # compared by size first, the full hashes are only computed for files of the same size
+            source = FileDigest(file_path)
+            target = FileDigest(planned_source or duplicate)
+            same = source.size == target.size and source.full == target.full
+        except FileNotFoundError:
+            self.log_file(file_path, ' => skipped, no such file or directory')
+            return
+        if not same:
+            self.log.warning("%s => the planned duplicate '%s' changed since the plan was made, transfer the file"
+                             % (file_path, duplicate))
+            self.place_file(phockup_file)
+            return
+        with self.lock:
+            self.counter_processed_files += 1
+            self.counter_duplicates += 1
+        if self.journal is not None:
+            self.journal.record(file_path, duplicate, self.strategy, DUPLICATE)
+        if self.plan is not None:
+            self.plan.write(phockup_file, PLANNED_DUPLICATE, target=phockup_file.target_file_path(),
+                            duplicate_of=duplicate)
+        if self.move:
+            if not self.dry_run:
+                os.remove(file_path)
+            self.log_file(file_path, " => remove, duplicated file('%s')" % duplicate)
+        else:
+            self.log_file(file_path, " => skipped, duplicated file ('%s')" % duplicate)
+
+    def scan_input(self, roots: list, chunk_size: int):
+        """
+        Scan stage: yield (root, chunk of file paths) for every input directory, every visited root
+        is appended to `roots`
+        """
+        for root, file_paths in self.walk_input():
+            roots.append(root)
+            file_paths = self.register_sidecars(file_paths)
+            if self.completed:
+                file_paths = [file_path for file_path in file_paths if Journal.key(file_path) not in self.completed]
+            for index in range(0, len(file_paths), chunk_size):
+                yield root, file_paths[index:index + chunk_size]
+
+    def probe_chunks(self, chunks, probe_pool: ThreadPoolExecutor):
+        """
+        Probe stage: read the metadata of each chunk with one prefetch call and probe its files in the pool,
+        the probed files are yielded in the walking order
         """
-        for root, dirs, files in os.walk(self.input_path):
+        for root, chunk in chunks:
+            exif_data, file_types = self.prefetch(chunk)
+            chunk_exif = [exif_data.get(os.path.normpath(file_path)) for file_path in chunk]
+            # the dates of the chunk are parsed in one pass, images and videos share the date fields by default
+            exif_dates = [None] * len(chunk) if self.date_field else Date.from_exif_many(chunk_exif)
+            probes = [probe_pool.submit(self.probe_file, file_path, exif, exif_date,
+                                        file_types.get(file_path, UNCLASSIFIED))
+                      for file_path, exif, exif_date in zip(chunk, chunk_exif, exif_dates)]
+            phockup_files = [probe.result() for probe in probes]
+            phockup_files = [phockup_file for phockup_file in phockup_files if phockup_file is not None]
+            if self.duplicate_finder is not None:
+                self.find_input_duplicates(phockup_files)
+            for phockup_file in phockup_files:
+                yield phockup_file
+
+    def find_input_duplicates(self, phockup_files: list):
+        """
+        Find the files of a chunk with the same content as an earlier file of the input,
+        such a file is only placed if its original could not be placed
+        """
+        digests = {}
+        for phockup_file in phockup_files:
+            if phockup_file.skipped or Phockup.needs_date_write(phockup_file):
+                # the content of a file changes when its date is written back
+                continue
+            try:
+                digests[phockup_file.file_path] = FileDigest(phockup_file.file_path)
+            except OSError:
+                continue
+        with self.metrics.timed('dedup'):
+            originals = self.duplicate_finder.resolve(list(digests.values()))
+        with self.lock:
+            for (file_path, digest), original in zip(digests.items(), originals):
+                self.source_digests[file_path] = digest
+                if original is None:
+                    # the path of the digest follows the file when it is moved
+                    self.digest_sources[digest] = file_path
+                else:
+                    self.input_duplicates[file_path] = self.digest_sources[original]
+
+    def count_input(self):
+        """
+        Count the files the walk will yield without logging anything, for the estimate of the progress line
+        """
+        count = 0
+        for root, file_paths in self.walk_input(quiet=True):
+            count += len(group_sidecars(file_paths)[0])
+        self.progress.set_total(count)
+
+    def register_sidecars(self, file_paths: list, primaries: (tuple, None) = None) -> list:
+        """
+        Resolve the sidecars of the files of one directory and return the primary files,
+        the sidecars are transferred with them. Only the given `primaries` are kept if any are given
+        """
+        file_paths, sidecars = group_sidecars(file_paths)
+        if primaries is not None:
+            file_paths = [file_path for file_path in file_paths if file_path in primaries]
+            sidecars = dict((file_path, sidecars[file_path]) for file_path in file_paths if file_path in sidecars)
+        if sidecars:
+            with self.lock:
+                self.sidecars.update(sidecars)
+        return file_paths
+
+    @staticmethod
+    def list_directory(root: str) -> list:
+        """
+        The paths of the files of a directory which are not ignored, for files which don't come from a walk
+        """
+        try:
+            return [os.path.join(root, entry.name) for entry in list(os.scandir(root or '.'))
+                    if entry.name not in ignored_files and not entry.is_dir()]
+        except OSError:
+            return []
+
+    @staticmethod
+    def sidecar_candidates(file_path: str) -> list:
+        """
+        The file with the existing files of its directory which may be its sidecars, the possible names
+        are looked up instead of listing the directory. Only a sidecar looks for its primary file among
+        the files with the same stem
+        """
+        stem, ext = os.path.splitext(file_path)
+        if ext.lower() in SIDECAR_EXTENSIONS:
+            return [file_path] + [path for path in glob.glob(glob.escape(stem) + '.*')
+                                  if path != file_path and os.path.isfile(path)]
+        file_paths = [file_path]
+        seen = set()
+        for base in (file_path, stem):
+            for sidecar_ext in SIDECAR_EXTENSIONS:
+                for candidate in (base + sidecar_ext, base + sidecar_ext.upper()):
+                    try:
+                        candidate_stat = os.stat(candidate)
+                    except OSError:
+                        continue
+                    # both spellings name the same file on a case-insensitive file system
+                    if stat.S_ISREG(candidate_stat.st_mode) and \
+                            (candidate_stat.st_dev, candidate_stat.st_ino) not in seen:
+                        seen.add((candidate_stat.st_dev, candidate_stat.st_ino))
+                        file_paths.append(candidate)
+        return file_paths
+
+    def walk_input(self, quiet: bool = False):
+        """
+        Yield every input directory with the sorted paths of its files except the ignored ones.
+        Directories are visited top-down in the same order as os.walk, each is listed once with os.scandir
+        """
+        stack = [self.input_path]
+        while stack:
+            root = stack.pop()
+            try:
+                entries = list(os.scandir(root))
+            except OSError:
+                continue
+
+            dirs = []
+            files = []
+            for entry in entries:
+                try:
+                    is_dir = entry.is_dir()
+                except OSError:
+                    is_dir = False
+                if not is_dir:
+                    files.append(entry.name)
+                elif not entry.is_symlink():
+                    dirs.append(entry.path)
+            stack.extend(reversed(dirs))
+
             if os.path.basename(root) in ignored_folders:
-                self.log.info("skip folder: '%s' " % root)
+                if not quiet:
+                    self.log.info("skip folder: '%s' " % root)
                 continue
 
             files.sort()
+            file_paths = []
             for filename in files:
                 if filename in ignored_files:
-                    self.log.info("skip file: '%s' " % filename)
+                    if not quiet:
+                        self.log_file(os.path.join(root, filename), " => skipped, ignored file")
                     continue
 
-                file_path = os.path.join(root, filename)
-                self.process_file(file_path)
+                file_paths.append(os.path.join(root, filename))
+            yield root, file_paths
 
-            if self.move and len(os.listdir(root)) == 0:
-                # remove all empty directories in PATH
-                self.log.info('Deleting empty dirs in path: {}'.format(root))
-                if not self.dry_run:
-                    os.removedirs(root)
+    def remove_empty_dir(self, root):
+        if self.move and os.path.isdir(root) and len(os.listdir(root)) == 0:
+            # remove all empty directories in PATH
+            self.log.info('Deleting empty dirs in path: {}'.format(root))
+            if not self.dry_run:
+                os.removedirs(root)
 
-    def process_file(self, file_path: str):
+    def prefetch(self, file_paths: list) -> (dict, dict):
         """
-        Process the file using the selected strategy
-        If file is .xmp skip it so process_xmp method can handle it
+        Read the metadata of a chunk of files with a single exiftool call.
+        Returns the metadata by normalized path and the types of the files classified by their signature.
+        A file is classified and its dates are read natively through the same open file
+        """
+        if self.prefetch_size <= 1:
+            return {}, {}
+        file_types = {}
+        exif_data = {}
+        with self.metrics.timed('metadata'):
+            if self.native:
+                for file_path in file_paths:
+                    if self.date_field:
+                        # the date field is only read by exiftool
+                        file_types[file_path] = classify(file_path)
+                        continue
+                    file_types[file_path], exif = classify_and_read(file_path)
+                    if exif is not None:
+                        exif_data[os.path.normpath(file_path)] = exif
+                file_paths = [file_path for file_path in file_paths if file_types[file_path] != SourceFileType.UNKNOWN
+                              and os.path.normpath(file_path) not in exif_data]
+            exif_data.update(Exif.prefetch(file_paths, self.exiftool, self.cache))
+        return exif_data, file_types
+
+    @staticmethod
+    def placement_key(phockup_file: SourceFile) -> (str, None):
         """
-        if str.endswith(file_path, '.xmp'):
+        Files with the same key may end up on the same target name or on one of its '-NNN' suffixes
+        """
+        if phockup_file.skipped:
             return None
-        log_line = file_path.encode('unicode-escape').decode('utf-8')
+        stem, ext = os.path.splitext(phockup_file.target_file_path())
+        return os.path.normcase(re.sub(r'-\d{3,}$', '', stem) + ext)
 
-        phockup_file = SourceFile(
-            output_file_name_format=self.output_file_name_format,
-            dir_format=self.dir_format,
-            date_regex=self.date_regex,
-            timestamp=self.timestamp,
-            date_field=self.date_field,
-            original_filenames=self.original_filenames,
-            images_output_path=self.images_output_path,
-            videos_output_path=self.videos_output_path,
-            unknown_output_path=self.unknown_output_path,
-            file_path=file_path
-        )
-        if phockup_file.type == SourceFileType.UNKNOWN:
-            self.counter_unknown_files += 1
-        elif phockup_file.type == SourceFileType.VIDEO:
-            self.counter_video_files += 1
-        elif phockup_file.type == SourceFileType.IMAGE:
-            self.counter_image_files += 1
-        self.counter_all_files += 1
+    def process_file(self, file_path: str, exif_data: (dict, None) = None):
+        """
+        Process the file using the selected strategy
+        Sidecars are skipped, they are transferred with their primary file
+        Already prefetched exif data can be passed to avoid reading the metadata again
+        """
+        if file_path not in self.register_sidecars(Phockup.sidecar_candidates(file_path), (file_path,)):
+            return
+        self.place_file(self.probe_file(file_path, exif_data))
+
+    def probe_file(self, file_path: str, exif_data: (dict, None) = None, exif_date: (dict, None) = None,
+                   file_type=UNCLASSIFIED) -> (SourceFile, None):
+        """
+        Read the metadata of the file and count it by its type
+        """
+        phockup_file = SourceFile(file_path, exif_data=exif_data, config=self.file_config, exif_date=exif_date,
+                                  file_type=file_type)
+        self.register_file(phockup_file)
+        return phockup_file
+
+    def register_file(self, phockup_file: (SourceFile, PlannedFile)):
+        """
+        Count the file by its type and queue its CreateDate write
+        """
+        with self.lock:
+            if phockup_file.type == SourceFileType.UNKNOWN:
+                self.counter_unknown_files += 1
+            elif phockup_file.type == SourceFileType.VIDEO:
+                self.counter_video_files += 1
+            elif phockup_file.type == SourceFileType.IMAGE:
+                self.counter_image_files += 1
+            self.counter_all_files += 1
+            if Phockup.needs_date_write(phockup_file) and not self.dry_run:
+                self.date_writes[phockup_file.file_path] = self.date_writer.put(phockup_file.file_path,
+                                                                                phockup_file.date['date'])
+
+    @staticmethod
+    def needs_date_write(phockup_file: SourceFile) -> bool:
+        """
+        The date was not taken from the exif data and is written back to the CreateDate tag
+        """
+        return not phockup_file.skipped and bool(phockup_file.date) and not phockup_file.date['isexif']
+
+    def place_file(self, phockup_file: (SourceFile, None), previous: (Future, None) = None,
+                   original: (Future, None) = None):
+        """
+        Transfer the file to its target using the selected strategy
+        If an earlier placement competing for the same target name or the placement of an earlier file
+        with the same content is given, wait for it first
+        """
+        if phockup_file is None:
+            return
+        if previous is not None or original is not None:
+            wait([future for future in (previous, original) if future is not None])
+
+        file_path = phockup_file.file_path
+        with self.lock:
+            source = self.source_digests.pop(file_path, None)
+            original_path = self.input_duplicates.pop(file_path, None)
+            original_target = self.placed_targets.get(original_path)
+            sidecars = self.sidecars.pop(file_path, ())
 
         if phockup_file.skipped:
-            self.log.info(log_line + " => skipped, the output dir for %s is not defined" % phockup_file.type.name)
+            self.log_file(file_path, " => skipped, the output dir for %s is not defined" % phockup_file.type.name)
+            if self.journal is not None:
+                self.journal.record(file_path, None, self.strategy, SKIPPED)
+            if self.plan is not None:
+                self.plan.write(phockup_file, PLANNED_SKIPPED)
+            return
+
+        if original_target is not None:
+            with self.lock:
+                self.counter_processed_files += 1
+                self.counter_duplicates += 1
+                self.counter_input_duplicates += 1
+                self.placed_targets[file_path] = original_target
+            if self.journal is not None:
+                self.journal.record(file_path, original_target, self.strategy, DUPLICATE)
+            if self.plan is not None:
+                self.plan.write(phockup_file, PLANNED_DUPLICATE, target=phockup_file.target_file_path(),
+                                duplicate_of=original_target)
+            if self.move:
+                if not self.dry_run:
+                    os.remove(file_path)
+                self.log_file(file_path, " => remove, duplicated file in the input ('%s')" % original_target)
+            else:
+                self.log_file(file_path, " => skipped, duplicated file in the input ('%s')" % original_target)
             return
 
-        if phockup_file.date and not phockup_file.date['isexif']:
-            self.log.info(log_line + " => write '%s' to exifTag: 'CreateDate'" % phockup_file.date['date'])
+        if Phockup.needs_date_write(phockup_file):
+            self.log_file(file_path, " => write '%s' to exifTag: 'CreateDate'" % phockup_file.date['date'])
             if not self.dry_run:
-                if not Exif(file_path).write_created_date(phockup_file.date['date']):
-                    self.log.error(log_line + " => can't write '%s' to exifTag 'CreateDate'" % phockup_file.date['date'])
+                with self.lock:
+                    written = self.date_writes.pop(file_path, None)
+                if written is None:
+                    written = self.date_writer.put(file_path, phockup_file.date['date'])
+                with self.metrics.timed('date_write'):
+                    written = self.date_writer.result(written)
+                if not written:
+                    self.log.error(file_path.encode('unicode-escape').decode('utf-8')
+                                   + " => can't write '%s' to exifTag 'CreateDate'" % phockup_file.date['date'])
 
-        if not os.path.isdir(phockup_file.output_path) and not self.dry_run:
-            os.makedirs(phockup_file.output_path)
-        self.counter_processed_files += 1
+        if not self.dry_run:
+            self.target_index.makedirs(phockup_file.output_path)
+        with self.lock:
+            self.counter_processed_files += 1
+
+        if self.content_index is None:
+            self.transfer_file(phockup_file, source, sidecars)
+            return
+        # only a file with the same content waits for this one, the others are placed meanwhile
+        root = self.content_index.root_of(phockup_file.output_path)
+        try:
+            source = source or FileDigest(file_path)
+            placing = self.content_index.reserve(source, root)
+            while placing is not None:
+                placing.wait()
+                placing = self.content_index.reserve(source, root)
+        except FileNotFoundError:
+            self.log_file(file_path, ' => skipped, no such file or directory')
+            return
+        try:
+            self.transfer_file(phockup_file, source, sidecars)
+        finally:
+            self.content_index.release(source, root)
 
-        suffix = 0
+    def transfer_file(self, phockup_file: SourceFile, source: (FileDigest, None), sidecars=()):
+        """
+        Find a free target name or a duplicate of the file and transfer it together with its sidecars
+        """
+        file_path = phockup_file.file_path
+        duplicate = None
         base_target_file_path = phockup_file.target_file_path()
-        target_file_path = base_target_file_path
-        while True:
-            if os.path.isfile(target_file_path):
-                if os.path.getsize(file_path) == os.path.getsize(target_file_path) \
-                        and filecmp.cmp(file_path, target_file_path, shallow=False):
-                    # if self.checksum(file) == self.checksum(target_file):
-                    self.counter_duplicates += 1
-                    if self.move:
-                        if not self.dry_run:
-                            os.remove(file_path)
-                        self.log.info(log_line + " => remove, duplicated file('%s')" % target_file_path)
+        with self.metrics.timed('compare'):
+            if self.content_index is not None:
+                duplicate = self.content_index.find(source, self.content_index.root_of(phockup_file.output_path))
+
+            if duplicate is None and self.target_index.exists(base_target_file_path):
+                try:
+                    source = source or FileDigest(file_path)
+                except FileNotFoundError:
+                    self.log_file(file_path, ' => skipped, no such file or directory')
+                    return
+                for suffix, target_file_path in self.target_index.candidates(base_target_file_path, source.size):
+                    planned_source = self.target_index.planned_source(target_file_path)
+                    if planned_source is not None:
+                        same = source.same(FileDigest(planned_source))
                     else:
-                        self.log.info(log_line + " => skipped, duplicated file ('%s')" % target_file_path)
-                    break
-            else:
-                if self.move:
-                    try:
-                        if not self.dry_run:
-                            shutil.move(file_path, target_file_path)
-                    except FileNotFoundError:
-                        self.log.info(log_line + ' => skipped, no such file or directory')
-                        break
-                elif self.link:
-                    if not self.dry_run:
-                        os.link(file_path, target_file_path)
-                else:
-                    try:
-                        if not self.dry_run:
-                            shutil.copy2(file_path, target_file_path)
-                    except FileNotFoundError:
-                        self.log.info(log_line + ' => skipped, no such file or directory')
+                        same = self.same_content(source, target_file_path)
+                    if same:
+                        duplicate = target_file_path
                         break
 
-                self.log.info(log_line + (' => %s' % target_file_path))
-                self.process_xmp(file_path, phockup_file.target_file_name(), suffix, phockup_file.output_path)
-                break
+        if duplicate is not None:
+            with self.lock:
+                self.counter_duplicates += 1
+                if self.duplicate_finder is not None:
+                    self.placed_targets[file_path] = duplicate
+            if self.journal is not None:
+                self.journal.record(file_path, duplicate, self.strategy, DUPLICATE)
+            if self.plan is not None:
+                self.plan.write(phockup_file, PLANNED_DUPLICATE, target=base_target_file_path, duplicate_of=duplicate)
+            if self.move:
+                if not self.dry_run:
+                    os.remove(file_path)
+                self.log_file(file_path, " => remove, duplicated file('%s')" % duplicate)
+            else:
+                self.log_file(file_path, " => skipped, duplicated file ('%s')" % duplicate)
+            return
+
+        try:
+            size = source.size if source is not None else os.path.getsize(file_path)
+        except OSError:
+            size = None
+        while True:
+            with self.metrics.timed('allocate'):
+                suffix, target_file_path = self.target_index.free(base_target_file_path)
+            if self.journal is not None:
+                self.journal.record(file_path, target_file_path, self.strategy, PLANNED)
+            if not self.dry_run:
+                io_throttle.file()
+            try:
+                with self.metrics.timed('transfer', size or 0):
+                    copied_by = None if self.dry_run else self.transfer_data(file_path, target_file_path, source)
+            except FileExistsError:
+                # the name was taken by someone else since its directory was listed, take the next one.
+                # The planned entry is closed, so a resume doesn't roll back the file which took the name
+                if self.journal is not None:
+                    self.journal.record(file_path, target_file_path, self.strategy, ROLLED_BACK)
+                self.target_index.add(target_file_path)
+                continue
+            except FileNotFoundError:
+                self.log_file(file_path, ' => skipped, no such file or directory')
+                return
+            break
 
-            suffix += 1
-            target_split = os.path.splitext(base_target_file_path)
-            target_file_path = "%s-%03d%s" % (target_split[0], suffix, target_split[1])
+        if self.journal is not None:
+            self.journal.record(file_path, target_file_path, self.strategy, DONE)
+        if self.duplicate_finder is not None:
+            with self.lock:
+                self.placed_targets[file_path] = target_file_path
+        if self.watch:
+            with self.lock:
+                self.primary_targets.setdefault(os.path.dirname(file_path), {})[file_path] = target_file_path
+        if self.plan is not None:
+            self.plan.write(phockup_file, TRANSFER, target=target_file_path,
+                            write_date=Phockup.needs_date_write(phockup_file))
+        # a dry run allocates the names like a real run, the planned targets only exist in the index
+        self.target_index.add(target_file_path, size, planned_source=file_path if self.dry_run else None)
+        if not self.dry_run and self.content_index is not None:
+            self.content_index.add(target_file_path, source)
+        if self.progress is not None:
+            self.progress.advance(size=size or 0)
+        if copied_by is not None:
+            self.log_file(file_path, ' => %s (%s)' % (target_file_path, copied_by))
+        else:
+            self.log_file(file_path, ' => %s' % target_file_path)
+        for sidecar in sidecars:
+            self.process_sidecar(file_path, sidecar, target_file_path)
 
-    def process_xmp(self, file, file_name, suffix, output):
+    def transfer_data(self, file_path: str, target_file_path: str, source: (FileDigest, None)) -> (str, None):
         """
-        Process xmp files. These are meta data for RAW images
+        Move, link or copy the file to a target which must not exist yet, returns how the data was transferred
         """
-        xmp_original_with_ext = file + '.xmp'
-        xmp_original_without_ext = os.path.splitext(file)[0] + '.xmp'
-
-        suffix = '-%s' % suffix if suffix > 1 else ''
+        if self.move:
+            lock = self.duplicate_finder.lock(source) if self.duplicate_finder is not None else None
+            if lock is not None:
+                # later files of the input are compared with the moved file at its new place
+                with lock:
+                    copied_by = self.copy_engine.move(file_path, target_file_path)
+                    source.path = target_file_path
+                return copied_by
+            return self.copy_engine.move(file_path, target_file_path)
+        if self.link:
+            os.link(file_path, target_file_path)
+            return None
+        return self.copy_engine.copy(file_path, target_file_path)
 
-        if os.path.isfile(xmp_original_with_ext):
-            xmp_original = xmp_original_with_ext
-            xmp_target = '%s%s.xmp' % (file_name, suffix)
-        elif os.path.isfile(xmp_original_without_ext):
-            xmp_original = xmp_original_without_ext
-            xmp_target = '%s%s.xmp' % (os.path.splitext(file_name)[0], suffix)
-        else:
-            xmp_original = None
-            xmp_target = None
+    def same_content(self, source: FileDigest, target_file_path: str) -> bool:
+        """
+        Compare by size, then by a hash of head and tail and only then by the full hash.
+        The hashes of the source are computed once for all compared targets
+        """
+        if self.content_index is None:
+            return source.same(FileDigest(target_file_path))
+        target = self.content_index.digest(target_file_path)
+        same = source.same(target)
+        self.content_index.store(target)
+        return same
 
-        if xmp_original:
-            xmp_path = os.path.sep.join([output, xmp_target])
-            self.log.info('%s => %s' % (xmp_original, xmp_path))
+    def process_sidecar(self, file_path: str, sidecar: str, target_file_path: str):
+        """
+        Transfer a sidecar (xmp, AAE, THM) next to the target of its primary file with the same strategy
+        """
+        sidecar_path = sidecar_target(file_path, sidecar, target_file_path)
+        self.log_file(sidecar, ' => %s' % sidecar_path)
 
-            if not self.dry_run:
+        if not self.dry_run:
+            if self.journal is not None:
+                self.journal.record(sidecar, sidecar_path, self.strategy, PLANNED)
+            try:
                 if self.move:
-                    shutil.move(xmp_original, xmp_path)
+                    self.copy_engine.move(sidecar, sidecar_path)
                 elif self.link:
-                    os.link(xmp_original, xmp_path)
+                    os.link(sidecar, sidecar_path)
                 else:
-                    shutil.copy2(xmp_original, xmp_path)
+                    self.copy_engine.copy(sidecar, sidecar_path)
+            except FileNotFoundError:
+                self.log_file(sidecar, ' => skipped, no such file or directory')
+                return
+            except FileExistsError:
+                self.log_file(sidecar, " => skipped, '%s' exists" % sidecar_path)
+                return
+            self.target_index.add(sidecar_path)
+            if self.journal is not None:
+                self.journal.record(sidecar, sidecar_path, self.strategy, DONE)
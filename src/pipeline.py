@@ -0,0 +1,55 @@
+import queue
+import threading
+
+_DONE = object()
+
+
+class _Failure(object):
+    __slots__ = ('error',)
+
+    def __init__(self, error: BaseException):
+        self.error = error
+
+
+def buffered(iterable, size: int):
+    """
+    Run a producing stage in a background thread and yield its items through a queue of at most `size` items,
+    so the stage works ahead of its consumer while the memory used stays bounded.
+    An exception of the stage is raised in the consumer, a consumer which stops early stops the stage.
+    """
+    items = queue.Queue(maxsize=max(1, size))
+    stopped = threading.Event()
+
+    def put(item) -> bool:
+        while not stopped.is_set():
+            try:
+                items.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def produce():
+        try:
+            for item in iterable:
+                if not put(item):
+                    return
+            put(_DONE)
+        except BaseException as error:
+            put(_Failure(error))
+        finally:
+            close = getattr(iterable, 'close', None)
+            if close is not None:
+                close()
+
+    threading.Thread(target=produce, daemon=True).start()
+    try:
+        while True:
+            item = items.get()
+            if item is _DONE:
+                return
+            if isinstance(item, _Failure):
+                raise item.error
+            yield item
+    finally:
+        stopped.set()
@@ -0,0 +1,124 @@
+import json
+import os
+import re
+import threading
+from datetime import datetime
+
+from src.date import offset_timezone
+from src.file_type import SourceFileType
+
+TRANSFER = 'transfer'
+DUPLICATE = 'duplicate'
+SKIPPED = 'skipped'
+# a date written by datetime.isoformat()
+ISO_DATE = re.compile(r'(\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2})(?:\.(\d{6}))?(?:([+-])(\d{2}):(\d{2}))?$')
+
+
+def parse_date(value: str) -> datetime:
+    """
+    Read a date of a plan, datetime.fromisoformat is only available since Python 3.7
+    """
+    match = ISO_DATE.match(value)
+    if match is None:
+        raise ValueError('Invalid date: %s' % value)
+    date = datetime.strptime(match.group(1), '%Y-%m-%dT%H:%M:%S')
+    if match.group(2):
+        date = date.replace(microsecond=int(match.group(2)))
+    if match.group(3):
+        date = date.replace(tzinfo=offset_timezone(match.group(3), match.group(4), match.group(5)))
+    return date
+
+
+class PlanWriter(object):
+    """
+    Stream the decisions of a run to a JSON lines file, one line per input file:
+    {"source", "size", "mtime_ns", "type", "date", "status", "target", "duplicate_of", "write_date"}.
+    `status` is transfer, duplicate or skipped, `write_date` is the date written back to CreateDate
+    before the transfer or null. The `target` of a duplicate is the name it would have been transferred to.
+    Paths are absolute, so the plan can be applied from any directory
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.count = 0
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._file = open(path, 'w', encoding='utf-8')
+
+    def write(self, phockup_file, status: str, target: (str, None) = None, duplicate_of: (str, None) = None,
+              write_date: bool = False):
+        try:
+            # a moved file keeps its size and modification time
+            stat = os.stat(phockup_file.file_path if target is None or os.path.exists(phockup_file.file_path)
+                           else target)
+        except OSError:
+            return
+        date = phockup_file.date['date'] if phockup_file.date else None
+        line = json.dumps({
+            'source': os.path.abspath(phockup_file.file_path),
+            'size': stat.st_size,
+            'mtime_ns': stat.st_mtime_ns,
+            'type': phockup_file.type.name,
+            'date': date.isoformat() if date is not None else None,
+            'status': status,
+            'target': None if target is None else os.path.abspath(target),
+            'duplicate_of': None if duplicate_of is None else os.path.abspath(duplicate_of),
+            'write_date': date.isoformat() if write_date else None,
+        }) + '\n'
+        with self._lock:
+            self._file.write(line)
+            self.count += 1
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+
+class PlannedFile(object):
+    """
+    A file of a plan with the interface of SourceFile which the placement needs, no metadata is read
+    """
+    __slots__ = ('file_path', 'type', 'date', 'skipped', 'output_path', 'status', 'duplicate_of',
+                 '_target_file_path')
+
+    def __init__(self, entry: dict):
+        self.file_path = entry['source']
+        self.type = SourceFileType[entry['type']]
+        self.status = entry['status']
+        self.duplicate_of = entry.get('duplicate_of')
+        self.skipped = self.status == SKIPPED
+        # the target of a duplicate is the name it was planned for, plans without it fall back to the duplicate
+        self._target_file_path = entry.get('target') or (self.duplicate_of if self.status == DUPLICATE else None)
+        self.output_path = os.path.dirname(self._target_file_path) if self._target_file_path else None
+        if entry.get('write_date'):
+            self.date = {'date': parse_date(entry['write_date']), 'subseconds': '', 'isexif': False}
+        elif entry.get('date'):
+            self.date = {'date': parse_date(entry['date']), 'subseconds': '', 'isexif': True}
+        else:
+            self.date = None
+
+    def target_file_name(self) -> (str, None):
+        return None if self._target_file_path is None else os.path.basename(self._target_file_path)
+
+    def target_file_path(self) -> (str, None):
+        return self._target_file_path
+
+
+def read_plan(path: str):
+    """
+    Yield (entry, changed) for every entry of a plan, `changed` tells whether the size or the modification
+    time of the source differ from the planned ones (a missing source is changed too)
+    """
+    with open(path, encoding='utf-8') as file:
+        for line in file:
+            if not line.strip():
+                continue
+            entry = json.loads(line)
+            try:
+                stat = os.stat(entry['source'])
+                changed = stat.st_size != entry['size'] or stat.st_mtime_ns != entry['mtime_ns']
+            except OSError:
+                changed = True
+            yield entry, changed
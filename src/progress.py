@@ -0,0 +1,74 @@
+import sys
+import threading
+import time
+
+
+def format_duration(seconds: float) -> str:
+    seconds = int(seconds)
+    if seconds >= 3600:
+        return '%d:%02d:%02d' % (seconds // 3600, seconds % 3600 // 60, seconds % 60)
+    return '%d:%02d' % (seconds // 60, seconds % 60)
+
+
+class Progress(object):
+    """
+    Throttled progress line with the files done, files/s, MB/s and the estimated time left.
+    On a terminal the line is redrawn in place at most every `interval` seconds,
+    otherwise a new line is written every `interval` * 10 seconds.
+    The total is set by a pre-count of the input which runs next to the processing,
+    until it is known no estimate is shown
+    """
+
+    def __init__(self, stream=None, interval: float = 0.5):
+        self.stream = stream or sys.stderr
+        self.tty = hasattr(self.stream, 'isatty') and self.stream.isatty()
+        self.interval = interval if self.tty else interval * 10
+        self.total = None
+        self.files = 0
+        self.bytes = 0
+        self._start = time.perf_counter()
+        self._shown = self._start
+        self._width = 0
+        self._lock = threading.Lock()
+
+    def set_total(self, files: int):
+        with self._lock:
+            self.total = files
+
+    def advance(self, files: int = 0, size: int = 0):
+        now = time.perf_counter()
+        with self._lock:
+            self.files += files
+            self.bytes += size
+            if now - self._shown < self.interval:
+                return
+            self._shown = now
+            self.__show(self.line(now))
+
+    def finish(self):
+        with self._lock:
+            self.__show(self.line(time.perf_counter()))
+            if self.tty:
+                self.stream.write('\n')
+                self.stream.flush()
+
+    def line(self, now: float) -> str:
+        elapsed = max(now - self._start, 1e-6)
+        files_per_second = self.files / elapsed
+        line = '%d' % self.files
+        if self.total is not None:
+            line += '/%d files' % self.total
+        else:
+            line += ' files'
+        line += ', %.1f files/s, %.1f MB/s' % (files_per_second, self.bytes / elapsed / 1024 / 1024)
+        if self.total is not None and files_per_second > 0:
+            line += ', ETA %s' % format_duration(max(0, self.total - self.files) / files_per_second)
+        return line + ', elapsed %s' % format_duration(elapsed)
+
+    def __show(self, line: str):
+        if self.tty:
+            self.stream.write('\r' + line.ljust(self._width))
+            self._width = len(line)
+        else:
+            self.stream.write(line + '\n')
+        self.stream.flush()
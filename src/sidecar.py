@@ -0,0 +1,49 @@
+import os
+
+# files with metadata of another file: xmp of RAW editors, edits of Apple Photos, thumbnails of cameras
+SIDECAR_EXTENSIONS = ('.xmp', '.aae', '.thm')
+
+
+def group_sidecars(file_paths: list) -> (list, dict):
+    """
+    Split the paths of the files of one directory into the primary files and their sidecars, in one pass
+    over the listing without touching the file system. IMG_1234.CR2.xmp belongs to IMG_1234.CR2,
+    IMG_1234.xmp, IMG_1234.AAE and IMG_1234.THM belong to the first other file named IMG_1234.* in sorted order.
+    Returns the sorted primary paths and a dict of primary path => its sidecar paths.
+    An .xmp file without a primary file is dropped, other sidecars without one are primary files themselves
+    """
+    file_paths = sorted(file_paths)
+    names = set(file_paths)
+    stems = {}
+    for file_path in file_paths:
+        stem, ext = os.path.splitext(file_path)
+        if ext.lower() not in SIDECAR_EXTENSIONS:
+            stems.setdefault(stem, file_path)
+
+    primaries = []
+    sidecars = {}
+    for file_path in file_paths:
+        stem, ext = os.path.splitext(file_path)
+        if ext.lower() not in SIDECAR_EXTENSIONS:
+            primaries.append(file_path)
+            continue
+        if stem in names and os.path.splitext(stem)[1].lower() not in SIDECAR_EXTENSIONS:
+            primary = stem
+        else:
+            primary = stems.get(stem)
+        if primary is not None:
+            sidecars.setdefault(primary, []).append(file_path)
+        elif not file_path.endswith('.xmp'):
+            primaries.append(file_path)
+    return primaries, sidecars
+
+
+def sidecar_target(primary: str, sidecar: str, target_file_path: str) -> str:
+    """
+    Target of a sidecar next to the target of its primary file: IMG_1234.CR2.xmp follows the full name
+    of the target, IMG_1234.xmp its name without the extension
+    """
+    ext = os.path.splitext(sidecar)[1]
+    if sidecar == primary + ext:
+        return target_file_path + ext
+    return os.path.splitext(target_file_path)[0] + ext
@@ -1,21 +1,30 @@
 import os
 import re
-from enum import Enum
-from sre_parse import Pattern
+from typing import Pattern
 
+from src.cache import MetadataCache
 from src.date import Date
 from src.exif import Exif
+from src.exiftool import ExifToolPool
+from src.file_type import SourceFileType, classify
+from src.metrics import Metrics
+from src.template import PathTemplate
 
+# file_type of a file which was not classified by its signature yet
+UNCLASSIFIED = 'unclassified'
+IMAGE_MIME_TYPE = re.compile('^(image/.+|application/vnd.adobe.photoshop)$')
+VIDEO_MIME_TYPE = re.compile('^(video/.+)$')
 
-class SourceFileType(Enum):
-    VIDEO = 1
-    IMAGE = 2
-    UNKNOWN = 3
 
+class RunConfig(object):
+    """
+    Settings of a run shared by all its files, so a file record only holds what differs per file
+    """
+    __slots__ = ('images_output_path', 'videos_output_path', 'unknown_output_path', 'date_regex', 'timestamp',
+                 'original_filenames', 'date_field', 'output_file_name_format', 'dir_format', 'exiftool', 'cache',
+                 'native', 'metrics', 'dir_template', 'name_template', '_output_paths')
 
-class SourceFile:
     def __init__(self,
-                 file_path: str,
                  images_output_path: (str, None) = None,
                  videos_output_path: (str, None) = None,
                  unknown_output_path: (str, None) = None,
@@ -24,58 +33,135 @@ class SourceFile:
                  original_filenames: bool = False,
                  date_field=None,
                  output_file_name_format: str = '%Y%m%d-%H%M%S',
-                 dir_format: str = os.path.sep.join(['%Y', '%m', '%d'])
+                 dir_format: str = os.path.sep.join(['%Y', '%m', '%d']),
+                 exiftool: (ExifToolPool, None) = None,
+                 cache: (MetadataCache, None) = None,
+                 native: bool = True,
+                 metrics: (Metrics, None) = None
                  ):
-        self.type = SourceFileType.UNKNOWN
-        self.exif_data = Exif(file_path).data()
-        self.file_path = file_path
-        self.date_regex = date_regex
-        self.original_filenames = original_filenames
-        self.date_field = date_field
-        self.timestamp = timestamp
         self.images_output_path = images_output_path
         self.videos_output_path = videos_output_path
         self.unknown_output_path = unknown_output_path
-        self.dir_format = dir_format
+        self.date_regex = date_regex
+        self.timestamp = timestamp
+        self.original_filenames = original_filenames
+        self.date_field = date_field
         self.output_file_name_format = output_file_name_format
+        self.dir_format = dir_format
+        self.exiftool = exiftool
+        self.cache = cache
+        self.native = native
+        self.metrics = metrics
+        self.dir_template = PathTemplate(dir_format, day=True)
+        self.name_template = PathTemplate(output_file_name_format, lower=True)
+        self._output_paths = {}
+
+    def output_path(self, base: str, output_dir: str) -> str:
+        """
+        The output directory of a date, one string shared by all the files of the same directory
+        """
+        key = (base, output_dir)
+        output_path = self._output_paths.get(key)
+        if output_path is None:
+            output_path = self._output_paths.setdefault(key, os.path.join(base, output_dir))
+        return output_path
+
+
+class SourceFile:
+    """
+    Compact record of an input file: its type, date and target. The settings come from the shared RunConfig
+    and the metadata is only kept until the date is found
+    """
+    __slots__ = ('file_path', 'config', 'type', 'date', 'output_path', 'skipped', '_target_file_name')
+
+    def __init__(self,
+                 file_path: str,
+                 images_output_path: (str, None) = None,
+                 videos_output_path: (str, None) = None,
+                 unknown_output_path: (str, None) = None,
+                 date_regex: (Pattern, None) = None,
+                 timestamp: bool = False,
+                 original_filenames: bool = False,
+                 date_field=None,
+                 output_file_name_format: str = '%Y%m%d-%H%M%S',
+                 dir_format: str = os.path.sep.join(['%Y', '%m', '%d']),
+                 exiftool: (ExifToolPool, None) = None,
+                 exif_data: (dict, None) = None,
+                 cache: (MetadataCache, None) = None,
+                 native: bool = True,
+                 metrics: (Metrics, None) = None,
+                 config: (RunConfig, None) = None,
+                 exif_date: (dict, None) = None,
+                 file_type=UNCLASSIFIED
+                 ):
+        if config is None:
+            config = RunConfig(images_output_path=images_output_path, videos_output_path=videos_output_path,
+                               unknown_output_path=unknown_output_path, date_regex=date_regex, timestamp=timestamp,
+                               original_filenames=original_filenames, date_field=date_field,
+                               output_file_name_format=output_file_name_format, dir_format=dir_format,
+                               exiftool=exiftool, cache=cache, native=native, metrics=metrics)
+        self.config = config
+        self.file_path = file_path
+        self.type = SourceFileType.UNKNOWN
         self.date = None
         self.output_path = None
         self.skipped = True
         self._target_file_name = None
-        self._target_file_path = None
-        self.__fill_phockup_file()
+        metrics = config.metrics
+        if exif_data is None:
+            # files known not to be media are never passed to exiftool, a file classified while its chunk
+            # was prefetched is not read again
+            if file_type is UNCLASSIFIED:
+                file_type = classify(file_path) if config.native else None
+            if file_type != SourceFileType.UNKNOWN:
+                # the native reader only knows the default date fields
+                exif = Exif(file_path, config.exiftool, config.cache, native=config.native and not config.date_field)
+                if metrics is None:
+                    exif_data = exif.data()
+                else:
+                    with metrics.timed('metadata'):
+                        exif_data = exif.data()
+        if metrics is None:
+            self.__fill_phockup_file(exif_data, exif_date)
+        else:
+            with metrics.timed('date'):
+                self.__fill_phockup_file(exif_data, exif_date)
 
-    def __fill_phockup_file(self):
+    def __fill_phockup_file(self, exif_data: (dict, None), exif_date: (dict, None) = None):
         """
-        Returns target file name and path
+        Find the type, the date and the output directory of the file,
+        `exif_date` is the date of the exif data if it was parsed with the rest of its chunk
         """
-        if SourceFile.__is_image(self.exif_data):
+        config = self.config
+        if SourceFile.__is_image(exif_data):
             self.date = Date(self.file_path).from_exif(
-                exif=self.exif_data,
-                timestamp=self.timestamp,
-                date_field=self.date_field,
-                user_regex=self.date_regex)
-            output_dir = SourceFile.__get_output_dir(self.date,
-                                                     self.dir_format)
+                exif=exif_data,
+                timestamp=config.timestamp,
+                date_field=config.date_field,
+                user_regex=config.date_regex,
+                parsed_date=exif_date)
+            output_dir = self.__get_output_dir()
             if output_dir:
                 self.type = SourceFileType.IMAGE
-                self.skipped = self.images_output_path is None
-                self.output_path = None if self.skipped else os.path.join(self.images_output_path, output_dir)
+                self.skipped = config.images_output_path is None
+                self.output_path = None if self.skipped else config.output_path(config.images_output_path,
+                                                                                output_dir)
 
-        elif SourceFile.__is_video(self.exif_data):
+        elif SourceFile.__is_video(exif_data):
             self.date = Date(self.file_path).from_exif(
-                exif=self.exif_data,
-                user_regex=self.date_regex)
-            output_dir = SourceFile.__get_output_dir(self.date,
-                                                     self.dir_format)
+                exif=exif_data,
+                user_regex=config.date_regex,
+                parsed_date=None if config.date_field else exif_date)
+            output_dir = self.__get_output_dir()
             if output_dir:
                 self.type = SourceFileType.VIDEO
-                self.skipped = self.videos_output_path is None
-                self.output_path = None if self.skipped else os.path.join(self.videos_output_path, output_dir)
+                self.skipped = config.videos_output_path is None
+                self.output_path = None if self.skipped else config.output_path(config.videos_output_path,
+                                                                                output_dir)
 
         if self.type == SourceFileType.UNKNOWN:
-            self.skipped = self.unknown_output_path is None
-            self.output_path = self.unknown_output_path
+            self.skipped = config.unknown_output_path is None
+            self.output_path = config.unknown_output_path
 
     @staticmethod
     def __is_image(exif_data: Exif) -> bool:
@@ -83,8 +169,7 @@ class SourceFile:
         Use mimetype to determine if the file is an image
         """
         if exif_data and 'MIMEType' in exif_data:
-            pattern = re.compile('^(image/.+|application/vnd.adobe.photoshop)$')
-            if pattern.match(exif_data['MIMEType']):
+            if IMAGE_MIME_TYPE.match(exif_data['MIMEType']):
                 return True
         return False
 
@@ -94,58 +179,44 @@ class SourceFile:
         Use mimetype to determine if the file is an image
         """
         if exif_data and 'MIMEType' in exif_data:
-            pattern = re.compile('^(video/.+)$')
-            if pattern.match(exif_data['MIMEType']):
+            if VIDEO_MIME_TYPE.match(exif_data['MIMEType']):
                 return True
         return False
 
-    @staticmethod
-    def __get_output_dir(date: Date, dir_format: str) -> (str, None):
+    def __get_output_dir(self) -> (str, None):
         """
         Generate output directory path based on the extracted date and formatted using dir_format
         If date is missing from the exifdata the file is going to "unknown" directory
         """
-
-        if date is None:
+        if self.date is None:
             return None
-        else:
-            try:
-                dir_formatted = date['date'].date().strftime(dir_format)
-            except:
-                return None
-
-            return dir_formatted
+        return self.config.dir_template.render(self.date['date'], self.file_path)
 
     def __get_file_name(self) -> str:
         """
         Generate file name based on exif data unless it is missing or
         original filenames are required. Then use original file name
         """
-        if self.original_filenames:
+        if self.config.original_filenames:
             return os.path.basename(self.file_path)
 
         if self.date:
-            try:
-                filename = self.date['date'].strftime(self.output_file_name_format)
+            # the template is lower case already
+            filename = self.config.name_template.render(self.date['date'], self.file_path)
+            if filename is not None:
                 if self.date['subseconds']:
-                    filename += "." + self.date['subseconds']
-                return filename + os.path.splitext(self.file_path)[1]
-            except:
-                pass
-        return os.path.basename(self.file_path)
+                    filename += "." + str(self.date['subseconds']).lower()
+                return filename + os.path.splitext(self.file_path)[1].lower()
+        return os.path.basename(self.file_path).lower()
 
     def target_file_name(self) -> (str, None):
         if self.skipped:
             return None
         if self._target_file_name is None:
             self._target_file_name = self.__get_file_name()
-        if not self.original_filenames:
-            self._target_file_name = self._target_file_name.lower()
         return self._target_file_name
 
     def target_file_path(self) -> (str, None):
         if self.skipped:
             return None
-        if self._target_file_path is None:
-            self._target_file_path = os.path.sep.join([self.output_path, self.target_file_name()])
-        return self._target_file_path
+        return os.path.sep.join([self.output_path, self.target_file_name()])
@@ -0,0 +1,127 @@
+import os
+import threading
+
+
+def suffixed(target_file_path: str, suffix: int) -> str:
+    """
+    Target name with the '-NNN' suffix used for files competing for the same name
+    """
+    if suffix == 0:
+        return target_file_path
+    target_split = os.path.splitext(target_file_path)
+    return "%s-%03d%s" % (target_split[0], suffix, target_split[1])
+
+
+class _Chain(object):
+    """
+    The existing files of a target name: the name itself and its consecutive '-NNN' suffixes
+    """
+    __slots__ = ('count', 'by_size')
+
+    def __init__(self):
+        self.count = 0
+        self.by_size = {}
+
+
+class TargetIndex(object):
+    """
+    Per-run index of the output directories.
+    Every directory is listed once, the sizes of existing files are read only when a file
+    with the same target name is placed, and the files placed by the run are added as they are created.
+    Allocating the next free '-NNN' suffix and finding the same sized candidates for the duplicate check
+    take constant time instead of one stat call per suffix.
+    A name planned by a dry run only exists in the index, its entry keeps the source planned for it
+    so later files can be compared with the planned file.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._dirs = set()
+        self._names = {}
+        self._chains = {}
+
+    def makedirs(self, directory: str):
+        with self._lock:
+            if directory in self._dirs:
+                return
+        os.makedirs(directory, exist_ok=True)
+        with self._lock:
+            self._dirs.add(directory)
+
+    def candidates(self, target_file_path: str, size: int) -> list:
+        """
+        Existing files of the target name with the given size, in suffix order: [(suffix, path)]
+        """
+        with self._lock:
+            return list(self.__chain(target_file_path).by_size.get(size, ()))
+
+    def exists(self, target_file_path: str) -> bool:
+        with self._lock:
+            return self.__chain(target_file_path).count > 0
+
+    def free(self, target_file_path: str) -> (int, str):
+        """
+        The first suffix not taken yet and its path
+        """
+        with self._lock:
+            suffix = self.__chain(target_file_path).count
+        return suffix, suffixed(target_file_path, suffix)
+
+    def add(self, target_file_path: str, size: (int, None) = None, planned_source: (str, None) = None):
+        """
+        Register a file created by the run, or planned for `planned_source` by a dry run
+        """
+        directory, name = os.path.split(target_file_path)
+        with self._lock:
+            self.__names(directory)[name] = size if planned_source is None else (size, planned_source)
+
+    def planned_source(self, target_file_path: str) -> (str, None):
+        """
+        The source a dry run planned for the target, None for a file which exists
+        """
+        directory, name = os.path.split(target_file_path)
+        with self._lock:
+            entry = self._names.get(directory, {}).get(name)
+        return entry[1] if isinstance(entry, tuple) else None
+
+    def __names(self, directory: str) -> dict:
+        names = self._names.get(directory)
+        if names is None:
+            names = {}
+            try:
+                for entry in list(os.scandir(directory or '.')):
+                    try:
+                        if entry.is_file():
+                            names[entry.name] = None
+                    except OSError:
+                        pass
+                self._dirs.add(directory)
+            except OSError:
+                pass
+            self._names[directory] = names
+        return names
+
+    def __chain(self, target_file_path: str) -> _Chain:
+        """
+        The chain of the target name, extended by the files which were added since it was last used
+        """
+        chain = self._chains.get(target_file_path)
+        if chain is None:
+            chain = self._chains[target_file_path] = _Chain()
+        directory = os.path.dirname(target_file_path)
+        names = self.__names(directory)
+        while True:
+            path = suffixed(target_file_path, chain.count)
+            name = os.path.basename(path)
+            if name not in names:
+                return chain
+            size = names[name]
+            if size is None:
+                try:
+                    size = names[name] = os.path.getsize(path)
+                except OSError:
+                    size = names[name] = -1
+            elif isinstance(size, tuple):
+                size = size[0]
+            chain.by_size.setdefault(size, []).append((chain.count, path))
+            chain.count += 1
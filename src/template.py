@@ -0,0 +1,68 @@
+import os
+import re
+from datetime import datetime
+
+# fields of a template besides the strftime directives, computed from the path of the file
+FIELDS = {
+    'stem': lambda file_path: os.path.splitext(os.path.basename(file_path))[0],
+}
+FIELD = re.compile(r'\{(%s)\}' % '|'.join(FIELDS))
+# formatted dates kept per template, the cache is emptied when it is full
+CACHE_SIZE = 4096
+FAILED = ()
+
+
+class PathTemplate(object):
+    """
+    A directory or file name format compiled once: strftime directives and {stem} (the original
+    file name without its extension). The formatted date is cached per calendar day for directories
+    (`day`) and per second for file names, unless the format has sub-second directives
+    """
+    __slots__ = ('format', 'day', 'lower', '_segments', '_fields', '_subsecond', '_cache')
+
+    def __init__(self, format: str, day: bool = False, lower: bool = False):
+        self.format = format
+        self.day = day
+        self.lower = lower
+        parts = FIELD.split(format)
+        self._segments = parts[0::2]
+        self._fields = [FIELDS[name] for name in parts[1::2]]
+        self._subsecond = '%f' in format
+        self._cache = {}
+
+    def render(self, date: (datetime, None), file_path: (str, None) = None) -> (str, None):
+        """
+        The formatted path of the date, None if the date can't be formatted
+        """
+        try:
+            if self.day:
+                date = date.date()
+                key = date
+            else:
+                key = (date.replace(tzinfo=None) if self._subsecond else date.replace(microsecond=0, tzinfo=None),
+                       date.utcoffset())
+        except AttributeError:
+            return None
+        segments = self._cache.get(key)
+        if segments is None:
+            segments = self.__format(date)
+            if len(self._cache) >= CACHE_SIZE:
+                self._cache.clear()
+            self._cache[key] = segments
+        if segments is FAILED:
+            return None
+        if not self._fields:
+            return segments[0]
+        rendered = [segments[0]]
+        for field, segment in zip(self._fields, segments[1:]):
+            value = field(file_path)
+            rendered.append(value.lower() if self.lower else value)
+            rendered.append(segment)
+        return ''.join(rendered)
+
+    def __format(self, date) -> tuple:
+        try:
+            segments = tuple(date.strftime(segment) for segment in self._segments)
+        except Exception:
+            return FAILED
+        return tuple(segment.lower() for segment in segments) if self.lower else segments
@@ -0,0 +1,186 @@
+import os
+import re
+import shutil
+import signal
+import subprocess
+import threading
+import time
+
+# largest chunk copied or hashed in one go while a byte rate is set, so the rate is kept smooth
+THROTTLED_CHUNK_SIZE = 4 * 1024 * 1024
+UNITS = {'': 1, 'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3}
+IONICE_CLASSES = {'realtime': 1, 'best-effort': 2, 'idle': 3}
+
+
+def parse_rate(value: str) -> float:
+    """
+    Parse a rate like 500, 1.5K, 20M or 1G (per second), 0 means unlimited
+    """
+    match = re.match(r'^\s*(\d+(?:\.\d+)?)\s*([KMG]?)(?:i?B)?\s*$', str(value), re.IGNORECASE)
+    if match is None:
+        raise ValueError('Invalid rate: %s' % value)
+    return float(match.group(1)) * UNITS[match.group(2).upper()]
+
+
+class TokenBucket(object):
+    """
+    Token bucket refilled with `rate` tokens per second and holding at most one second of them.
+    A take larger than the bucket is allowed and paid back by the following takes,
+    so the average rate is kept without splitting large requests
+    """
+
+    def __init__(self, rate: float = 0):
+        self._lock = threading.Lock()
+        self._rate = 0
+        self._tokens = 0.0
+        self._last = time.monotonic()
+        self.set_rate(rate)
+
+    @property
+    def rate(self) -> float:
+        return self._rate
+
+    def set_rate(self, rate: float):
+        with self._lock:
+            self._rate = max(0, rate or 0)
+            self._tokens = min(self._tokens, self._rate)
+            self._last = time.monotonic()
+
+    def take(self, amount: float = 1):
+        with self._lock:
+            if self._rate <= 0:
+                return
+            now = time.monotonic()
+            self._tokens = min(self._rate, self._tokens + (now - self._last) * self._rate)
+            self._last = now
+            self._tokens -= amount
+            wait = -self._tokens / self._rate if self._tokens < 0 else 0
+        if wait > 0:
+            time.sleep(wait)
+
+
+class IoThrottle(object):
+    """
+    Limits of the bytes and files per second shared by every copy, hash and exif write of the process.
+    The limits can be changed while running through a control file with `bytes_per_second=20M` and
+    `files_per_second=100` lines, which is read again when it changes (checked every second) or on SIGHUP
+    """
+
+    def __init__(self):
+        self.bytes = TokenBucket()
+        self.files = TokenBucket()
+        self.control_file = None
+        self._control_mtime = None
+        self._checked = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def limited(self) -> bool:
+        return self.bytes.rate > 0 or self.files.rate > 0 or self.control_file is not None
+
+    def configure(self, bytes_per_second: float = 0, files_per_second: float = 0, control_file: (str, None) = None):
+        self.bytes.set_rate(bytes_per_second)
+        self.files.set_rate(files_per_second)
+        self.control_file = control_file
+        self._control_mtime = None
+        if control_file is not None:
+            self.reload()
+
+    def chunk_size(self, size: int) -> int:
+        return min(size, THROTTLED_CHUNK_SIZE) if self.limited else size
+
+    def read(self, size: int):
+        """
+        Account `size` bytes of I/O, waits while the byte rate is exceeded
+        """
+        self.__check()
+        self.bytes.take(size)
+
+    def file(self):
+        """
+        Account one file operation, waits while the file rate is exceeded
+        """
+        self.__check()
+        self.files.take(1)
+
+    def reload(self):
+        """
+        Read the limits from the control file, a missing file or line leaves a limit unchanged
+        """
+        with self._lock:
+            control_file = self.control_file
+            if control_file is None:
+                return
+            try:
+                self._control_mtime = os.stat(control_file).st_mtime_ns
+                with open(control_file) as file:
+                    lines = file.read().splitlines()
+            except OSError:
+                return
+        for line in lines:
+            line = line.split('#', 1)[0].strip()
+            if '=' not in line:
+                continue
+            key, value = [part.strip() for part in line.split('=', 1)]
+            try:
+                rate = parse_rate(value)
+            except ValueError:
+                continue
+            if key == 'bytes_per_second':
+                self.bytes.set_rate(rate)
+            elif key == 'files_per_second':
+                self.files.set_rate(rate)
+
+    def handle_signals(self):
+        """
+        Read the control file again on SIGHUP, only possible from the main thread
+        """
+        if not hasattr(signal, 'SIGHUP') or threading.current_thread() is not threading.main_thread():
+            return
+        signal.signal(signal.SIGHUP, lambda signum, frame: self.reload())
+
+    def __check(self):
+        if self.control_file is None:
+            return
+        now = time.monotonic()
+        if now - self._checked < 1:
+            return
+        self._checked = now
+        try:
+            mtime = os.stat(self.control_file).st_mtime_ns
+        except OSError:
+            return
+        if mtime != self._control_mtime:
+            self.reload()
+
+
+def set_priority(nice: (int, None) = None, ionice: (str, None) = None) -> list:
+    """
+    Lower the CPU and I/O priority of the process, exiftool processes started later inherit both.
+    `ionice` is a class (idle, best-effort, realtime) with an optional level, e.g. best-effort:7.
+    Returns the warnings of settings which could not be applied
+    """
+    warnings = []
+    if nice:
+        try:
+            os.nice(nice)
+        except (AttributeError, OSError) as error:
+            warnings.append("Can't change the nice value: %s" % error)
+    if ionice:
+        name, _, level = ionice.partition(':')
+        command = shutil.which('ionice')
+        if command is None:
+            warnings.append("Can't change the I/O priority: ionice is not installed")
+        else:
+            args = [command, '-c', str(IONICE_CLASSES[name])]
+            if level and name != 'idle':
+                args += ['-n', level]
+            try:
+                subprocess.check_call(args + ['-p', str(os.getpid())], stdout=subprocess.DEVNULL,
+                                      stderr=subprocess.DEVNULL)
+            except (OSError, subprocess.CalledProcessError) as error:
+                warnings.append("Can't change the I/O priority: %s" % error)
+    return warnings
+
+
+io_throttle = IoThrottle()
@@ -0,0 +1,252 @@
+import abc
+import ctypes
+import ctypes.util
+import errno
+import os
+import select
+import stat
+import struct
+import sys
+import time
+
+# inotify(7) event masks
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE_SELF = 0x00000400
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+WATCH_MASK = IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE | IN_DELETE_SELF
+EVENT = struct.Struct('iIII')
+
+
+class Watcher(abc.ABC):
+    """
+    Report the files of a directory tree which are new or changed once they are complete.
+    The backend only names candidates, a candidate is ready when its size and modification time
+    stayed the same for `settle` seconds, so files which are still being written are not picked up.
+    All files already in the tree are candidates when watching starts.
+    A backend implements wait(), which passes the paths it learns about to candidate()
+    """
+    name = None
+
+    def __init__(self, root: str, settle: float = 2.0, ignored_files=(), ignored_folders=(), excluded=()):
+        self.root = root
+        self.settle = settle
+        self.ignored_files = ignored_files
+        self.ignored_folders = ignored_folders
+        self.excluded = tuple(os.path.abspath(path) + os.path.sep for path in excluded if path)
+        # path => (size, mtime_ns) of the files reported as ready
+        self.known = {}
+        # path => (size, mtime_ns, time since when it is unchanged)
+        self.pending = {}
+
+    def ready(self, timeout: float = 1.0) -> list:
+        """
+        Wait up to `timeout` seconds for events and return the sorted paths of the files which became stable
+        """
+        self.wait(timeout)
+        now = time.monotonic()
+        ready = []
+        for file_path, (size, mtime_ns, since) in list(self.pending.items()):
+            signature = Watcher.signature(file_path)
+            if signature is None or signature == self.known.get(file_path):
+                del self.pending[file_path]
+            elif signature != (size, mtime_ns):
+                self.pending[file_path] = signature + (now,)
+            elif now - since >= self.settle:
+                del self.pending[file_path]
+                self.known[file_path] = signature
+                ready.append(file_path)
+        return sorted(ready, key=lambda file_path: (os.path.dirname(file_path), file_path))
+
+    def mark_known(self, file_paths: list):
+        """
+        Remember the current state of processed files, e.g. after their date was written back,
+        so changes made by processing them are not reported again. Files which are gone are forgotten
+        """
+        for file_path in file_paths:
+            signature = Watcher.signature(file_path)
+            if signature is None:
+                self.known.pop(file_path, None)
+            else:
+                self.known[file_path] = signature
+
+    def candidate(self, file_path: str):
+        if self.ignored(file_path):
+            return
+        signature = Watcher.signature(file_path)
+        if signature is None or signature == self.known.get(file_path):
+            return
+        pending = self.pending.get(file_path)
+        if pending is None or pending[:2] != signature:
+            self.pending[file_path] = signature + (time.monotonic(),)
+
+    def ignored(self, file_path: str) -> bool:
+        return (os.path.basename(file_path) in self.ignored_files
+                or os.path.basename(os.path.dirname(file_path)) in self.ignored_folders
+                or (self.excluded and os.path.abspath(file_path).startswith(self.excluded)))
+
+    def scan(self, directory: str):
+        """
+        Yield the directories and the files below `directory`, symbolic links to directories are not followed
+        """
+        stack = [directory]
+        while stack:
+            root = stack.pop()
+            # the directory is named before it is listed, so a watch added for it misses no file
+            yield root, None
+            try:
+                entries = list(os.scandir(root))
+            except OSError:
+                continue
+            for entry in entries:
+                try:
+                    is_dir = entry.is_dir(follow_symlinks=False)
+                except OSError:
+                    continue
+                if is_dir:
+                    if self.excluded and os.path.abspath(entry.path) + os.path.sep in self.excluded:
+                        continue
+                    stack.append(entry.path)
+                else:
+                    yield root, entry.path
+
+    @abc.abstractmethod
+    def wait(self, timeout: float):
+        """
+        Block up to `timeout` seconds for changes and name the changed files as candidates
+        """
+
+    def close(self):
+        pass
+
+    @staticmethod
+    def signature(file_path: str) -> (tuple, None):
+        try:
+            file_stat = os.stat(file_path)
+        except OSError:
+            return None
+        if not stat.S_ISREG(file_stat.st_mode):
+            return None
+        return file_stat.st_size, file_stat.st_mtime_ns
+
+
+class PollingWatcher(Watcher):
+    """
+    Scan the whole tree every `interval` seconds, works on every file system including network shares
+    """
+    name = 'polling'
+
+    def __init__(self, root: str, settle: float = 2.0, interval: float = 10.0, **args):
+        Watcher.__init__(self, root, settle, **args)
+        self.interval = interval
+        self._scanned = None
+
+    def wait(self, timeout: float):
+        now = time.monotonic()
+        if self._scanned is not None and now - self._scanned < self.interval:
+            time.sleep(max(0, min(timeout, self._scanned + self.interval - now)))
+            return
+        self._scanned = now
+        for root, file_path in self.scan(self.root):
+            if file_path is not None:
+                self.candidate(file_path)
+
+
+class InotifyWatcher(Watcher):
+    """
+    Subscribe to the inotify events of every directory of the tree (Linux), new directories are watched
+    as they appear. When the kernel drops events the whole tree is scanned again
+    """
+    name = 'inotify'
+
+    def __init__(self, root: str, settle: float = 2.0, **args):
+        Watcher.__init__(self, root, settle, **args)
+        self._libc = InotifyWatcher.libc()
+        if self._libc is None:
+            raise OSError(errno.ENOSYS, 'inotify is not available')
+        self._fd = self._libc.inotify_init1(os.O_NONBLOCK | getattr(os, 'O_CLOEXEC', 0))
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+        self._directories = {}
+        try:
+            self.add_tree(root)
+        except OSError:
+            self.close()
+            raise
+
+    @staticmethod
+    def libc():
+        if not sys.platform.startswith('linux'):
+            return None
+        try:
+            libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        except OSError:
+            return None
+        return libc if hasattr(libc, 'inotify_init1') else None
+
+    def add_tree(self, directory: str):
+        """
+        Watch the directory and its subdirectories and take their files as candidates,
+        files created before the watch was added are not missed this way
+        """
+        for root, file_path in self.scan(directory):
+            if file_path is not None:
+                self.candidate(file_path)
+                continue
+            descriptor = self._libc.inotify_add_watch(self._fd, os.fsencode(root), WATCH_MASK)
+            if descriptor < 0:
+                if root == self.root:
+                    raise OSError(ctypes.get_errno(), 'inotify_add_watch failed', root)
+                continue
+            self._directories[descriptor] = root
+
+    def wait(self, timeout: float):
+        readable, _, _ = select.select([self._fd], [], [], timeout)
+        if not readable:
+            return
+        try:
+            data = os.read(self._fd, 64 * 1024)
+        except BlockingIOError:
+            return
+        offset = 0
+        while offset + EVENT.size <= len(data):
+            descriptor, mask, _, length = EVENT.unpack_from(data, offset)
+            name = os.fsdecode(data[offset + EVENT.size:offset + EVENT.size + length].rstrip(b'\0'))
+            offset += EVENT.size + length
+            if mask & IN_Q_OVERFLOW:
+                self.add_tree(self.root)
+                continue
+            directory = self._directories.get(descriptor)
+            if mask & IN_IGNORED:
+                self._directories.pop(descriptor, None)
+                continue
+            if directory is None or not name:
+                continue
+            path = os.path.join(directory, name)
+            if mask & IN_ISDIR:
+                if mask & (IN_CREATE | IN_MOVED_TO):
+                    self.add_tree(path)
+            else:
+                self.candidate(path)
+
+    def close(self):
+        if self._fd >= 0:
+            os.close(self._fd)
+            self._fd = -1
+
+
+def create_watcher(root: str, settle: float = 2.0, poll_interval: (float, None) = None, **args) -> Watcher:
+    """
+    An inotify watcher where possible, otherwise or when a `poll_interval` is given a polling one
+    """
+    if poll_interval is None:
+        try:
+            return InotifyWatcher(root, settle, **args)
+        except OSError:
+            poll_interval = 10.0
+    return PollingWatcher(root, settle, poll_interval, **args)
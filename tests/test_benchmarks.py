@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+import filecmp
+import os
+import shutil
+
+from benchmarks import corpus, dates
+from benchmarks.fake_exiftool import FakeExifTool
+from src.exif_reader import read_exif
+
+os.chdir(os.path.dirname(__file__))
+
+
+def setup_function():
+    shutil.rmtree('corpus', ignore_errors=True)
+
+
+def teardown_function():
+    shutil.rmtree('corpus', ignore_errors=True)
+
+
+def test_corpus_is_reproducible():
+    first = corpus.generate('corpus/first', 200, seed=1, files_per_dir=50, payload_size=256)
+    second = corpus.generate('corpus/second', 200, seed=1, files_per_dir=50, payload_size=256)
+    assert first == second
+    assert sum(first['kinds'].values()) == 200
+    assert all(count > 0 for count in first['kinds'].values())
+    assert sorted(os.listdir('corpus/first')) == ['dir00000', 'dir00001', 'dir00002', 'dir00003']
+    assert not filecmp.dircmp('corpus/first/dir00002', 'corpus/second/dir00002').diff_files
+
+
+def test_corpus_is_dated_by_the_native_reader():
+    corpus.generate('corpus', 100, seed=2, payload_size=256)
+    names = os.listdir('corpus/dir00000')
+    for name in names:
+        exif = read_exif(os.path.join('corpus/dir00000', name))
+        if name.startswith('DSC'):
+            assert exif['MIMEType'] == 'image/jpeg'
+            assert exif['DateTimeOriginal'] == exif['CreateDate']
+        elif name.startswith('MOV'):
+            assert exif['MIMEType'] == 'video/mp4'
+        elif name.startswith('IMG_'):
+            assert exif is None
+
+
+def test_fake_exiftool():
+    corpus.generate('corpus', 10, seed=3, payload_size=256)
+    files = [os.path.join('corpus/dir00000', name) for name in sorted(os.listdir('corpus/dir00000'))]
+    items = FakeExifTool().execute_json('-time:all', '-mimetype', *(files + ['corpus/missing.jpg']))
+    assert [item['SourceFile'] for item in items] == files
+    assert all('FileModifyDate' in item for item in items)
+    out, err = FakeExifTool().execute('-CreateDate=2017:01:01 01:01:01', '-overwrite_original', files[0])
+    assert out.strip() == '1 image files updated'
+
+
+def test_date_benchmark():
+    results = dates.run(number=100)
+    assert [result['date'] for result in results] == [name for name, datestr in dates.DATES] + ['chunk of 1000']
+    assert all(result['legacy_ns'] > 0 and result['fast_ns'] > 0 for result in results)
+    for name, datestr in dates.DATES + (('utc', '2017:01:01 01:01:01Z'), ('empty', '2017:01:01 01:01:01.')):
+        legacy = dates.legacy_from_datestring(datestr)
+        parsed = dates.Date().from_datestring(datestr)
+        assert legacy['subseconds'] == parsed['subseconds']
+        assert legacy['isexif'] == parsed['isexif']
+        assert legacy['date'] == (parsed['date'] and parsed['date'].replace(tzinfo=None))
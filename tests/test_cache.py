@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+import os
+import shutil
+
+from src.cache import MetadataCache
+from src.exif import Exif
+
+os.chdir(os.path.dirname(__file__))
+
+
+def setup_function():
+    shutil.rmtree('cache', ignore_errors=True)
+    os.mkdir('cache')
+    open('cache/file.jpg', 'w').close()
+
+
+def teardown_function():
+    shutil.rmtree('cache', ignore_errors=True)
+
+
+def test_cache_returns_stored_data():
+    cache = MetadataCache('cache/metadata.sqlite')
+    assert cache.get('cache/file.jpg') == (False, None)
+    cache.put('cache/file.jpg', {'SourceFile': 'cache/file.jpg', 'MIMEType': 'image/jpeg'})
+    assert cache.get('cache/file.jpg') == (True, {'SourceFile': 'cache/file.jpg', 'MIMEType': 'image/jpeg'})
+    assert cache.hits == 1
+    assert cache.misses == 1
+
+
+def test_cache_stores_unknown_files():
+    cache = MetadataCache('cache/metadata.sqlite')
+    cache.put('cache/file.jpg', None)
+    assert cache.get('cache/file.jpg') == (True, None)
+
+
+def test_cache_is_persistent_and_follows_renames():
+    cache = MetadataCache('cache/metadata.sqlite')
+    cache.put('cache/file.jpg', {'SourceFile': 'cache/file.jpg', 'MIMEType': 'image/jpeg'})
+    cache.flush()
+    os.rename('cache/file.jpg', 'cache/renamed.jpg')
+    found, data = MetadataCache('cache/metadata.sqlite').get('cache/renamed.jpg')
+    assert found
+    assert data['SourceFile'] == 'cache/renamed.jpg'
+
+
+def test_cache_stores_names_which_are_not_utf8():
+    file_path = os.fsdecode(b'cache/caf\xe9.jpg')
+    open(file_path, 'w').close()
+    cache = MetadataCache('cache/metadata.sqlite')
+    cache.put(file_path, {'SourceFile': file_path, 'MIMEType': 'image/jpeg'})
+    cache.flush()
+    assert MetadataCache('cache/metadata.sqlite').get(file_path) == (True, {'SourceFile': file_path,
+                                                                         'MIMEType': 'image/jpeg'})
+
+
+def test_cache_misses_changed_file():
+    cache = MetadataCache('cache/metadata.sqlite')
+    cache.put('cache/file.jpg', {'MIMEType': 'image/jpeg'})
+    with open('cache/file.jpg', 'w') as file:
+        file.write('changed')
+    assert cache.get('cache/file.jpg') == (False, None)
+
+
+def test_cache_rebuild():
+    cache = MetadataCache('cache/metadata.sqlite')
+    cache.put('cache/file.jpg', {'MIMEType': 'image/jpeg'})
+    cache.flush()
+    assert MetadataCache('cache/metadata.sqlite', rebuild=True).get('cache/file.jpg') == (False, None)
+
+
+def test_cache_evicts_least_recently_used():
+    cache = MetadataCache('cache/metadata.sqlite', max_entries=2)
+    for name in ('a.jpg', 'b.jpg', 'c.jpg'):
+        open(os.path.join('cache', name), 'w').close()
+    cache.put('cache/a.jpg', {'MIMEType': 'image/jpeg'})
+    cache.put('cache/b.jpg', {'MIMEType': 'image/jpeg'})
+    cache.get('cache/a.jpg')
+    cache.put('cache/c.jpg', {'MIMEType': 'image/jpeg'})
+    cache.flush()
+    assert cache.get('cache/a.jpg')[0]
+    assert not cache.get('cache/b.jpg')[0]
+    assert cache.get('cache/c.jpg')[0]
+
+
+def test_cache_counts_entries_only_when_full():
+    cache = MetadataCache('cache/metadata.sqlite', max_entries=100, commit_every=1)
+    statements = []
+    cache._db.set_trace_callback(statements.append)
+    for index in range(130):
+        file_path = os.path.join('cache', '%03d.jpg' % index)
+        open(file_path, 'w').close()
+        cache.put(file_path, {'MIMEType': 'image/jpeg'})
+    # counted with the 101st entry, then each time the 90 entries kept by the eviction grew over 100
+    assert len([statement for statement in statements if 'COUNT' in statement]) == 3
+    assert cache._db.execute('SELECT COUNT(*) FROM metadata').fetchone()[0] == 97
+    assert cache.get('cache/129.jpg')[0]
+    assert not cache.get('cache/000.jpg')[0]
+
+
+def test_exif_uses_cache(mocker):
+    mocker.patch.object(Exif, '_Exif__read', return_value={'MIMEType': 'image/jpeg'})
+    cache = MetadataCache('cache/metadata.sqlite')
+    assert Exif('cache/file.jpg', cache=cache).data() == {'MIMEType': 'image/jpeg'}
+    assert Exif('cache/file.jpg', cache=cache).data()['MIMEType'] == 'image/jpeg'
+    assert Exif._Exif__read.call_count == 1
@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+import os
+import shutil
+
+from src.content_index import ContentIndex, DuplicateFinder, FileDigest, PARTIAL_SIZE
+
+os.chdir(os.path.dirname(__file__))
+
+
+def write(path, content):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as file:
+        file.write(content)
+
+
+def setup_function():
+    shutil.rmtree('index', ignore_errors=True)
+    write('index/library/2017/a.jpg', b'a' * 10)
+    write('index/library/2017/b.jpg', b'b' * 10)
+    write('index/library/2018/big.mp4', b'x' * (3 * PARTIAL_SIZE))
+    write('index/input/renamed.jpg', b'b' * 10)
+    write('index/input/other.jpg', b'c' * 10)
+    write('index/input/middle.mp4', b'x' * PARTIAL_SIZE + b'y' * PARTIAL_SIZE + b'x' * PARTIAL_SIZE)
+
+
+def teardown_function():
+    shutil.rmtree('index', ignore_errors=True)
+
+
+def test_file_digest_compares_content():
+    assert FileDigest('index/input/renamed.jpg').same(FileDigest('index/library/2017/b.jpg'))
+    assert not FileDigest('index/input/other.jpg').same(FileDigest('index/library/2017/b.jpg'))
+    middle = FileDigest('index/input/middle.mp4')
+    big = FileDigest('index/library/2018/big.mp4')
+    assert middle.partial == big.partial
+    assert not middle.same(big)
+
+
+def test_index_finds_duplicate_with_other_name():
+    index = ContentIndex(['index/library'], path='index/index.sqlite')
+    root = index.root_of('index/library/2017')
+    assert index.find(FileDigest('index/input/renamed.jpg'), root) == os.path.abspath('index/library/2017/b.jpg')
+    assert index.find(FileDigest('index/input/other.jpg'), root) is None
+    assert index.find(FileDigest('index/input/middle.mp4'), root) is None
+
+
+def test_index_stores_hashes(mocker):
+    index = ContentIndex(['index/library'], path='index/index.sqlite')
+    root = index.root_of('index/library')
+    index.find(FileDigest('index/input/renamed.jpg'), root)
+    spy = mocker.patch('src.content_index.full_digest', side_effect=AssertionError('hashed again'))
+    stored = ContentIndex(['index/library'], path='index/index.sqlite').digest('index/library/2017/b.jpg')
+    assert stored.full is not None
+    assert not spy.called
+
+
+def test_index_adds_placed_files_and_forgets_removed_ones():
+    index = ContentIndex(['index/library'], path='index/index.sqlite')
+    root = index.root_of('index/library')
+    shutil.copy2('index/input/other.jpg', 'index/library/2018/placed.jpg')
+    index.add('index/library/2018/placed.jpg', FileDigest('index/input/other.jpg'))
+    assert index.find(FileDigest('index/input/other.jpg'), root) == os.path.abspath('index/library/2018/placed.jpg')
+    os.remove('index/library/2018/placed.jpg')
+    assert index.find(FileDigest('index/input/other.jpg'), root) is None
+
+
+def test_index_rebuild_finds_files_added_by_others():
+    ContentIndex(['index/library'], path='index/index.sqlite')
+    shutil.copy2('index/input/other.jpg', 'index/library/2018/external.jpg')
+    index = ContentIndex(['index/library'], path='index/index.sqlite')
+    root = index.root_of('index/library')
+    assert index.find(FileDigest('index/input/other.jpg'), root) is None
+    index = ContentIndex(['index/library'], path='index/index.sqlite', rebuild=True)
+    assert index.find(FileDigest('index/input/other.jpg'), root) == os.path.abspath('index/library/2018/external.jpg')
+
+
+def test_index_reserves_only_the_same_content():
+    index = ContentIndex(['index/library'], path='index/index.sqlite')
+    root = index.root_of('index/library')
+    assert index.reserve(FileDigest('index/input/renamed.jpg'), root) is None
+    # a file of the same size with another content is placed at the same time
+    assert index.reserve(FileDigest('index/input/other.jpg'), root) is None
+    placing = index.reserve(FileDigest('index/library/2017/b.jpg'), root)
+    assert placing is not None and not placing.is_set()
+    index.release(FileDigest('index/input/renamed.jpg'), root)
+    assert placing.is_set()
+    assert index.reserve(FileDigest('index/library/2017/b.jpg'), root) is None
+
+
+def test_duplicate_finder_keeps_first_file():
+    write('index/input/copy.jpg', b'b' * 10)
+    write('index/input/empty1.jpg', b'')
+    write('index/input/empty2.jpg', b'')
+    finder = DuplicateFinder()
+    first = [FileDigest('index/input/renamed.jpg'), FileDigest('index/input/other.jpg'),
+             FileDigest('index/input/copy.jpg')]
+    assert finder.resolve(first) == [None, None, first[0]]
+    second = [FileDigest('index/library/2017/b.jpg'), FileDigest('index/input/middle.mp4'),
+              FileDigest('index/library/2018/big.mp4'), FileDigest('index/input/empty1.jpg'),
+              FileDigest('index/input/empty2.jpg')]
+    assert finder.resolve(second) == [first[0], None, None, None, None]
+    # only the files later files are compared with have a lock
+    assert finder.lock(first[0]) is not None and finder.lock(first[0]) is not finder.lock(first[1])
+    assert finder.lock(second[0]) is None
+    finder.close()
+
+
+def test_duplicate_finder_hashes_only_when_needed():
+    finder = DuplicateFinder()
+    digests = [FileDigest('index/input/middle.mp4'), FileDigest('index/library/2018/big.mp4'),
+               FileDigest('index/input/renamed.jpg')]
+    # same size, head and tail: only the full hash tells them apart
+    assert finder.resolve(digests) == [None, None, None]
+    assert digests[0]._full is not None and digests[1]._full is not None
+    # a file of a size seen only once is not read at all
+    assert digests[2]._partial is None and digests[2]._full is None
+    other = FileDigest('index/input/other.jpg')
+    assert finder.resolve([other]) == [None]
+    assert other._partial is not None and other._full is None
+    finder.close()
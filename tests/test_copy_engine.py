@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+import errno
+import os
+import shutil
+
+import pytest
+
+from src.copy_engine import CopyEngine, partial_path
+
+os.chdir(os.path.dirname(__file__))
+
+DATA = os.urandom(3 * 1024 * 1024 + 17)
+
+
+def setup_function():
+    shutil.rmtree('copy', ignore_errors=True)
+    os.mkdir('copy')
+    with open('copy/source.jpg', 'wb') as file:
+        file.write(DATA)
+    os.chmod('copy/source.jpg', 0o640)
+    os.utime('copy/source.jpg', (1483232461, 1483232461))
+
+
+def teardown_function():
+    shutil.rmtree('copy', ignore_errors=True)
+
+
+def assert_copied(target):
+    with open(target, 'rb') as file:
+        assert file.read() == DATA
+    source_stat = os.stat('copy/source.jpg')
+    target_stat = os.stat(target)
+    assert target_stat.st_mtime == source_stat.st_mtime
+    assert target_stat.st_mode == source_stat.st_mode
+
+
+@pytest.mark.parametrize('engine', ['auto', 'kernel', 'python'])
+def test_copy_engines(engine):
+    copy_engine = CopyEngine(engine)
+    method = copy_engine.copy('copy/source.jpg', 'copy/target.jpg')
+    assert method in copy_engine.methods
+    assert copy_engine.used == {method: 1}
+    assert_copied('copy/target.jpg')
+
+
+def test_copy_is_renamed_once_complete(mocker):
+    copystat = shutil.copystat
+
+    def check_partial(source, target):
+        # the data is complete and on disk before the target gets its name
+        assert target == partial_path('copy/target.jpg')
+        assert not os.path.exists('copy/target.jpg')
+        copystat(source, target)
+
+    mocker.patch('shutil.copystat', side_effect=check_partial)
+    fsync = mocker.spy(os, 'fsync')
+    CopyEngine().copy('copy/source.jpg', 'copy/target.jpg')
+    assert fsync.call_count == 1
+    assert_copied('copy/target.jpg')
+    assert sorted(os.listdir('copy')) == ['source.jpg', 'target.jpg']
+
+
+def test_python_engine_copies_in_user_space():
+    assert CopyEngine('python').copy('copy/source.jpg', 'copy/target.jpg') == 'python'
+
+
+def test_fallback_to_next_method(mocker):
+    mocker.patch('os.copy_file_range', side_effect=OSError(errno.EXDEV, 'cross device'))
+    assert CopyEngine('kernel').copy('copy/source.jpg', 'copy/target.jpg') == 'sendfile'
+    assert_copied('copy/target.jpg')
+
+
+def test_errors_are_not_hidden(mocker):
+    mocker.patch('os.copy_file_range', side_effect=OSError(errno.ENOSPC, 'no space left'))
+    with pytest.raises(OSError):
+        CopyEngine('kernel').copy('copy/source.jpg', 'copy/target.jpg')
+    assert os.listdir('copy') == ['source.jpg']
+    with pytest.raises(FileNotFoundError):
+        CopyEngine().copy('copy/not-existing.jpg', 'copy/target.jpg')
+
+
+def test_reflink_only_fails_without_reflink_support(mocker):
+    mocker.patch('fcntl.ioctl', side_effect=OSError(errno.EOPNOTSUPP, 'not supported'))
+    with pytest.raises(OSError):
+        CopyEngine('reflink').copy('copy/source.jpg', 'copy/target.jpg')
+    assert not os.path.exists('copy/target.jpg')
+    assert CopyEngine('auto').copy('copy/source.jpg', 'copy/target.jpg') != 'reflink'
+    assert_copied('copy/target.jpg')
+
+
+def test_unknown_engine():
+    with pytest.raises(ValueError):
+        CopyEngine('fast')
+
+
+def test_move_renames_on_same_device():
+    source_stat = os.stat('copy/source.jpg')
+    copy_engine = CopyEngine()
+    assert copy_engine.move('copy/source.jpg', 'copy/target.jpg') == 'rename'
+    assert not os.path.exists('copy/source.jpg')
+    assert os.stat('copy/target.jpg').st_ino == source_stat.st_ino
+    assert copy_engine.moved == {'rename': 1}
+
+
+def test_move_across_devices_copies_and_verifies(mocker):
+    rename = mocker.patch('os.rename')
+    copy_engine = CopyEngine()
+    mocker.patch.object(copy_engine, 'same_device', return_value=False)
+    source_stat = os.stat('copy/source.jpg')
+    assert copy_engine.move('copy/source.jpg', 'copy/target.jpg') == 'verified copy'
+    rename.assert_not_called()
+    assert not os.path.exists('copy/source.jpg')
+    with open('copy/target.jpg', 'rb') as file:
+        assert file.read() == DATA
+    assert os.stat('copy/target.jpg').st_mtime == source_stat.st_mtime
+
+
+def test_move_keeps_source_when_copy_does_not_match(mocker):
+    copy_engine = CopyEngine()
+    mocker.patch('os.rename', side_effect=OSError(errno.EXDEV, 'cross device'))
+    mocker.patch('src.copy_engine.full_digest', return_value='0' * 64)
+    with pytest.raises(OSError):
+        copy_engine.move('copy/source.jpg', 'copy/target.jpg')
+    assert os.path.exists('copy/source.jpg')
+    assert not os.path.exists('copy/target.jpg')
+    assert copy_engine.moved == {}
+
+
+def test_existing_target_is_not_replaced(mocker):
+    with open('copy/target.jpg', 'w') as file:
+        file.write('library')
+    copy_engine = CopyEngine()
+    with pytest.raises(FileExistsError):
+        copy_engine.copy('copy/source.jpg', 'copy/target.jpg')
+    with pytest.raises(FileExistsError):
+        copy_engine.move('copy/source.jpg', 'copy/target.jpg')
+    mocker.patch.object(copy_engine, 'same_device', return_value=False)
+    with pytest.raises(FileExistsError):
+        copy_engine.move('copy/source.jpg', 'copy/target.jpg')
+    with open('copy/target.jpg') as file:
+        assert file.read() == 'library'
+    assert os.path.exists('copy/source.jpg')
@@ -1,7 +1,7 @@
 #!/usr/bin/env python3
 import os
 import re
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
 
 from src.date import Date
 
@@ -36,11 +36,11 @@ def test_get_date_from_custom_date_field():
            }
 
 
-def test_get_date_from_exif_strip_timezone():
+def test_get_date_from_exif_keep_timezone():
     assert Date().from_exif({
         "CreateDate": "2017-01-01 01:01:01-02:00"
     }) == {
-               "date": datetime(2017, 1, 1, 1, 1, 1),
+               "date": datetime(2017, 1, 1, 1, 1, 1, tzinfo=timezone(timedelta(hours=-2))),
                "subseconds": "",
                "isexif": True
            }
@@ -144,3 +144,47 @@ def test_get_date_custom_regex_optional_time():
         "subseconds": "",
         "isexif": False
     }
+
+
+def test_get_date_from_exif_subseconds_and_timezone():
+    assert Date().from_datestring("2017:01:01 01:01:01.20+05:30") == {
+        "date": datetime(2017, 1, 1, 1, 1, 1, tzinfo=timezone(timedelta(hours=5, minutes=30))),
+        # the subseconds are part of the file name, they keep the offset as before
+        "subseconds": "20+05:30",
+        "isexif": True
+    }
+    assert Date().from_datestring("2017:01:01 01:01:01.5Z") == {
+        "date": datetime(2017, 1, 1, 1, 1, 1, tzinfo=timezone.utc),
+        "subseconds": "5Z",
+        "isexif": True
+    }
+
+
+def test_get_date_from_datestring_slow_path():
+    # fields without leading zeros are left to strptime
+    assert Date().from_datestring("2017:1:1 1:01:01+01:00") == {
+        "date": datetime(2017, 1, 1, 1, 1, 1, tzinfo=timezone(timedelta(hours=1))),
+        "subseconds": "",
+        "isexif": True
+    }
+    assert Date().from_datestring("2017:02:30 01:01:01") == {
+        "date": None,
+        "subseconds": "",
+        "isexif": False
+    }
+
+
+def test_get_dates_from_exif_many():
+    dates = Date.from_exif_many([
+        {"CreateDate": "2017:01:01 01:01:01"},
+        None,
+        {"CreateDate": "0000:00:00 00:00:00"},
+        {"DateTimeOriginal": "2017:01:01 01:01:01"},
+    ])
+    assert dates[0] == {"date": datetime(2017, 1, 1, 1, 1, 1), "subseconds": "", "isexif": True}
+    assert dates[1] is None
+    assert dates[2] == {"date": None, "subseconds": "", "isexif": False}
+    # the same date string is parsed once
+    assert dates[3] is dates[0]
+    assert Date("IMG_20170102_010101.jpg").from_exif({}, user_regex=re.compile(
+        r'(?P<year>\d{4})(?P<month>\d{2})(?P<day>\d{2})'), parsed_date=dates[2])["date"] == datetime(2017, 1, 2)
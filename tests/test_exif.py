@@ -1,7 +1,9 @@
 #!/usr/bin/env python3
 import os
+from datetime import datetime
 from subprocess import CalledProcessError
-from src.exif import Exif
+from src.exif import CreateDateWriter, Exif
+from src.exiftool import ExifToolError, ExifToolPool
 
 
 os.chdir(os.path.dirname(__file__))
@@ -15,3 +17,39 @@ def test_exif_handles_exception(mocker):
     mocker.patch('subprocess.check_output', side_effect=CalledProcessError(2, 'cmd'))
     exif = Exif("not-existing.jpg")
     assert exif.data() == None
+
+def test_exif_prefetch_reads_many_files():
+    exiftool = ExifToolPool()
+    exif_data = Exif.prefetch(["input/exif.jpg", "input/exif.mp4", "not-existing.jpg"], exiftool)
+    exiftool.close()
+    assert exif_data[os.path.normpath("input/exif.jpg")]['CreateDate'] == '2017:01:01 01:01:01'
+    assert exif_data[os.path.normpath("input/exif.mp4")]['MIMEType'] == 'video/mp4'
+    assert os.path.normpath("not-existing.jpg") not in exif_data
+
+
+def test_create_date_writer_batches_writes(mocker):
+    exiftool = ExifToolPool()
+    mocker.patch.object(exiftool, 'execute_many', return_value=[
+        ('    1 image files updated\n', ''),
+        ('    0 image files updated\n    1 files weren\'t updated due to errors\n', 'Error: Not a valid JPG - b.jpg\n')])
+    writer = CreateDateWriter(exiftool, batch_size=10)
+    first = writer.put('a.jpg', datetime(2017, 1, 1))
+    second = writer.put('b.jpg', datetime(2017, 1, 2))
+    assert not first.done()
+    assert writer.result(first)
+    assert not writer.result(second)
+    assert exiftool.execute_many.call_count == 1
+    commands = exiftool.execute_many.call_args[0][0]
+    assert [command[-1] for command in commands] == ['a.jpg', 'b.jpg']
+    assert '-CreateDate=2017-01-0200:00:00' in commands[1]
+
+
+def test_create_date_writer_flushes_full_batch(mocker):
+    exiftool = ExifToolPool()
+    mocker.patch.object(exiftool, 'execute_many', side_effect=ExifToolError('crashed'))
+    writer = CreateDateWriter(exiftool, batch_size=2)
+    first = writer.put('a.jpg', datetime(2017, 1, 1))
+    assert not first.done()
+    writer.put('b.jpg', datetime(2017, 1, 1))
+    assert first.done()
+    assert not writer.result(first)
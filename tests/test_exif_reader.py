@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+import glob
+import os
+import shutil
+import struct
+
+from src.exif import Exif
+from src.exif_reader import read_exif
+
+os.chdir(os.path.dirname(__file__))
+
+COMPARED_TAGS = ('MIMEType', 'CreateDate', 'DateTimeOriginal', 'ModifyDate',
+                 'SubSecCreateDate', 'SubSecDateTimeOriginal', 'SubSecModifyDate')
+
+
+def tiff(order='<', ifd0=None, exif=None, extra_ifd0=()):
+    """
+    Build a TIFF structure with ascii tags in IFD0 and in the Exif IFD
+    """
+    ifd0 = dict(ifd0 or {})
+    exif = dict(exif or {})
+
+    def ifd(tags, offset, pointers):
+        entries = sorted(list(tags.items()) + list(pointers))
+        data_offset = offset + 2 + len(entries) * 12 + 4
+        header = struct.pack(order + 'H', len(entries))
+        data = b''
+        for tag, value in entries:
+            if isinstance(value, int):
+                header += struct.pack(order + 'HHLL', tag, 4, 1, value)
+                continue
+            value = value.encode('ascii') + b'\x00'
+            if len(value) <= 4:
+                header += struct.pack(order + 'HHL', tag, 2, len(value)) + value.ljust(4, b'\x00')
+            else:
+                header += struct.pack(order + 'HHLL', tag, 2, len(value), data_offset + len(data))
+                data += value
+        return header + struct.pack(order + 'L', 0) + data
+
+    first = ifd(ifd0, 8, list(extra_ifd0) + ([(0x8769, 0)] if exif else []))
+    exif_offset = 8 + len(first)
+    first = ifd(ifd0, 8, list(extra_ifd0) + ([(0x8769, exif_offset)] if exif else []))
+    magic = b'II*\x00' if order == '<' else b'MM\x00*'
+    return magic + struct.pack(order + 'L', 8) + first + (ifd(exif, exif_offset, []) if exif else b'')
+
+
+def jpeg(tiff_data=None, xmp=False):
+    data = b'\xff\xd8' + b'\xff\xe0' + struct.pack('>H', 16) + b'JFIF\x00\x01\x01\x00\x00\x01\x00\x01\x00\x00'
+    if tiff_data is not None:
+        segment = b'Exif\x00\x00' + tiff_data
+        data += b'\xff\xe1' + struct.pack('>H', len(segment) + 2) + segment
+    if xmp:
+        segment = b'http://ns.adobe.com/xap/1.0/\x00<x:xmpmeta/>'
+        data += b'\xff\xe1' + struct.pack('>H', len(segment) + 2) + segment
+    return data + b'\xff\xda' + struct.pack('>H', 2) + b'\x00' * 16 + b'\xff\xd9'
+
+
+def box(type, payload=b''):
+    return struct.pack('>L4s', len(payload) + 8, type) + payload
+
+
+def header_box(type, created, modified, version=0):
+    if version == 1:
+        return box(type, struct.pack('>B3xQQ', 1, created, modified) + b'\x00' * 12)
+    return box(type, struct.pack('>B3xLL', 0, created, modified) + b'\x00' * 12)
+
+
+def movie(brand=b'isom', created=3566077261, modified=3566077261, version=0, extra=b''):
+    """
+    Build a minimal MP4/MOV: ftyp, mdat, then moov with mvhd and one track
+    """
+    track = box(b'trak', header_box(b'tkhd', created, modified, version)
+                + box(b'mdia', header_box(b'mdhd', created, modified, version)))
+    return box(b'ftyp', brand + b'\x00\x00\x02\x00' + brand) + box(b'mdat', b'\x00' * 64) \
+        + box(b'moov', header_box(b'mvhd', created, modified, version) + track) + extra
+
+
+def heic(tiff_data, item_type=b'Exif'):
+    """
+    Build a minimal HEIC with a single item whose data starts right after the meta box
+    """
+    item = struct.pack('>L', 6) + b'Exif\x00\x00' + tiff_data
+    infe = box(b'infe', struct.pack('>B3xHH4s', 2, 1, 0, item_type) + b'\x00')
+    iinf = box(b'iinf', struct.pack('>B3xH', 0, 1) + infe)
+
+    def meta(offset):
+        iloc = box(b'iloc', struct.pack('>B3xBBHHHHLL', 0, 0x44, 0x00, 1, 1, 0, 1, offset, len(item)))
+        return box(b'meta', b'\x00' * 4 + box(b'hdlr', b'\x00' * 8 + b'pict' + b'\x00' * 13) + iinf + iloc)
+
+    ftyp = box(b'ftyp', b'heic\x00\x00\x00\x00mif1heic')
+    offset = len(ftyp) + len(meta(0)) + 8
+    return ftyp + meta(offset) + box(b'mdat', item)
+
+
+def write(name, data):
+    path = os.path.join('reader', name)
+    with open(path, 'wb') as file:
+        file.write(data)
+    return path
+
+
+def setup_function():
+    shutil.rmtree('reader', ignore_errors=True)
+    os.mkdir('reader')
+
+
+def teardown_function():
+    shutil.rmtree('reader', ignore_errors=True)
+
+
+def test_read_jpeg_dates():
+    exif = read_exif(write('photo.jpg', jpeg(tiff(exif={0x9003: '2017:01:01 01:01:01',
+                                                        0x9004: '2017:01:02 01:01:01'}))))
+    assert exif['SourceFile'] == os.path.join('reader', 'photo.jpg')
+    assert exif['MIMEType'] == 'image/jpeg'
+    assert exif['DateTimeOriginal'] == '2017:01:01 01:01:01'
+    assert exif['CreateDate'] == '2017:01:02 01:01:01'
+    assert 'FileModifyDate' in exif
+    assert 'SubSecCreateDate' not in exif
+
+
+def test_read_subseconds_and_offsets_as_composite_tags():
+    exif = read_exif(write('photo.jpg', jpeg(tiff(order='>', exif={0x9003: '2017:01:01 01:01:01',
+                                                                   0x9291: '20',
+                                                                   0x9004: '2017:01:01 01:01:01',
+                                                                   0x9012: '+02:00'}))))
+    assert exif['SubSecDateTimeOriginal'] == '2017:01:01 01:01:01.20'
+    assert exif['SubSecCreateDate'] == '2017:01:01 01:01:01+02:00'
+
+
+def test_read_tiff_based_raw():
+    data = tiff(ifd0={0x0132: '2018:05:05 05:05:05'}, exif={0x9003: '2017:01:01 01:01:01'})
+    exif = read_exif(write('IMG_0001.CR2', data))
+    assert exif['MIMEType'] == 'image/x-canon-cr2'
+    assert exif['DateTimeOriginal'] == '2017:01:01 01:01:01'
+    assert exif['ModifyDate'] == '2018:05:05 05:05:05'
+    assert read_exif(write('IMG_0001.NEF', data))['MIMEType'] == 'image/x-nikon-nef'
+    assert read_exif(write('IMG_0001.dng', data))['MIMEType'] == 'image/x-adobe-dng'
+
+
+def test_read_movie_dates():
+    exif = read_exif(write('video.mp4', movie()))
+    assert exif['MIMEType'] == 'video/mp4'
+    assert exif['CreateDate'] == '2017:01:01 01:01:01'
+    assert exif['TrackCreateDate'] == '2017:01:01 01:01:01'
+    assert exif['MediaModifyDate'] == '2017:01:01 01:01:01'
+    assert 'SubSecCreateDate' not in exif
+    assert read_exif(write('video.mov', movie(brand=b'qt  ', version=1)))['MIMEType'] == 'video/quicktime'
+    assert read_exif(write('video.3gp', movie(brand=b'3gp4')))['MIMEType'] == 'video/3gpp'
+
+
+def test_read_heic_exif_item():
+    exif = read_exif(write('photo.heic', heic(tiff(order='>', exif={0x9003: '2017:01:01 01:01:01'}))))
+    assert exif['MIMEType'] == 'image/heic'
+    assert exif['DateTimeOriginal'] == '2017:01:01 01:01:01'
+
+
+def test_bmff_fallback_to_exiftool():
+    xmp = box(b'uuid', bytes.fromhex('be7acfcb97a942e89c71999491e3afac') + b'<x:xmpmeta/>')
+    assert read_exif(write('xmp.mp4', movie(extra=xmp))) is None
+    assert read_exif(write('zero.mp4', movie(created=0))) is None
+    assert read_exif(write('unix.mp4', movie(created=1483232461))) is None
+    assert read_exif(write('unknown.cr3', movie(brand=b'crx '))) is None
+    assert read_exif(write('truncated.mp4', movie()[:-20])) is None
+    assert read_exif(write('xmp.heic', heic(tiff(exif={0x9003: '2017:01:01 01:01:01'}), item_type=b'mime'))) is None
+
+
+def test_fallback_to_exiftool():
+    dates = {0x9003: '2017:01:01 01:01:01'}
+    assert read_exif(write('xmp.jpg', jpeg(tiff(exif=dates), xmp=True))) is None
+    assert read_exif(write('xmp.tif', tiff(exif=dates, extra_ifd0=[(0x02BC, 0)]))) is None
+    assert read_exif(write('noexif.jpg', jpeg())) is None
+    assert read_exif(write('nodate.jpg', jpeg(tiff(ifd0={0x0132: '2018:05:05 05:05:05'})))) is None
+    assert read_exif(write('zero.jpg', jpeg(tiff(exif={0x9003: '0000:00:00 00:00:00'})))) is None
+    assert read_exif(write('unknown.raw', tiff(exif=dates))) is None
+    assert read_exif(write('truncated.jpg', jpeg(tiff(exif=dates))[:40])) is None
+    assert read_exif(write('other.txt', b'text')) is None
+    assert read_exif('reader/not-existing.jpg') is None
+
+
+def test_native_reader_is_used_by_exif(mocker):
+    mocker.patch.object(Exif, '_Exif__read', side_effect=AssertionError('exiftool called'))
+    assert Exif('input/exif.jpg', native=True).data()['CreateDate'] == '2017:01:01 01:01:01'
+
+
+def test_native_reader_matches_exiftool():
+    for file_path in sorted(glob.glob(os.path.join('input', '*'))):
+        native = read_exif(file_path)
+        if native is None:
+            continue
+        exif = Exif(file_path).data()
+        assert dict((tag, native.get(tag)) for tag in COMPARED_TAGS) \
+            == dict((tag, exif.get(tag)) for tag in COMPARED_TAGS)
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+import os
+from datetime import datetime
+
+import pytest
+
+from src.exif import Exif
+from src.exiftool import ArgumentError, ExifTool, ExifToolError, ExifToolPool
+
+os.chdir(os.path.dirname(__file__))
+
+
+def test_exif_reads_valid_file_through_session():
+    exiftool = ExifToolPool()
+    assert Exif("input/exif.jpg", exiftool).data()['CreateDate'] == '2017:01:01 01:01:01'
+    assert Exif("input/exif.mp4", exiftool).data()['MIMEType'] == 'video/mp4'
+    exiftool.close()
+
+
+def test_exif_session_handles_missing_file():
+    exiftool = ExifToolPool()
+    assert Exif("not-existing.jpg", exiftool).data() is None
+    assert not Exif("not-existing.jpg", exiftool).write_created_date(datetime(2017, 1, 1))
+    exiftool.close()
+
+
+def test_session_executes_batch():
+    exiftool = ExifToolPool()
+    results = exiftool.execute_many([['-MIMEType', 'input/exif.jpg'], ['-ver'], ['-MIMEType', 'not-existing.jpg']])
+    assert len(results) == 3
+    assert 'image/jpeg' in results[0][0]
+    assert results[1][0].strip()
+    assert 'not-existing.jpg' in results[2][1]
+    exiftool.close()
+
+
+def test_session_restarts_after_crash():
+    session = ExifTool()
+    session.execute('-ver')
+    session._process.kill()
+    session._process.wait()
+    out, err = session.execute('-ver')
+    assert out.strip()
+    session.stop()
+    assert not session.running
+
+
+def test_session_restarts_lazily_after_close():
+    exiftool = ExifToolPool(size=2)
+    exiftool.close()
+    assert Exif("input/exif.jpg", exiftool).data()['CreateDate'] == '2017:01:01 01:01:01'
+    exiftool.close()
+
+
+def test_session_missing_executable():
+    with pytest.raises(ExifToolError):
+        ExifTool(executable='not-existing-exiftool').execute('-ver')
+    assert Exif("input/exif.jpg", ExifToolPool(executable='not-existing-exiftool')).data() is None
+
+
+def test_file_names_are_encoded_like_subprocess(mocker):
+    # a Latin-1 name as listed by os.listdir on a UTF-8 system
+    assert ExifTool.encode('caf\udce9_20170101_010101.bin') == b'caf\xe9_20170101_010101.bin'
+    # a lone surrogate can't be encoded at all, the file fails alone
+    exiftool = ExifToolPool(executable='not-existing-exiftool')
+    assert not ExifTool.encodable('bad\ud800.jpg')
+    assert Exif('bad\ud800.jpg', exiftool).data() is None
+    execute_json = mocker.patch.object(exiftool, 'execute_json', return_value=[])
+    Exif.prefetch(['input/exif.jpg', 'bad\ud800.jpg'], exiftool)
+    execute_json.assert_called_once_with('-time:all', '-mimetype', 'input/exif.jpg')
+
+
+def test_line_breaks_in_file_names_are_rejected(mocker):
+    # the rest of the name would be read as another argument of the argfile
+    for name in ('a.jpg\n-all=', 'a.jpg\r-all='):
+        assert not ExifTool.encodable(name)
+        with pytest.raises(ArgumentError):
+            ExifTool(executable='not-existing-exiftool').execute_many([['-overwrite_original', name]])
+    # nothing is sent to exiftool, the file fails alone
+    start = mocker.patch.object(ExifTool, 'start', side_effect=AssertionError('exiftool started'))
+    exiftool = ExifToolPool(executable='not-existing-exiftool')
+    assert Exif('a.jpg\n-all=', exiftool).data() is None
+    assert not Exif('a.jpg\n-all=', exiftool).write_created_date(datetime(2017, 1, 1))
+    start.assert_not_called()
@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+import os
+import shutil
+
+from src.file_type import SourceFileType, classify
+
+os.chdir(os.path.dirname(__file__))
+
+
+def write(name, data):
+    path = os.path.join('classify', name)
+    with open(path, 'wb') as file:
+        file.write(data)
+    return path
+
+
+def setup_function():
+    shutil.rmtree('classify', ignore_errors=True)
+    os.mkdir('classify')
+
+
+def teardown_function():
+    shutil.rmtree('classify', ignore_errors=True)
+
+
+def test_classify_media():
+    assert classify(os.path.join('input', 'exif.jpg')) == SourceFileType.IMAGE
+    assert classify(os.path.join('input', 'exif.mp4')) == SourceFileType.VIDEO
+    assert classify(write('photo.png', b'\x89PNG\r\n\x1a\n\x00\x00')) == SourceFileType.IMAGE
+    assert classify(write('photo.heic', b'\x00\x00\x00\x18ftypheic\x00\x00\x00\x00')) == SourceFileType.IMAGE
+    assert classify(write('video.mov', b'\x00\x00\x00\x14ftypqt  \x00\x00\x00\x00')) == SourceFileType.VIDEO
+    assert classify(write('video.mov', b'\x00\x00\x00\x08wide\x00\x00\x00\x00mdat')) == SourceFileType.VIDEO
+    assert classify(write('video.avi', b'RIFF\x00\x00\x00\x00AVI LIST')) == SourceFileType.VIDEO
+    assert classify(write('photo.webp', b'RIFF\x00\x00\x00\x00WEBPVP8 ')) == SourceFileType.IMAGE
+
+
+def test_classify_other_files():
+    assert classify(os.path.join('input', 'other.txt')) == SourceFileType.UNKNOWN
+    assert classify(write('document.pdf', b'%PDF-1.4\n')) == SourceFileType.UNKNOWN
+    assert classify(write('archive.zip', b'PK\x03\x04\x14\x00')) == SourceFileType.UNKNOWN
+    assert classify(write('song.mp3', b'ID3\x03\x00')) == SourceFileType.UNKNOWN
+    assert classify(write('sound.wav', b'RIFF\x00\x00\x00\x00WAVEfmt ')) == SourceFileType.UNKNOWN
+
+
+def test_classify_leaves_undetermined_files_to_exiftool():
+    assert classify(write('image.svg', b'<?xml version="1.0"?><svg/>')) is None
+    assert classify(write('unknown.bin', b'\x01\x02\x03\x04')) is None
+    assert classify(os.path.join('classify', 'not-existing.jpg')) is None
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+import os
+import shutil
+
+from src.copy_engine import partial_path
+from src.journal import DONE, PLANNED, ROLLED_BACK, Journal
+
+os.chdir(os.path.dirname(__file__))
+
+
+def setup_function():
+    shutil.rmtree('journal', ignore_errors=True)
+    os.makedirs('journal/input')
+    os.makedirs('journal/output')
+
+
+def teardown_function():
+    shutil.rmtree('journal', ignore_errors=True)
+
+
+def write(path, content):
+    with open(path, 'wb') as file:
+        file.write(content)
+    return os.path.abspath(path)
+
+
+def entry(source, target, strategy):
+    return {'source': os.path.abspath(source), 'target': os.path.abspath(target), 'strategy': strategy,
+            'status': PLANNED}
+
+
+def test_load_keeps_last_entry_and_ignores_cut_line():
+    journal = Journal('journal/test.journal', batch_size=2)
+    journal.record('journal/input/a.jpg', 'journal/output/a.jpg', 'move', PLANNED)
+    journal.record('journal/input/a.jpg', 'journal/output/a.jpg', 'move', DONE)
+    journal.record('journal/input/b.jpg', 'journal/output/b.jpg', 'move', PLANNED)
+    journal.close()
+    with open('journal/test.journal', 'a') as file:
+        file.write('{"source": "/cut')
+    entries = Journal.load('journal/test.journal')
+    assert sorted(entries) == [os.path.abspath('journal/input/a.jpg'), os.path.abspath('journal/input/b.jpg')]
+    assert entries[os.path.abspath('journal/input/a.jpg')]['status'] == DONE
+    assert entries[os.path.abspath('journal/input/b.jpg')]['target'] == os.path.abspath('journal/output/b.jpg')
+
+
+def test_recover_move():
+    write('journal/input/moved.jpg', b'content')
+    os.rename('journal/input/moved.jpg', 'journal/output/moved.jpg')
+    assert Journal.recover(entry('journal/input/moved.jpg', 'journal/output/moved.jpg', 'move')) == DONE
+
+    write('journal/input/copied.jpg', b'content')
+    write('journal/output/copied.jpg', b'content')
+    assert Journal.recover(entry('journal/input/copied.jpg', 'journal/output/copied.jpg', 'move')) == DONE
+    assert not os.path.exists('journal/input/copied.jpg')
+
+    write('journal/input/partial.jpg', b'content')
+    write(partial_path('journal/output/partial.jpg'), b'cont')
+    assert Journal.recover(entry('journal/input/partial.jpg', 'journal/output/partial.jpg', 'move')) == ROLLED_BACK
+    assert os.path.exists('journal/input/partial.jpg')
+    assert sorted(os.listdir('journal/output')) == ['copied.jpg', 'moved.jpg']
+
+    write('journal/input/planned.jpg', b'content')
+    assert Journal.recover(entry('journal/input/planned.jpg', 'journal/output/planned.jpg', 'move')) == ROLLED_BACK
+    assert os.path.exists('journal/input/planned.jpg')
+
+
+def test_recover_copy_and_link():
+    write('journal/input/copy.jpg', b'content')
+    write(partial_path('journal/output/copy.jpg'), b'conten')
+    assert Journal.recover(entry('journal/input/copy.jpg', 'journal/output/copy.jpg', 'copy')) == ROLLED_BACK
+    assert os.listdir('journal/output') == []
+
+    # a target with another content belongs to another file and is kept
+    write('journal/output/taken.jpg', b'other')
+    assert Journal.recover(entry('journal/input/copy.jpg', 'journal/output/taken.jpg', 'copy')) == ROLLED_BACK
+    assert os.listdir('journal/output') == ['taken.jpg']
+
+    os.link('journal/input/copy.jpg', 'journal/output/link.jpg')
+    assert Journal.recover(entry('journal/input/copy.jpg', 'journal/output/link.jpg', 'link')) == DONE
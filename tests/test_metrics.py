@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+import json
+import os
+import shutil
+
+from src.metrics import Metrics
+
+os.chdir(os.path.dirname(__file__))
+
+
+def setup_function():
+    shutil.rmtree('metrics', ignore_errors=True)
+
+
+def teardown_function():
+    shutil.rmtree('metrics', ignore_errors=True)
+
+
+def test_report_stages():
+    metrics = Metrics()
+    metrics.observe('metadata', 0.3)
+    metrics.observe('metadata', 0.5)
+    metrics.observe('transfer', 0.002, 1000)
+    metrics.observe('transfer', 20, 3000)
+    with metrics.timed('date'):
+        pass
+    report = metrics.report({'all': 2})
+    assert report['counters'] == {'all': 2}
+    assert sorted(report['stages']) == ['date', 'metadata', 'transfer']
+    metadata = report['stages']['metadata']
+    assert metadata['count'] == 2
+    assert metadata['seconds'] == 0.8
+    assert metadata['buckets']['0.5'] == 2
+    assert metadata['p50'] == 0.5
+    transfer = report['stages']['transfer']
+    assert transfer['bytes'] == 4000
+    assert transfer['buckets']['0.0025'] == 1
+    assert transfer['buckets']['+Inf'] == 1
+    assert transfer['p99'] == float('inf')
+    assert round(sum(stage['share'] for stage in report['stages'].values()), 2) == 1
+
+
+def test_write_reports():
+    metrics = Metrics()
+    metrics.observe('metadata', 0.3)
+    metrics.observe('metadata', 0.03)
+    metrics.write_json('metrics/report.json', {'all': 2})
+    metrics.write_prometheus('metrics/phockup.prom', {'all': 2})
+    assert sorted(os.listdir('metrics')) == ['phockup.prom', 'report.json']
+    with open('metrics/report.json') as file:
+        assert json.load(file)['stages']['metadata']['count'] == 2
+    with open('metrics/phockup.prom') as file:
+        lines = file.read().splitlines()
+    assert 'phockup_files{counter="all"} 2' in lines
+    assert 'phockup_stage_seconds_bucket{stage="metadata",le="0.025"} 0' in lines
+    assert 'phockup_stage_seconds_bucket{stage="metadata",le="0.05"} 1' in lines
+    assert 'phockup_stage_seconds_bucket{stage="metadata",le="+Inf"} 2' in lines
+    assert 'phockup_stage_seconds_count{stage="metadata"} 2' in lines
@@ -1,13 +1,24 @@
 #!/usr/bin/env python3
+import filecmp
+import json
 import os
 import re
 import shutil
 import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from unittest.mock import call
 
+import pytest
+
+from src import exif_reader, file_type
+from src.copy_engine import CopyEngine, partial_path
 from src.dependency import check_dependencies
 from src.exif import Exif
+from src.journal import Journal
 from src.phockup import Phockup
+from src.throttle import io_throttle
 
 os.chdir(os.path.dirname(__file__))
 
@@ -126,6 +137,81 @@ def test_walking_directory():
     shutil.rmtree('output', ignore_errors=True)
 
 
+def test_walk_input_matches_os_walk(mocker):
+    shutil.rmtree('walk', ignore_errors=True)
+    for directory in ('walk/day2/day3', 'walk/day1', 'walk/day2/day1', 'walk/empty'):
+        os.makedirs(directory)
+    for file_path in ('walk/2.jpg', 'walk/1.jpg', 'walk/day2/day3/1.jpg', 'walk/day1/1.jpg', 'walk/day1/Thumbs.db'):
+        open(file_path, 'w').close()
+    mocker.patch.object(Phockup, 'check_directories')
+    mocker.patch.object(Phockup, 'walk_directory')
+    phockup = Phockup('walk')
+    expected = [(root, [os.path.join(root, name) for name in sorted(files) if name != 'Thumbs.db'])
+                for root, dirs, files in os.walk('walk')]
+    assert list(phockup.walk_input()) == expected
+    shutil.rmtree('walk', ignore_errors=True)
+
+
+def test_walking_directory_prefetches_metadata(mocker):
+    shutil.rmtree('output', ignore_errors=True)
+    mocker.spy(Exif, 'data')
+    mocker.spy(Exif, 'prefetch')
+    Phockup('input',
+            images_output_path=os.path.join('output', 'images'),
+            videos_output_path=os.path.join('output', 'videos'),
+            unknown_output_path=os.path.join('output', 'unknown'),
+            prefetch_size=3)
+    # 12 files without the 2 xmp sidecars, which are transferred with their images
+    assert Exif.prefetch.call_count == 4
+    assert Exif.data.call_count == 0
+    assert os.path.isfile('output/images/2017/01/01/20170101-010101.jpg')
+    shutil.rmtree('output', ignore_errors=True)
+
+
+def test_files_are_classified_once(mocker):
+    shutil.rmtree('output', ignore_errors=True)
+    classified = []
+
+    def classify(file_path):
+        classified.append(file_path)
+        return file_type.classify(file_path)
+
+    def classify_and_read(file_path):
+        classified.append(file_path)
+        return exif_reader.classify_and_read(file_path)
+
+    mocker.patch('src.phockup.classify', classify)
+    mocker.patch('src.phockup.classify_and_read', classify_and_read)
+    mocker.patch('src.source_file.classify', classify)
+    Phockup('input', images_output_path=os.path.join('output', 'images'),
+            videos_output_path=os.path.join('output', 'videos'), unknown_output_path=os.path.join('output', 'unknown'))
+    assert classified
+    assert len(classified) == len(set(classified))
+    shutil.rmtree('output', ignore_errors=True)
+
+
+def test_prefetch_opens_every_file_once(mocker):
+    mocker.patch.object(Phockup, 'check_directories')
+    mocker.patch.object(Phockup, 'walk_directory')
+    phockup = Phockup('input', unknown_output_path='output/unknown')
+    file_paths = sorted(os.path.join('input', name) for name in os.listdir('input'))
+    opened = []
+    builtin_open = open
+
+    def counted_open(file, *args, **kwargs):
+        opened.append(file)
+        return builtin_open(file, *args, **kwargs)
+
+    mocker.patch.object(Exif, 'prefetch', return_value={})
+    mocker.patch('builtins.open', side_effect=counted_open)
+    exif_data, file_types = phockup.prefetch(file_paths)
+    mocker.stopall()
+    # the native reader reads the dates of exif.jpg through the file opened to classify it
+    assert os.path.normpath('input/exif.jpg') in exif_data
+    assert sorted(file_types) == file_paths
+    assert sorted(opened) == file_paths
+
+
 def test_walking_directory_without_images():
     shutil.rmtree('output', ignore_errors=True)
     Phockup('input',
@@ -252,7 +338,7 @@ def test_process_broken_link(mocker, capsys):
 
     phockup.log = phockup.setup_logger('test-output.log')
     phockup.process_file("input/not_a_file.jpg")
-    phockup.log.handlers = []
+    phockup.stop_logger()
     output_log = [line.rstrip('\n') for line in open('test-output.log')]
     os.remove('test-output.log')
     assert any(item.find('skipped, no such file or directory') > 0 for item in output_log)
@@ -272,7 +358,7 @@ def test_process_broken_link_move(mocker, capsys):
         os.remove('test-output.log')
     phockup.log = phockup.setup_logger('test-output.log')
     phockup.process_file("input/not_a_file.jpg")
-    phockup.log.handlers = []
+    phockup.stop_logger()
     output_log = [line.rstrip('\n') for line in open('test-output.log')]
     os.remove('test-output.log')
     assert any(item.find('skipped, no such file or directory') > 0 for item in output_log)
@@ -304,6 +390,27 @@ def test_process_image_xmp(mocker):
     shutil.rmtree('output', ignore_errors=True)
 
 
+def test_process_file_looks_up_sidecars_without_listing(mocker):
+    shutil.rmtree('output', ignore_errors=True)
+    mocker.patch.object(Phockup, 'check_directories')
+    mocker.patch.object(Phockup, 'walk_directory')
+    phockup = Phockup('input', images_output_path='output', videos_output_path='output',
+                      unknown_output_path='output/unknown')
+    scandir = os.scandir
+
+    def output_scandir(path='.'):
+        # the output is listed by the target index, the input is not
+        assert os.path.abspath(path) != os.path.abspath('input')
+        return scandir(path)
+
+    mocker.patch('os.scandir', side_effect=output_scandir)
+    phockup.process_file("input/xmp_noext.jpg")
+    mocker.stopall()
+    assert os.path.isfile("output/2017/01/01/20170101-010101.jpg")
+    assert os.path.isfile("output/2017/01/01/20170101-010101.xmp")
+    shutil.rmtree('output', ignore_errors=True)
+
+
 def test_process_image_xmp_noext(mocker):
     shutil.rmtree('output', ignore_errors=True)
     mocker.patch.object(Phockup, 'check_directories')
@@ -427,7 +534,7 @@ def test_process_exists_same(mocker, capsys):
     phockup.process_file("input/exif.jpg")
     assert os.path.isfile("output/2017/01/01/20170101-010101.jpg")
     phockup.process_file("input/exif.jpg")
-    phockup.log.handlers = []
+    phockup.stop_logger()
     output_log = [line.rstrip('\n') for line in open('test-output.log')]
     os.remove('test-output.log')
     assert any(item.find('skipped, duplicated file') > 1 for item in output_log)
@@ -517,3 +624,327 @@ def test_keep_original_filenames_and_filenames_case(mocker):
     assert os.path.isfile("output/2017/10/06/UNKNOWN.jpg")
     assert not 'unknown.jpg' in os.listdir("output/2017/10/06")
     shutil.rmtree('output', ignore_errors=True)
+
+
+def test_walking_directory_with_workers():
+    shutil.rmtree('output', ignore_errors=True)
+    date_regex = re.compile(
+        r'.*[_-](?P<year>\d{4})(?P<month>\d{2})(?P<day>\d{2})[_-]?(?P<hour>\d{2})(?P<minute>\d{2})(?P<second>\d{2})')
+    sequential = Phockup('input',
+                         date_regex=date_regex,
+                         images_output_path=os.path.join('output', 'sequential', 'images'),
+                         videos_output_path=os.path.join('output', 'sequential', 'videos'),
+                         unknown_output_path=os.path.join('output', 'sequential', 'unknown'))
+    concurrent = Phockup('input',
+                         date_regex=date_regex,
+                         images_output_path=os.path.join('output', 'concurrent', 'images'),
+                         videos_output_path=os.path.join('output', 'concurrent', 'videos'),
+                         unknown_output_path=os.path.join('output', 'concurrent', 'unknown'),
+                         workers=4,
+                         prefetch_size=2)
+    comparison = filecmp.dircmp(os.path.join('output', 'sequential'), os.path.join('output', 'concurrent'))
+    assert not comparison.left_only and not comparison.right_only and not comparison.diff_files
+    for counter in ('counter_all_files', 'counter_image_files', 'counter_video_files', 'counter_unknown_files',
+                    'counter_duplicates', 'counter_processed_files'):
+        assert getattr(sequential, counter) == getattr(concurrent, counter)
+    shutil.rmtree('output', ignore_errors=True)
+
+
+def test_process_same_target_with_workers(mocker):
+    shutil.rmtree('output', ignore_errors=True)
+    mocker.patch.object(Phockup, 'check_directories')
+    mocker.patch.object(Phockup, 'walk_directory')
+    phockup = Phockup('input',
+                      images_output_path='output',
+                      videos_output_path='output',
+                      unknown_output_path='output/unknown',
+                      workers=4)
+    files = ["input/exif.jpg", "input/exif_1.jpg", "input/exif.jpg", "input/exif_2.jpg", "input/exif_1.jpg"]
+    sources = dict((file_path, phockup.probe_file(file_path)) for file_path in set(files))
+    placements = {}
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        for file_path in files:
+            key = Phockup.placement_key(sources[file_path])
+            placements[key] = pool.submit(phockup.place_file, sources[file_path], placements.get(key))
+    assert filecmp.cmp("input/exif.jpg", "output/2017/01/01/20170101-010101.jpg", shallow=False)
+    assert filecmp.cmp("input/exif_1.jpg", "output/2017/01/01/20170101-010101-001.jpg", shallow=False)
+    assert filecmp.cmp("input/exif_2.jpg", "output/2017/01/01/20170101-010101-002.jpg", shallow=False)
+    assert phockup.counter_duplicates == 2
+    shutil.rmtree('output', ignore_errors=True)
+
+
+def test_process_duplicate_with_other_name_using_content_index(mocker):
+    shutil.rmtree('output', ignore_errors=True)
+    mocker.patch.object(Phockup, 'check_directories')
+    mocker.patch.object(Phockup, 'walk_directory')
+    mocker.patch.object(Exif, 'data')
+    Exif.data.return_value = {
+        "MIMEType": "image/jpeg",
+        "CreateDate": "2017:01:01 01:01:01"
+    }
+    phockup = Phockup('input',
+                      images_output_path='output',
+                      videos_output_path='output',
+                      unknown_output_path='output/unknown',
+                      original_filenames=True,
+                      content_index=True,
+                      content_index_path='output/index.sqlite')
+    phockup.process_file("input/exif.jpg")
+    phockup.process_file("input/xmp_noext.jpg")
+    phockup.process_file("input/exif_1.jpg")
+    assert os.path.isfile("output/2017/01/01/exif.jpg")
+    assert not os.path.isfile("output/2017/01/01/xmp_noext.jpg")
+    assert os.path.isfile("output/2017/01/01/exif_1.jpg")
+    assert phockup.counter_duplicates == 1
+    shutil.rmtree('output', ignore_errors=True)
+
+
+def test_walking_directory_dedups_input():
+    shutil.rmtree('output', ignore_errors=True)
+    shutil.rmtree('dedup', ignore_errors=True)
+    os.makedirs('dedup/backup')
+    os.makedirs('dedup/takeout')
+    for file_path, content in (('dedup/backup/notes.txt', b'notes'), ('dedup/takeout/notes (1).txt', b'notes'),
+                               ('dedup/takeout/other.txt', b'other')):
+        with open(file_path, 'wb') as file:
+            file.write(content)
+    phockup = Phockup('dedup', unknown_output_path='output/unknown', dedup_input=True, move=True)
+    assert len(os.listdir('output/unknown')) == 2
+    assert phockup.counter_input_duplicates == 1
+    assert phockup.counter_duplicates == 1
+    assert not os.path.exists('dedup')
+    shutil.rmtree('output', ignore_errors=True)
+    shutil.rmtree('dedup', ignore_errors=True)
+
+
+def test_walking_directory_writes_report():
+    shutil.rmtree('output', ignore_errors=True)
+    phockup = Phockup('input',
+                      images_output_path=os.path.join('output', 'images'),
+                      videos_output_path=os.path.join('output', 'videos'),
+                      unknown_output_path=os.path.join('output', 'unknown'),
+                      report_path=os.path.join('output', 'report.json'),
+                      prometheus_path=os.path.join('output', 'phockup.prom'))
+    with open(os.path.join('output', 'report.json')) as file:
+        report = json.load(file)
+    assert report['counters']['all'] == phockup.counter_all_files
+    assert report['stages']['date']['count'] == phockup.counter_all_files
+    assert report['stages']['transfer']['count'] == phockup.counter_processed_files - phockup.counter_duplicates
+    assert os.path.isfile(os.path.join('output', 'phockup.prom'))
+    shutil.rmtree('output', ignore_errors=True)
+
+
+def test_resume_from_journal():
+    shutil.rmtree('output', ignore_errors=True)
+    shutil.rmtree('resume', ignore_errors=True)
+    os.makedirs('resume')
+    os.makedirs('output/unknown')
+    for name in ('done.txt', 'partial.txt', 'new.txt'):
+        with open(os.path.join('resume', name), 'w') as file:
+            file.write('content of %s' % name)
+    # the interrupted run copied done.txt and was copying partial.txt
+    with open('output/unknown/done.txt', 'w') as file:
+        file.write('copied before')
+    with open(partial_path('output/unknown/partial.txt'), 'w') as file:
+        file.write('content')
+    with open('output/phockup.journal', 'w') as file:
+        for name, status in (('done.txt', 'planned'), ('done.txt', 'done'), ('partial.txt', 'planned')):
+            file.write(json.dumps({'source': os.path.abspath(os.path.join('resume', name)),
+                                   'target': os.path.abspath(os.path.join('output/unknown', name)),
+                                   'strategy': 'copy', 'status': status}) + '\n')
+    phockup = Phockup('resume', unknown_output_path='output/unknown',
+                      journal_path='output/phockup.journal', resume=True)
+    assert phockup.counter_all_files == 2
+    assert sorted(os.listdir('output/unknown')) == ['done.txt', 'new.txt', 'partial.txt']
+    assert filecmp.cmp('resume/partial.txt', 'output/unknown/partial.txt', shallow=False)
+    with open('output/unknown/done.txt') as file:
+        assert file.read() == 'copied before'
+    entries = Journal.load('output/phockup.journal')
+    assert all(entry['status'] == 'done' for entry in entries.values())
+    assert len(entries) == 3
+    shutil.rmtree('output', ignore_errors=True)
+    shutil.rmtree('resume', ignore_errors=True)
+
+
+def test_plan_and_apply():
+    shutil.rmtree('output', ignore_errors=True)
+    shutil.rmtree('plan', ignore_errors=True)
+    os.makedirs('plan/first')
+    os.makedirs('plan/second')
+    for file_path, content in (('plan/first/notes.txt', 'first'), ('plan/second/notes.txt', 'second'),
+                               ('plan/second/copy.txt', 'first'), ('plan/second/changed.txt', 'changed')):
+        with open(file_path, 'w') as file:
+            file.write(content)
+    Phockup('plan', unknown_output_path='output/unknown', original_filenames=True, dry_run=True,
+            plan_path='output/plan.jsonl')
+    assert os.listdir('output') == ['plan.jsonl']
+    with open('output/plan.jsonl') as file:
+        entries = dict((os.path.relpath(entry['source']), entry) for entry in map(json.loads, file))
+    assert os.path.basename(entries['plan/first/notes.txt']['target']) == 'notes.txt'
+    assert os.path.basename(entries['plan/second/notes.txt']['target']) == 'notes-001.txt'
+    assert entries['plan/second/copy.txt']['status'] == 'transfer'
+    assert entries['plan/second/changed.txt']['type'] == 'UNKNOWN'
+
+    with open('plan/second/changed.txt', 'a') as file:
+        file.write(' again')
+    phockup = Phockup('plan', unknown_output_path='output/unknown', original_filenames=True,
+                      apply_path='output/plan.jsonl', move=True)
+    assert phockup.counter_plan_changed == 1
+    assert sorted(os.listdir('output/unknown')) == ['copy.txt', 'notes-001.txt', 'notes.txt']
+    assert os.listdir('plan/second') == ['changed.txt']
+    assert not os.path.exists('plan/first')
+    shutil.rmtree('output', ignore_errors=True)
+    shutil.rmtree('plan', ignore_errors=True)
+
+
+def test_apply_transfers_duplicate_of_changed_target():
+    shutil.rmtree('output', ignore_errors=True)
+    shutil.rmtree('plan', ignore_errors=True)
+    os.makedirs('plan/first')
+    os.makedirs('plan/second')
+    for file_path in ('plan/first/notes.txt', 'plan/second/notes.txt'):
+        with open(file_path, 'w') as file:
+            file.write('same')
+    Phockup('plan', unknown_output_path='output/unknown', original_filenames=True, dry_run=True,
+            plan_path='output/plan.jsonl')
+    with open('output/plan.jsonl') as file:
+        entries = dict((os.path.relpath(entry['source']), entry) for entry in map(json.loads, file))
+    assert entries['plan/second/notes.txt']['status'] == 'duplicate'
+
+    # the planned original is skipped as changed and another file takes its target
+    with open('plan/first/notes.txt', 'a') as file:
+        file.write(' edited')
+    os.makedirs('output/unknown')
+    with open('output/unknown/notes.txt', 'w') as file:
+        file.write('other')
+    Phockup('plan', unknown_output_path='output/unknown', original_filenames=True,
+            apply_path='output/plan.jsonl', move=True)
+    with open('output/unknown/notes-001.txt') as file:
+        assert file.read() == 'same'
+    assert not os.path.exists('plan/second')
+    shutil.rmtree('output', ignore_errors=True)
+    shutil.rmtree('plan', ignore_errors=True)
+
+
+@pytest.mark.parametrize('mode', [{}, {'move': True}])
+def test_file_created_after_indexing_is_not_replaced(mocker, mode):
+    shutil.rmtree('output', ignore_errors=True)
+    shutil.rmtree('late', ignore_errors=True)
+    os.makedirs('late/inbox')
+    with open('late/inbox/notes.txt', 'w') as file:
+        file.write('incoming')
+    copy, move = CopyEngine.copy, CopyEngine.move
+
+    def library_file_appears(transfer):
+        def transfer_later(copy_engine, source, target):
+            if not os.path.exists('output/unknown/notes.txt'):
+                with open('output/unknown/notes.txt', 'w') as file:
+                    file.write('library')
+            return transfer(copy_engine, source, target)
+        return transfer_later
+
+    mocker.patch.object(CopyEngine, 'copy', library_file_appears(copy))
+    mocker.patch.object(CopyEngine, 'move', library_file_appears(move))
+    Phockup('late', unknown_output_path='output/unknown', original_filenames=True, **mode)
+    with open('output/unknown/notes.txt') as file:
+        assert file.read() == 'library'
+    with open('output/unknown/notes-001.txt') as file:
+        assert file.read() == 'incoming'
+    shutil.rmtree('output', ignore_errors=True)
+    shutil.rmtree('late', ignore_errors=True)
+
+
+def test_throttled_copy(mocker):
+    shutil.rmtree('output', ignore_errors=True)
+    file_operation = mocker.spy(io_throttle, 'file')
+    phockup = Phockup('input', unknown_output_path='output/unknown', images_output_path='output/images',
+                      videos_output_path='output/videos', bytes_per_second=1024 ** 3, files_per_second=10000)
+    assert io_throttle.bytes.rate == 1024 ** 3
+    assert file_operation.call_count >= phockup.counter_processed_files - phockup.counter_duplicates
+    Phockup('input', unknown_output_path='output/unknown', images_output_path='output/images',
+            videos_output_path='output/videos', dry_run=True)
+    assert not io_throttle.limited
+    shutil.rmtree('output', ignore_errors=True)
+
+
+def test_watch_processes_new_files():
+    shutil.rmtree('output', ignore_errors=True)
+    shutil.rmtree('inbox', ignore_errors=True)
+    os.makedirs('inbox/day1')
+    with open('inbox/day1/first.txt', 'w') as file:
+        file.write('first')
+    stop = threading.Event()
+    thread = threading.Thread(target=Phockup, args=('inbox',), kwargs=dict(
+        unknown_output_path='output/unknown', original_filenames=True, move=True, watch=True,
+        watch_settle=0.1, watch_stop=stop))
+    thread.start()
+    try:
+        for _ in range(100):
+            if os.path.exists('output/unknown/first.txt'):
+                break
+            time.sleep(0.05)
+        os.makedirs('inbox/day2')
+        with open('inbox/day2/second.txt', 'w') as file:
+            file.write('second')
+        for _ in range(100):
+            if os.path.exists('output/unknown/second.txt'):
+                break
+            time.sleep(0.05)
+    finally:
+        stop.set()
+        thread.join()
+    assert sorted(os.listdir('output/unknown')) == ['first.txt', 'second.txt']
+    assert os.listdir('inbox') == []
+    shutil.rmtree('output', ignore_errors=True)
+    shutil.rmtree('inbox', ignore_errors=True)
+
+
+@pytest.mark.parametrize('move', [True, False])
+def test_watch_transfers_sidecar_arriving_after_its_file(move):
+    shutil.rmtree('output', ignore_errors=True)
+    shutil.rmtree('inbox', ignore_errors=True)
+    os.makedirs('inbox')
+    with open('inbox/photo.dat', 'w') as file:
+        file.write('photo')
+    stop = threading.Event()
+    thread = threading.Thread(target=Phockup, args=('inbox',), kwargs=dict(
+        unknown_output_path='output/unknown', original_filenames=True, move=move, watch=True,
+        watch_settle=0.1, watch_stop=stop))
+    thread.start()
+    try:
+        for _ in range(100):
+            if os.path.exists('output/unknown/photo.dat'):
+                break
+            time.sleep(0.05)
+        for name in ('photo.dat.xmp', 'photo.THM'):
+            with open(os.path.join('inbox', name), 'w') as file:
+                file.write(name)
+        for _ in range(100):
+            if os.path.exists('output/unknown/photo.dat.xmp') and os.path.exists('output/unknown/photo.THM'):
+                break
+            time.sleep(0.05)
+    finally:
+        stop.set()
+        thread.join()
+    assert sorted(os.listdir('output/unknown')) == ['photo.THM', 'photo.dat', 'photo.dat.xmp']
+    with open('output/unknown/photo.dat.xmp') as file:
+        assert file.read() == 'photo.dat.xmp'
+    assert sorted(os.listdir('inbox')) == ([] if move else ['photo.THM', 'photo.dat', 'photo.dat.xmp'])
+    shutil.rmtree('output', ignore_errors=True)
+    shutil.rmtree('inbox', ignore_errors=True)
+
+
+def test_sidecars_are_transferred_with_their_file():
+    shutil.rmtree('output', ignore_errors=True)
+    shutil.rmtree('sidecars', ignore_errors=True)
+    os.makedirs('sidecars')
+    for name in ('clip.bin', 'clip.THM', 'photo.dat', 'photo.AAE', 'photo.dat.xmp', 'lonely.xmp', 'lonely.THM'):
+        with open(os.path.join('sidecars', name), 'w') as file:
+            file.write(name)
+    phockup = Phockup('sidecars', unknown_output_path='output/unknown', original_filenames=True, move=True)
+    assert phockup.counter_all_files == 3
+    assert sorted(os.listdir('output/unknown')) == ['clip.THM', 'clip.bin', 'lonely.THM', 'photo.AAE',
+                                                    'photo.dat', 'photo.dat.xmp']
+    assert os.listdir('sidecars') == ['lonely.xmp']
+    shutil.rmtree('output', ignore_errors=True)
+    shutil.rmtree('sidecars', ignore_errors=True)
@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+import threading
+import time
+
+import pytest
+
+from src.pipeline import buffered
+
+
+def test_buffered_keeps_order():
+    assert list(buffered(iter(range(100)), 3)) == list(range(100))
+
+
+def test_buffered_is_bounded():
+    produced = []
+
+    def produce():
+        for item in range(100):
+            produced.append(item)
+            yield item
+
+    items = buffered(produce(), 5)
+    assert next(items) == 0
+    time.sleep(0.5)
+    # the consumed item, the buffer and the one waiting to be put
+    assert len(produced) <= 7
+    items.close()
+
+
+def test_buffered_raises_stage_errors():
+    def produce():
+        yield 1
+        raise ValueError('broken stage')
+
+    items = buffered(produce(), 2)
+    assert next(items) == 1
+    with pytest.raises(ValueError):
+        next(items)
+
+
+def test_buffered_stops_stage_on_close():
+    closed = threading.Event()
+
+    def produce():
+        try:
+            while True:
+                yield 1
+        finally:
+            closed.set()
+
+    items = buffered(produce(), 2)
+    next(items)
+    items.close()
+    assert closed.wait(2)
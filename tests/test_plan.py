@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+import json
+import os
+import shutil
+from datetime import datetime, timedelta, timezone
+
+from src.file_type import SourceFileType
+from src.plan import PlannedFile, parse_date, read_plan
+
+os.chdir(os.path.dirname(__file__))
+
+
+def setup_function():
+    shutil.rmtree('plans', ignore_errors=True)
+    os.makedirs('plans')
+
+
+def teardown_function():
+    shutil.rmtree('plans', ignore_errors=True)
+
+
+def test_planned_file():
+    planned = PlannedFile({'source': '/input/IMG_20170101_010101.jpg', 'size': 3, 'mtime_ns': 1, 'type': 'IMAGE',
+                           'date': '2017-01-01T01:01:01', 'status': 'transfer',
+                           'target': '/output/2017/01/01/20170101-010101.jpg', 'duplicate_of': None,
+                           'write_date': '2017-01-01T01:01:01'})
+    assert planned.type == SourceFileType.IMAGE
+    assert not planned.skipped
+    assert planned.output_path == '/output/2017/01/01'
+    assert planned.target_file_name() == '20170101-010101.jpg'
+    assert planned.date == {'date': datetime(2017, 1, 1, 1, 1, 1), 'subseconds': '', 'isexif': False}
+
+
+def test_parse_date():
+    for date in (datetime(2017, 1, 1, 1, 1, 1), datetime(2017, 1, 1, 1, 1, 1, 120000),
+                 datetime(2017, 1, 1, 1, 1, 1, tzinfo=timezone(timedelta(hours=-2, minutes=-30)))):
+        assert parse_date(date.isoformat()) == date
+        assert parse_date(date.isoformat()).utcoffset() == date.utcoffset()
+
+
+def test_read_plan_detects_changed_sources():
+    for name in ('same.txt', 'changed.txt'):
+        with open(os.path.join('plans', name), 'w') as file:
+            file.write('content')
+    with open('plans/plan.jsonl', 'w') as file:
+        for name in ('same.txt', 'changed.txt', 'missing.txt'):
+            path = os.path.abspath(os.path.join('plans', name))
+            stat = os.stat(path) if os.path.exists(path) else None
+            file.write(json.dumps({'source': path, 'size': stat.st_size if stat else 0,
+                                   'mtime_ns': stat.st_mtime_ns if stat else 0}) + '\n')
+    with open('plans/changed.txt', 'a') as file:
+        file.write(' and more')
+    assert [(os.path.basename(entry['source']), changed) for entry, changed in read_plan('plans/plan.jsonl')] == [
+        ('same.txt', False), ('changed.txt', True), ('missing.txt', True)]
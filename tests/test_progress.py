@@ -0,0 +1,31 @@
+#!/usr/bin/env python3
+import io
+
+from src.progress import Progress, format_duration
+
+
+def test_format_duration():
+    assert format_duration(59.9) == '0:59'
+    assert format_duration(61) == '1:01'
+    assert format_duration(3725) == '1:02:05'
+
+
+def test_progress_is_throttled():
+    stream = io.StringIO()
+    progress = Progress(stream, interval=60)
+    for _ in range(100):
+        progress.advance(files=1, size=1024 * 1024)
+    assert stream.getvalue() == ''
+    progress.set_total(400)
+    progress.finish()
+    lines = stream.getvalue().splitlines()
+    assert len(lines) == 1
+    assert lines[0].startswith('100/400 files, ')
+    assert 'MB/s, ETA ' in lines[0]
+
+
+def test_progress_line_without_total():
+    progress = Progress(io.StringIO())
+    progress.advance(files=10, size=10 * 1024 * 1024)
+    line = progress.line(progress._start + 2)
+    assert line == '10 files, 5.0 files/s, 5.0 MB/s, elapsed 0:02'
@@ -0,0 +1,25 @@
+#!/usr/bin/env python3
+from src.sidecar import group_sidecars, sidecar_target
+
+
+def test_group_sidecars():
+    primaries, sidecars = group_sidecars([
+        'day1/IMG_1234.CR2', 'day1/IMG_1234.CR2.xmp', 'day1/IMG_1234.xmp', 'day1/IMG_1234.JPG',
+        'day1/IMG_1235.HEIC', 'day1/IMG_1235.AAE', 'day1/MVI_0001.MOV', 'day1/MVI_0001.THM',
+        'day1/orphan.xmp', 'day1/orphan.THM', 'day1/notes.txt'])
+    assert primaries == ['day1/IMG_1234.CR2', 'day1/IMG_1234.JPG', 'day1/IMG_1235.HEIC', 'day1/MVI_0001.MOV',
+                         'day1/notes.txt', 'day1/orphan.THM']
+    assert sidecars == {
+        'day1/IMG_1234.CR2': ['day1/IMG_1234.CR2.xmp', 'day1/IMG_1234.xmp'],
+        'day1/IMG_1235.HEIC': ['day1/IMG_1235.AAE'],
+        'day1/MVI_0001.MOV': ['day1/MVI_0001.THM'],
+    }
+
+
+def test_sidecar_target():
+    assert sidecar_target('in/IMG_1234.CR2', 'in/IMG_1234.CR2.xmp', 'out/20170101-010101-001.CR2') == \
+        'out/20170101-010101-001.CR2.xmp'
+    assert sidecar_target('in/IMG_1234.CR2', 'in/IMG_1234.xmp', 'out/20170101-010101.CR2') == \
+        'out/20170101-010101.xmp'
+    assert sidecar_target('in/IMG_1235.HEIC', 'in/IMG_1235.AAE', 'out/20170101-010101.HEIC') == \
+        'out/20170101-010101.AAE'
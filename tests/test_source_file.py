@@ -3,7 +3,7 @@ import re
 from datetime import datetime
 from src.date import Date
 from src.exif import Exif
-from src.source_file import SourceFile, SourceFileType
+from src.source_file import RunConfig, SourceFile, SourceFileType
 
 os.chdir(os.path.dirname(__file__))
 
@@ -425,6 +425,16 @@ def test_existed_unknown_file(mocker):
     assert source_file.skipped
 
 
+def test_unknown_file_is_not_read(mocker):
+    mocker.patch.object(Exif, 'data', side_effect=AssertionError('metadata read'))
+    source_file = SourceFile(
+        unknown_output_path="output",
+        file_path=os.path.join("input", "other.txt")
+    )
+    assert source_file.type == SourceFileType.UNKNOWN
+    assert source_file.target_file_path() == os.path.join("output", "other.txt")
+
+
 def test_not_existed_file(mocker):
     """
       target file path for not existed file is unknown_output_path/fileName
@@ -518,3 +528,24 @@ def test_not_existed_file(mocker):
     assert source_file.type == SourceFileType.UNKNOWN
     assert source_file.target_file_name() is None
     assert source_file.target_file_path() is None
+
+
+def test_files_share_the_run_config():
+    config = RunConfig(images_output_path=os.path.join("output", "images"), dir_format="%Y" + os.sep + "%m")
+    exif_data = {'MIMEType': 'image/jpeg', 'CreateDate': '2017:01:01 01:01:01'}
+    first = SourceFile(os.path.join("input", "first.jpg"), exif_data=dict(exif_data), config=config)
+    second = SourceFile(os.path.join("input", "second.jpg"), exif_data=dict(exif_data), config=config)
+    assert not hasattr(first, '__dict__')
+    assert first.config is second.config
+    # one output directory string for all the files of a date
+    assert first.output_path is second.output_path
+    assert second.target_file_path() == os.path.join("output", "images", "2017", "01", "20170101-010101.jpg")
+
+
+def test_file_name_keeps_subseconds_and_offset():
+    # the name of the baseline, a library sorted before must keep matching
+    source_file = SourceFile(os.path.join("input", "IMG_0001.HEIC"), images_output_path=os.path.join("output", "images"),
+                             exif_data={'MIMEType': 'image/heic', 'SubSecCreateDate': '2021:06:01 12:00:00.123+02:00'})
+    assert source_file.target_file_name() == '20210601-120000.123+02:00.heic'
+    assert source_file.target_file_path() == os.path.join("output", "images", "2021", "06", "01",
+                                                          '20210601-120000.123+02:00.heic')
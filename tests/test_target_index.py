@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+import os
+import shutil
+
+from src.target_index import TargetIndex, suffixed
+
+os.chdir(os.path.dirname(__file__))
+
+
+def write(path, data=b''):
+    with open(path, 'wb') as file:
+        file.write(data)
+
+
+def setup_function():
+    shutil.rmtree('targets', ignore_errors=True)
+    os.mkdir('targets')
+
+
+def teardown_function():
+    shutil.rmtree('targets', ignore_errors=True)
+
+
+def test_suffixed():
+    assert suffixed(os.path.join('targets', 'a.jpg'), 0) == os.path.join('targets', 'a.jpg')
+    assert suffixed(os.path.join('targets', 'a.jpg'), 12) == os.path.join('targets', 'a-012.jpg')
+
+
+def test_free_suffix_and_candidates():
+    write('targets/a.jpg', b'1')
+    write('targets/a-001.jpg', b'22')
+    write('targets/a-002.jpg', b'3')
+    write('targets/a-004.jpg', b'3')
+    index = TargetIndex()
+    target = os.path.join('targets', 'a.jpg')
+    assert index.exists(target)
+    assert index.free(target) == (3, os.path.join('targets', 'a-003.jpg'))
+    assert index.candidates(target, 1) == [(0, target), (2, os.path.join('targets', 'a-002.jpg'))]
+    assert index.candidates(target, 5) == []
+    assert not index.exists(os.path.join('targets', 'b.jpg'))
+
+
+def test_directory_is_listed_once(mocker):
+    write('targets/a.jpg')
+    index = TargetIndex()
+    mocker.spy(os, 'scandir')
+    for name in ('a.jpg', 'b.jpg', 'c.jpg'):
+        index.free(os.path.join('targets', name))
+    assert os.scandir.call_count == 1
+
+
+def test_added_files_are_allocated():
+    index = TargetIndex()
+    target = os.path.join('targets', 'day', 'a.jpg')
+    assert index.free(target) == (0, target)
+    index.makedirs(os.path.join('targets', 'day'))
+    index.add(target, 3)
+    assert index.free(target) == (1, os.path.join('targets', 'day', 'a-001.jpg'))
+    index.add(os.path.join('targets', 'day', 'a-001.jpg'), 3)
+    # a file placed under a suffixed name by another chain is skipped as well
+    index.add(os.path.join('targets', 'day', 'a-002.jpg'), 4)
+    assert index.free(target) == (3, os.path.join('targets', 'day', 'a-003.jpg'))
+    assert [suffix for suffix, path in index.candidates(target, 3)] == [0, 1]
+    assert os.path.isdir(os.path.join('targets', 'day'))
+
+
+def test_planned_targets_keep_their_source():
+    index = TargetIndex()
+    target = os.path.join('targets', 'a.jpg')
+    index.add(target, 3, planned_source='input/a.jpg')
+    index.add(os.path.join('targets', 'b.jpg'), 3)
+    assert index.planned_source(target) == 'input/a.jpg'
+    assert index.planned_source(os.path.join('targets', 'b.jpg')) is None
+    assert index.candidates(target, 3) == [(0, target)]
+    assert index.free(target) == (1, os.path.join('targets', 'a-001.jpg'))
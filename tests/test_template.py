@@ -0,0 +1,39 @@
+#!/usr/bin/env python3
+from datetime import datetime, timedelta, timezone
+
+from src.template import PathTemplate
+
+
+def test_directory_is_cached_per_day():
+    template = PathTemplate('%Y/%m/%d', day=True)
+    assert template.render(datetime(2017, 1, 1, 1, 1, 1)) == '2017/01/01'
+    assert template.render(datetime(2017, 1, 1, 23, 59, 59)) == '2017/01/01'
+    assert template.render(datetime(2017, 1, 2)) == '2017/01/02'
+    assert len(template._cache) == 2
+
+
+def test_file_name_is_cached_per_second():
+    template = PathTemplate('%Y%m%d-%H%M%S', lower=True)
+    assert template.render(datetime(2017, 1, 1, 1, 1, 1, 100)) == '20170101-010101'
+    assert template.render(datetime(2017, 1, 1, 1, 1, 1, 900)) == '20170101-010101'
+    assert len(template._cache) == 1
+    assert PathTemplate('%H%M%S.%f').render(datetime(2017, 1, 1, 1, 1, 1, 900)) == '010101.000900'
+
+
+def test_time_zones_are_not_mixed_up():
+    template = PathTemplate('%H%M%S%z')
+    utc = datetime(2017, 1, 1, 12, 0, 0, tzinfo=timezone.utc)
+    assert template.render(utc) == '120000+0000'
+    assert template.render(utc.astimezone(timezone(timedelta(hours=2)))) == '140000+0200'
+
+
+def test_stem_field():
+    template = PathTemplate('%Y%m%d-{stem}', lower=True)
+    assert template.render(datetime(2017, 1, 1), 'input/IMG_1234.JPG') == '20170101-img_1234'
+    assert template.render(datetime(2017, 1, 1), 'input/IMG_1235.JPG') == '20170101-img_1235'
+    assert PathTemplate('{stem}/%Y').render(datetime(2017, 1, 1), 'DSC_1.nef') == 'DSC_1/2017'
+    assert PathTemplate('{other}').render(datetime(2017, 1, 1), 'DSC_1.nef') == '{other}'
+
+
+def test_unformattable_date():
+    assert PathTemplate('%Y').render(None) is None
@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+import os
+import time
+
+import pytest
+
+from src.throttle import IoThrottle, TokenBucket, parse_rate
+
+
+def test_parse_rate():
+    assert parse_rate('500') == 500
+    assert parse_rate('1.5K') == 1536
+    assert parse_rate('20M') == 20 * 1024 * 1024
+    assert parse_rate('1gb') == 1024 ** 3
+    assert parse_rate('0') == 0
+    with pytest.raises(ValueError):
+        parse_rate('fast')
+
+
+def test_unlimited_bucket_does_not_wait(mocker):
+    sleep = mocker.patch('src.throttle.time.sleep')
+    bucket = TokenBucket()
+    for _ in range(1000):
+        bucket.take(1024 * 1024)
+    sleep.assert_not_called()
+
+
+def test_bucket_waits_for_the_debt_of_a_large_take(mocker):
+    sleep = mocker.patch('src.throttle.time.sleep')
+    bucket = TokenBucket(rate=100)
+    bucket.take(300)
+    # the bucket starts empty, 300 tokens at 100 per second are paid back in 3 seconds
+    assert sleep.call_args[0][0] == pytest.approx(3, abs=0.05)
+
+
+def test_bucket_keeps_the_rate():
+    bucket = TokenBucket(rate=1000)
+    start = time.monotonic()
+    for _ in range(5):
+        bucket.take(50)
+    assert time.monotonic() - start == pytest.approx(0.25, abs=0.1)
+
+
+def test_throttle_reads_limits_from_control_file(tmp_path):
+    control_file = str(tmp_path / 'phockup.throttle')
+    with open(control_file, 'w') as file:
+        file.write('# limits\nbytes_per_second=2M\nfiles_per_second = 10\nunknown=1\n')
+    throttle = IoThrottle()
+    throttle.configure(bytes_per_second=1024, control_file=control_file)
+    assert throttle.bytes.rate == 2 * 1024 * 1024
+    assert throttle.files.rate == 10
+    assert throttle.chunk_size(1024 ** 3) == 4 * 1024 * 1024
+
+    with open(control_file, 'w') as file:
+        file.write('files_per_second=0\n')
+    stat = os.stat(control_file)
+    os.utime(control_file, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    throttle.reload()
+    assert throttle.files.rate == 0
+    assert throttle.bytes.rate == 2 * 1024 * 1024
+
+
+def test_unlimited_throttle_keeps_chunk_size():
+    throttle = IoThrottle()
+    assert not throttle.limited
+    assert throttle.chunk_size(1024 ** 3) == 1024 ** 3
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+import os
+import shutil
+import time
+
+import pytest
+
+from src.phockup import ignored_files, ignored_folders
+from src.watch import InotifyWatcher, PollingWatcher, Watcher, create_watcher
+
+os.chdir(os.path.dirname(__file__))
+
+IGNORED = {'ignored_files': ignored_files, 'ignored_folders': ignored_folders}
+
+
+def setup_function():
+    shutil.rmtree('watch', ignore_errors=True)
+    os.makedirs('watch/inbox')
+
+
+def teardown_function():
+    shutil.rmtree('watch', ignore_errors=True)
+
+
+def write(file_path, content):
+    with open(file_path, 'a') as file:
+        file.write(content)
+
+
+def wait_ready(watcher, timeout=5.0) -> list:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        ready = watcher.ready(timeout=0.05)
+        if ready:
+            return ready
+    return []
+
+
+def watchers():
+    params = [pytest.param(lambda root: PollingWatcher(root, settle=0.2, interval=0.05, **IGNORED), id='polling')]
+    if InotifyWatcher.libc() is not None:
+        params.append(pytest.param(lambda root: InotifyWatcher(root, settle=0.2, **IGNORED), id='inotify'))
+    return params
+
+
+@pytest.mark.parametrize('make_watcher', watchers())
+def test_existing_and_new_files_are_ready(make_watcher):
+    write('watch/existing.jpg', 'existing')
+    watcher = make_watcher('watch')
+    try:
+        assert wait_ready(watcher) == ['watch/existing.jpg']
+        write('watch/inbox/new.jpg', 'new')
+        assert wait_ready(watcher) == ['watch/inbox/new.jpg']
+        assert wait_ready(watcher, timeout=0.5) == []
+    finally:
+        watcher.close()
+
+
+@pytest.mark.parametrize('make_watcher', watchers())
+def test_file_is_ready_once_it_is_complete(make_watcher):
+    watcher = make_watcher('watch')
+    try:
+        for _ in range(4):
+            write('watch/inbox/growing.mp4', 'chunk')
+            assert watcher.ready(timeout=0.1) == []
+        written = time.monotonic()
+        assert wait_ready(watcher) == ['watch/inbox/growing.mp4']
+        assert time.monotonic() - written >= 0.2
+    finally:
+        watcher.close()
+
+
+@pytest.mark.parametrize('make_watcher', watchers())
+def test_processed_files_are_not_reported_again(make_watcher):
+    write('watch/photo.jpg', 'photo')
+    os.makedirs('watch/.@__thumb')
+    write('watch/.@__thumb/photo.jpg', 'thumbnail')
+    write('watch/Thumbs.db', 'thumbnails')
+    watcher = make_watcher('watch')
+    try:
+        assert wait_ready(watcher) == ['watch/photo.jpg']
+        # e.g. the date was written back while processing it
+        write('watch/photo.jpg', ' with date')
+        watcher.mark_known(['watch/photo.jpg'])
+        assert wait_ready(watcher, timeout=0.5) == []
+    finally:
+        watcher.close()
+
+
+def test_new_directories_are_watched():
+    if InotifyWatcher.libc() is None:
+        pytest.skip('inotify is not available')
+    watcher = InotifyWatcher('watch', settle=0.1)
+    try:
+        os.makedirs('watch/inbox/day1/day2')
+        write('watch/inbox/day1/day2/photo.jpg', 'photo')
+        assert wait_ready(watcher) == ['watch/inbox/day1/day2/photo.jpg']
+    finally:
+        watcher.close()
+
+
+def test_output_inside_input_is_excluded():
+    os.makedirs('watch/sorted')
+    write('watch/sorted/placed.jpg', 'placed')
+    write('watch/inbox/new.jpg', 'new')
+    watcher = create_watcher('watch', settle=0.1, poll_interval=0.05, excluded=('watch/sorted',))
+    assert watcher.name == 'polling'
+    assert wait_ready(watcher) == ['watch/inbox/new.jpg']
+
+
+def test_watcher_needs_a_backend():
+    with pytest.raises(TypeError):
+        Watcher('watch')